@@ -1,10 +1,9 @@
 import argparse
 import numpy as np
-import json
 from os import path
 from AIDojoCoordinator.game_components import Action, Observation, GameState
 from NetSecGameAgents.agents.base_agent import BaseAgent
-from NetSecGameAgents.agents.agent_utils import generate_valid_actions
+from NetSecGameAgents.agents.action_list_utils import ActionCatalog
 
 
 class ActionListAgent(BaseAgent):
@@ -16,54 +15,66 @@ class ActionListAgent(BaseAgent):
     Compatible with the WhiteBoxNSGCoordinator.
     """
 
-    def __init__(self, host, port, role: str):
+    def __init__(self, host, port, role: str, action_cache_dir: str = None):
         super().__init__(host, port, role)
-        self._action_list = []
-        self._action_to_idx = {}
+        # folder with cached action catalogs, None disables the caching
+        self._action_cache_dir = action_cache_dir
+        self._catalog = None
+        self._mask_engine = None
 
     def register(self) -> Observation:
         """
-        Register the agent with the game environment. Parse the action list in the response.
+        Register the agent with the game environment. Parse the action list in the response
+        into a compact ActionCatalog (or load it from the cache if the same list was seen before).
         """
         obs = super().register()
         if isinstance(obs.info, dict) and 'all_actions' in obs.info.keys():
-            data = json.loads(obs.info['all_actions'])
-            self._action_list = [Action.from_dict(action_dict) for action_dict in data]
-            self._action_to_idx = {action:idx for idx, action in enumerate(self._action_list)}
+            self._catalog = ActionCatalog.load_or_parse(obs.info['all_actions'], self._action_cache_dir)
+            self._logger.info(f"Action catalog with {len(self._catalog)} actions (topology hash {self._catalog.topology_hash})")
+            if self._catalog.num_raw_actions:
+                self._logger.warning(f"{self._catalog.num_raw_actions} actions have types or parameters not modelled by the catalog, they are never valid in the action mask")
+            # precompute the parameter indices of all actions for the valid action mask
+            self._mask_engine = self._catalog.mask_engine()
         else:
             raise KeyError("Expected key 'all_actions' in the Observation info after registration.")
         return obs
     
+    @property
+    def num_actions(self) -> int:
+        """
+        Number of actions in the action list.
+        """
+        return len(self._catalog) if self._catalog else 0
+
     def action_space(self) -> list:
         """
         Return the list of all actions available to the agent.
+        All actions are materialized, prefer get_action() for large action lists.
         """
-        return self._action_list
+        return self._catalog.actions() if self._catalog else []
 
     def get_action_index(self, action: Action) -> int:
         """
-        Get the index of an action in the action list.
+        Get the index of an action in the action list, -1 if it is not in the list.
         """
-        return self._action_to_idx.get(action, -1)
+        return self._catalog.index_of(action) if self._catalog else -1
     
     def get_action(self, action_index: int) -> Action:
         """
         Get the action by its index in the action list.
         """
-        if 0 <= action_index < len(self._action_list):
-            return self._action_list[action_index]
-        else:
-            raise IndexError("Action index out of range.")
+        if not self._catalog:
+            raise IndexError("Action index out of range, the action list is empty (the agent is not registered).")
+        return self._catalog.action(action_index)
     
     def get_valid_action_mask(self , state: GameState) -> np.ndarray:
         """
-        Get the action vector, which is a list of all actions.
+        Get the boolean mask over the action list with True for actions valid in the state.
+        Uses the same rules as generate_valid_actions(state, include_blocks=False).
         """
-        mask = np.zeros(len(self._action_list), dtype=bool)
-        for valid_action in generate_valid_actions(state, include_blocks=False):
-            if valid_action in self._action_to_idx:
-                mask[self._action_to_idx[valid_action]] = True
-        return mask
+        if self._mask_engine is None:
+            return np.zeros(0, dtype=bool)
+        return self._mask_engine.valid_action_mask(state)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -74,5 +85,5 @@ if __name__ == "__main__":
     log_filename = path.dirname(path.abspath(__file__)) + '/action_List_base_agent.log'
     agent = ActionListAgent(args.host, args.port, "Attacker")
     observation = agent.register()
-    print(f"Total actions: {len(agent._action_list)}")
+    print(f"Total actions: {agent.num_actions}")
     print(f"Valid action mask: {agent.get_valid_action_mask(observation.state)}")
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Collection of functions and classes which are intended for agents working with the
+complete list of actions provided by the WhiteBoxNSGCoordinator (see ActionListAgent).
+"""
+import hashlib
+import json
+import numpy as np
+from os import path, makedirs
+from AIDojoCoordinator.game_components import Action, ActionType, GameState
+
+# Order of the action types in the type codes
+ACTION_TYPES = [
+    ActionType.ScanNetwork,
+    ActionType.FindServices,
+    ActionType.ExploitService,
+    ActionType.FindData,
+    ActionType.ExfiltrateData,
+    ActionType.BlockIP,
+]
+TYPE_CODES = {action_type:code for code, action_type in enumerate(ACTION_TYPES)}
+
+# Columns of the parameter matrix. Unused parameters are -1.
+SRC, TRG, NET, SVC, DATA, BLOCKED = range(6)
+NUM_PARAMS = 6
+
+
+class ActionMaskEngine:
+    """
+    Computes the valid action mask of a fixed action list without building any Action objects.
+
+    For every action, the indices of its parameters (source host, target host, network,
+    (host, service) pair and (host, data) pair) are precomputed once. For each state, only
+    small indicator arrays over the known elements are built and the mask is obtained with
+    NumPy indexing over the whole action list.
+
+    The validity rules are the same as in agent_utils.generate_valid_actions(state, include_blocks=False).
+    """
+
+    def __init__(self, type_codes:np.ndarray, params:np.ndarray, hosts:list, networks:list, services:list, data:list) -> None:
+        """
+        Args:
+            type_codes: [num_actions] int8 index of the action type in ACTION_TYPES (-1 for other types)
+            params: [num_actions x NUM_PARAMS] int32 parameter indices, columns SRC, TRG, NET, SVC, DATA, BLOCKED
+            hosts: IPs indexed by SRC, TRG and BLOCKED columns
+            networks: Networks indexed by NET column
+            services: (IP, Service) pairs indexed by SVC column
+            data: (IP, Data) pairs indexed by DATA column
+        """
+        self._type_codes = np.asarray(type_codes, dtype=np.int8)
+        self._params = np.asarray(params, dtype=np.int32).reshape(-1, NUM_PARAMS)
+        self._host_idx = {host:idx for idx, host in enumerate(hosts)}
+        self._net_idx = {net:idx for idx, net in enumerate(networks)}
+        self._svc_idx = {pair:idx for idx, pair in enumerate(services)}
+        self._data_idx = {pair:idx for idx, pair in enumerate(data)}
+        # positions of actions of each type, computed once
+        self._by_type = {action_type:np.flatnonzero(self._type_codes == code) for action_type, code in TYPE_CODES.items()}
+
+    @classmethod
+    def from_actions(cls, actions:list) -> "ActionMaskEngine":
+        """Builds the engine from a list of Action objects"""
+        hosts, networks, services, data = {}, {}, {}, {}
+        type_codes = np.full(len(actions), -1, dtype=np.int8)
+        params = np.full([len(actions), NUM_PARAMS], -1, dtype=np.int32)
+
+        def index_of(vocabulary:dict, key) -> int:
+            return vocabulary.setdefault(key, len(vocabulary))
+
+        for i, action in enumerate(actions):
+            type_codes[i] = TYPE_CODES.get(action.type, -1)
+            parameters = action.parameters
+            if "source_host" in parameters:
+                params[i, SRC] = index_of(hosts, parameters["source_host"])
+            if "target_host" in parameters:
+                params[i, TRG] = index_of(hosts, parameters["target_host"])
+            if "target_network" in parameters:
+                params[i, NET] = index_of(networks, parameters["target_network"])
+            if "target_service" in parameters:
+                params[i, SVC] = index_of(services, (parameters["target_host"], parameters["target_service"]))
+            if "data" in parameters:
+                params[i, DATA] = index_of(data, (parameters["source_host"], parameters["data"]))
+            if "blocked_host" in parameters:
+                params[i, BLOCKED] = index_of(hosts, parameters["blocked_host"])
+        return cls(type_codes, params, list(hosts), list(networks), list(services), list(data))
+
+    def _indicator(self, index:dict, elements) -> np.ndarray:
+        """Boolean array over the index with True for every element present in the state"""
+        indicator = np.zeros(len(index) + 1, dtype=bool)
+        positions = [index[element] for element in elements if element in index]
+        indicator[positions] = True
+        # the extra last item is always False and is hit by the -1 (unused) parameters
+        return indicator
+
+    def valid_action_mask(self, state:GameState) -> np.ndarray:
+        """Boolean mask over the action list with True for the actions valid in the state"""
+        num_hosts = len(self._host_idx)
+        controlled = self._indicator(self._host_idx, state.controlled_hosts)
+        known = self._indicator(self._host_idx, state.known_hosts)
+        known_nets = self._indicator(self._net_idx, state.known_networks)
+        known_services = self._indicator(self._svc_idx, ((host, service) for host, services in state.known_services.items() for service in services))
+        known_data = self._indicator(self._data_idx, ((host, datapoint) for host, data in state.known_data.items() for datapoint in data))
+
+        # firewall blocks as pair codes src * (num_hosts + 1) + dst
+        blocked_pairs = np.array([self._host_idx[src] * (num_hosts + 1) + self._host_idx[dst]
+                                  for src, dsts in state.known_blocks.items() if src in self._host_idx
+                                  for dst in dsts if dst in self._host_idx], dtype=np.int64)
+
+        def not_blocked(src:np.ndarray, dst:np.ndarray) -> np.ndarray:
+            if len(blocked_pairs) == 0:
+                return np.ones(len(src), dtype=bool)
+            return ~np.isin(src.astype(np.int64) * (num_hosts + 1) + dst, blocked_pairs)
+
+        mask = np.zeros(len(self._type_codes), dtype=bool)
+        if not controlled.any():
+            return mask
+        params = self._params
+
+        idx = self._by_type[ActionType.ScanNetwork]
+        mask[idx] = controlled[params[idx, SRC]] & known_nets[params[idx, NET]]
+
+        idx = self._by_type[ActionType.FindServices]
+        src, trg = params[idx, SRC], params[idx, TRG]
+        mask[idx] = controlled[src] & known[trg] & not_blocked(src, trg)
+
+        idx = self._by_type[ActionType.ExploitService]
+        src, trg = params[idx, SRC], params[idx, TRG]
+        mask[idx] = controlled[src] & known_services[params[idx, SVC]] & not_blocked(src, trg)
+
+        # FindData is generated with source == target, valid if at least one controlled host is not blocked from the target
+        idx = self._by_type[ActionType.FindData]
+        src, trg = params[idx, SRC], params[idx, TRG]
+        reachable = np.ones(num_hosts + 1, dtype=bool)
+        if len(blocked_pairs):
+            controlled_hosts = np.flatnonzero(controlled)
+            all_pairs = (controlled_hosts[:, None] * (num_hosts + 1) + np.arange(num_hosts + 1)[None, :])
+            reachable = ~np.isin(all_pairs, blocked_pairs).all(axis=0)
+        mask[idx] = (src == trg) & controlled[trg] & reachable[trg]
+
+        idx = self._by_type[ActionType.ExfiltrateData]
+        src, trg = params[idx, SRC], params[idx, TRG]
+        mask[idx] = known_data[params[idx, DATA]] & controlled[trg] & (src != trg) & not_blocked(src, trg)
+        return mask
+
+
+# Parameters of the actions in the catalog and the columns they are stored in
+PARAM_COLUMNS = {
+    "source_host": SRC,
+    "target_host": TRG,
+    "target_network": NET,
+    "target_service": SVC,
+    "data": DATA,
+    "blocked_host": BLOCKED,
+}
+HOST_PARAMS = ("source_host", "target_host", "blocked_host")
+# Vocabulary used by each column
+COLUMN_VOCABULARY = {SRC:"hosts", TRG:"hosts", BLOCKED:"hosts", NET:"networks", SVC:"services", DATA:"data"}
+
+
+class ActionCatalog:
+    """
+    Compact columnar representation of the complete action list.
+
+    Actions are stored as an int8 array of action type codes and an int32 matrix of parameter
+    indices into small vocabularies of hosts, networks, (host, service) and (host, data) pairs.
+    The catalog is built directly from the JSON action list, only one Action.from_dict() per
+    vocabulary element is used to obtain the parameter objects. Action objects are materialized
+    on demand in action() and cached.
+
+    Actions of types or with parameters the columns do not model (e.g. a newer coordinator)
+    keep their dicts, have type code -1 and are materialized with Action.from_dict(). They are
+    never valid in the mask of mask_engine().
+
+    The catalog can be stored to and loaded from a cache file keyed by the hash of the action list
+    (see load_or_parse()), so reconnecting to the same topology skips the parsing.
+    """
+
+    def __init__(self, type_codes:np.ndarray, params:np.ndarray, vocabularies:dict, topology_hash:str=None, raw_actions:dict=None) -> None:
+        """
+        Args:
+            type_codes: [num_actions] int8 index of the action type in ACTION_TYPES
+            params: [num_actions x NUM_PARAMS] int32 parameter indices (-1 for unused)
+            vocabularies: for each of 'hosts', 'networks', 'services' and 'data' a list of
+                [action type string, parameter name, parameter dict, host index] describing the element.
+                The host index is the position of the host of the service/data (-1 for hosts and networks).
+            topology_hash: hash of the action list the catalog was built from
+            raw_actions: action index -> action dict of the actions with type code -1
+        """
+        self.type_codes = np.asarray(type_codes, dtype=np.int8)
+        self.params = np.asarray(params, dtype=np.int32).reshape(-1, NUM_PARAMS)
+        self.topology_hash = topology_hash
+        self._vocabularies = vocabularies
+        self._raw_actions = raw_actions or {}
+        self._objects = {}
+        for name in ("hosts", "networks", "services", "data"):
+            objects = [self._materialize_parameter(action_type, param, value) for action_type, param, value, _ in vocabularies[name]]
+            if name in ("services", "data"):
+                # services and data are always paired with their host
+                objects = [(self._objects["hosts"][entry[3]], obj) for entry, obj in zip(vocabularies[name], objects)]
+            self._objects[name] = objects
+        self._object_idx = {name:{obj:idx for idx, obj in enumerate(objects)} for name, objects in self._objects.items()}
+        self._actions = {}
+        # (type code, parameter row bytes) -> action index, built on the first index_of()
+        self._row_idx = None
+        # Action -> index of the raw actions, built on the first index_of() of an action outside the columns
+        self._raw_idx = None
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    @property
+    def num_raw_actions(self) -> int:
+        """Number of actions which are not modelled by the columns (see the class docstring)"""
+        return len(self._raw_actions)
+
+    @staticmethod
+    def topology_hash_of(all_actions:str) -> str:
+        """Hash of the JSON action list, used as the key of the cache files"""
+        return hashlib.sha256(all_actions.encode()).hexdigest()
+
+    @staticmethod
+    def _materialize_parameter(action_type:str, name:str, value:dict):
+        return Action.from_dict({"action_type":action_type, "parameters":{name:value}}).parameters[name]
+
+    @classmethod
+    def from_dicts(cls, action_dicts:list, topology_hash:str=None) -> "ActionCatalog":
+        """Builds the catalog from the list of action dicts (as sent by the coordinator)"""
+        vocabularies = {"hosts":{}, "networks":{}, "services":{}, "data":{}}
+        type_by_name = {str(action_type):code for action_type, code in TYPE_CODES.items()}
+        type_codes = np.empty(len(action_dicts), dtype=np.int8)
+        params = np.full([len(action_dicts), NUM_PARAMS], -1, dtype=np.int32)
+
+        def index_of(vocabulary:str, key, action_type:str, name:str, value:dict, host:int=-1) -> int:
+            entries = vocabularies[vocabulary]
+            if key not in entries:
+                entries[key] = (len(entries), [action_type, name, value, host])
+            return entries[key][0]
+
+        raw_actions = {}
+        for i, action_dict in enumerate(action_dicts):
+            action_type = action_dict["action_type"]
+            parameters = action_dict["parameters"]
+            if action_type not in type_by_name or not set(parameters) <= set(PARAM_COLUMNS):
+                type_codes[i] = -1
+                raw_actions[i] = action_dict
+                continue
+            type_codes[i] = type_by_name[action_type]
+            # hosts first, services and data are keyed by their host
+            for name in HOST_PARAMS:
+                if name in parameters:
+                    value = parameters[name]
+                    params[i, PARAM_COLUMNS[name]] = index_of("hosts", tuple(sorted(value.items())), action_type, name, value)
+            if "target_network" in parameters:
+                value = parameters["target_network"]
+                params[i, NET] = index_of("networks", tuple(sorted(value.items())), action_type, "target_network", value)
+            if "target_service" in parameters:
+                value, host = parameters["target_service"], int(params[i, TRG])
+                params[i, SVC] = index_of("services", (host, tuple(sorted(value.items()))), action_type, "target_service", value, host)
+            if "data" in parameters:
+                value, host = parameters["data"], int(params[i, SRC])
+                params[i, DATA] = index_of("data", (host, tuple(sorted(value.items()))), action_type, "data", value, host)
+
+        return cls(type_codes, params, {name:[entry for _, entry in entries.values()] for name, entries in vocabularies.items()}, topology_hash, raw_actions)
+
+    def action(self, index:int) -> Action:
+        """Materializes the Action with the given index"""
+        if not 0 <= index < len(self.type_codes):
+            raise IndexError("Action index out of range.")
+        if index not in self._actions and index in self._raw_actions:
+            self._actions[index] = Action.from_dict(self._raw_actions[index])
+        if index not in self._actions:
+            row = self.params[index]
+            parameters = {}
+            for name, column in PARAM_COLUMNS.items():
+                if row[column] >= 0:
+                    obj = self._objects[COLUMN_VOCABULARY[column]][row[column]]
+                    parameters[name] = obj[1] if column in (SVC, DATA) else obj
+            self._actions[index] = Action(ACTION_TYPES[self.type_codes[index]], parameters=parameters)
+        return self._actions[index]
+
+    def actions(self) -> list:
+        """Materializes all actions. Expensive for large action lists."""
+        return [self.action(i) for i in range(len(self))]
+
+    def index_of(self, action:Action) -> int:
+        """Index of the action in the catalog, -1 if the action is not in the catalog"""
+        parameters = action.parameters
+        if action.type not in TYPE_CODES or not set(parameters) <= set(PARAM_COLUMNS):
+            if self._raw_idx is None:
+                self._raw_idx = {}
+                for index in sorted(self._raw_actions):
+                    self._raw_idx.setdefault(self.action(index), index)
+            return self._raw_idx.get(action, -1)
+        row = np.full(NUM_PARAMS, -1, dtype=np.int32)
+        for name, value in parameters.items():
+            column = PARAM_COLUMNS[name]
+            if column == SVC:
+                value = (parameters.get("target_host"), value)
+            elif column == DATA:
+                value = (parameters.get("source_host"), value)
+            row[column] = self._object_idx[COLUMN_VOCABULARY[column]].get(value, -1)
+            if row[column] < 0:
+                return -1
+        if self._row_idx is None:
+            self._row_idx = {}
+            for index, (type_code, params) in enumerate(zip(self.type_codes.tolist(), self.params)):
+                self._row_idx.setdefault((type_code, params.tobytes()), index)
+        return self._row_idx.get((TYPE_CODES[action.type], row.tobytes()), -1)
+
+    def mask_engine(self) -> ActionMaskEngine:
+        """Creates the ActionMaskEngine of the catalog"""
+        return ActionMaskEngine(self.type_codes, self.params, self._objects["hosts"], self._objects["networks"], self._objects["services"], self._objects["data"])
+
+    def save(self, filename:str) -> None:
+        """Stores the catalog in a .npz file"""
+        np.savez_compressed(filename, type_codes=self.type_codes, params=self.params,
+                            vocabularies=np.array(json.dumps(self._vocabularies)), topology_hash=np.array(self.topology_hash or ""),
+                            raw_actions=np.array(json.dumps(self._raw_actions)))
+
+    @classmethod
+    def load(cls, filename:str) -> "ActionCatalog":
+        """Loads a catalog stored with save()"""
+        with np.load(filename) as data:
+            # JSON object keys are strings, the raw actions are keyed by the action index
+            raw_actions = {int(index):action_dict for index, action_dict in json.loads(str(data["raw_actions"])).items()} if "raw_actions" in data else {}
+            return cls(data["type_codes"], data["params"], json.loads(str(data["vocabularies"])), str(data["topology_hash"]) or None, raw_actions)
+
+    @classmethod
+    def load_or_parse(cls, all_actions:str, cache_dir:str=None) -> "ActionCatalog":
+        """
+        Returns the catalog of the JSON action list. If cache_dir is given, the catalog is loaded from
+        the cache file of the same action list when it exists, otherwise it is parsed and stored there.
+        """
+        topology_hash = cls.topology_hash_of(all_actions)
+        filename = path.join(cache_dir, f"action_catalog_{topology_hash}.npz") if cache_dir else None
+        if filename and path.exists(filename):
+            return cls.load(filename)
+        catalog = cls.from_dicts(json.loads(all_actions), topology_hash)
+        if filename:
+            makedirs(cache_dir, exist_ok=True)
+            catalog.save(filename)
+        return catalog
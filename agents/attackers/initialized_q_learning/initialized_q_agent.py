@@ -18,8 +18,15 @@ from AIDojoCoordinator.game_components import Action, Observation, GameState, Ag
 sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__) ))))
 from base_agent import BaseAgent
 from agent_utils import generate_valid_actions, state_as_ordered_string
+from transition_model_utils import TransitionModel, action_type_code, progress_mask
+from collections import deque
 import json
 
+# Scale of the initial Q-values of the states after the first action: the transition probability
+# (or the count-weighted sum of probabilities) is multiplied by it, so the prior of the known
+# transitions outweighs the initial-action probabilities and the zero Q-values of unseen actions.
+INITIAL_Q_VALUE_SCALE = 5
+
 class InitializedQAgent(BaseAgent):
 
     def __init__(self, host, port, role="Attacker", alpha=0.1, gamma=0.6, epsilon_start=0.9, epsilon_end=0.1, epsilon_max_episodes=5000) -> None:
@@ -35,6 +42,9 @@ class InitializedQAgent(BaseAgent):
 
         # New attribute to store parsed solutions
         self.transition_probabilities = None
+        # Optional higher-order transition model, used instead of the transition probabilities
+        self.transition_model = None
+        self._action_history = deque(maxlen=1)
 
     def count_actions(self, observation):
         # Extract state from the observation
@@ -96,10 +106,32 @@ class InitializedQAgent(BaseAgent):
             print(f"Error loading or transforming JSON file: {e}")
             return None
 
+    def load_transition_model(self, file_path):
+        """
+        Load a transition model (.npz) fitted with markov_chain_agent/utils/solutions_to_matrix.py.
+        """
+        self.transition_model = TransitionModel.load(file_path)
+        self._action_history = deque(maxlen=max(self.transition_model.order, 1))
+        return self.transition_model
+
+    def initialize_q_value_from_model(self, action_counts, action_type):
+        """
+        Initialize the Q-value with the probability of the action type given the last action types
+        of the episode and the action types which already changed the state (estimated by count_actions),
+        scaled by INITIAL_Q_VALUE_SCALE after the first action as in initialize_q_value.
+        """
+        mask = progress_mask(action_type_code(action) for action, count in action_counts.items() if count > 0)
+        probability = self.transition_model.probabilities(self._action_history, mask)[action_type_code(action_type)]
+        # same scale as the prior of the transition probabilities
+        return probability if not self._action_history and mask == 0 else probability * INITIAL_Q_VALUE_SCALE
+
     def initialize_q_value(self, action_counts, action_type):
         """
         Initialize the Q-value based on previous actions and transition probabilities.
+        The count-weighted sum of the transition probabilities is scaled by INITIAL_Q_VALUE_SCALE.
         """
+        if self.transition_model is not None:
+            return self.initialize_q_value_from_model(action_counts, action_type)
         action_type_str = str(action_type).split('.')[-1] 
 
         #print(f"Initializing Q-value for action type {action_type_str} with action counts: {action_counts}")
@@ -116,7 +148,7 @@ class InitializedQAgent(BaseAgent):
         )
        
             
-        return prob_sum * 5
+        return prob_sum * INITIAL_Q_VALUE_SCALE
 
     def store_q_table(self, filename):
         with open(filename, "wb") as f:
@@ -216,11 +248,13 @@ class InitializedQAgent(BaseAgent):
 
         num_steps = 0
         current_solution = []
+        self._action_history.clear()
 
         while not observation.end:
             num_steps += 1
             action, state_id = self.select_action(observation, testing)
             current_solution.append([action, None])
+            self._action_history.append(action_type_code(action.type))
 
             if args.store_actions:
                 actions_logger.info(f"\tState:{observation.state}")
@@ -269,6 +303,7 @@ if __name__ == '__main__':
     parser.add_argument("--env_conf", help="Configuration file of the env. Only for logging purposes.", required=False, default='./env/netsecenv_conf.yaml', type=str)
     parser.add_argument("--early_stop_threshold", help="Threshold for win rate for testing. If the value goes over this threshold, the training is stopped. Defaults to 95 (mean 95%% perc)", required=False, default=95, type=float)
     parser.add_argument("--transition_path", help="Path where the transition matrix json file is located", required=False, default="./transition_probabilities.json", type=str)
+    parser.add_argument("--transition_model", help="Path of a higher-order transition model (.npz) used instead of the transition matrix", required=False, default=None, type=str)
 
     args = parser.parse_args()
 
@@ -346,7 +381,8 @@ if __name__ == '__main__':
                 "test_for": args.test_for,
                 "testing": args.testing,
                 "early_stop_threshold": args.early_stop_threshold,
-                "transition_path": args.transition_path
+                "transition_path": args.transition_path,
+                "transition_model": args.transition_model
             }
         )
         
@@ -395,6 +431,8 @@ if __name__ == '__main__':
             # Initialize transition probabilities
             file_path = args.transition_path
             transition_probabilities = agent.load_and_transform_json(file_path)
+            if args.transition_model:
+                agent.load_transition_model(args.transition_model)
 
             for episode in range(1, args.episodes + 1):
                 if not early_stop:
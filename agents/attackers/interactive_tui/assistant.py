@@ -1,12 +1,9 @@
+import asyncio
 import json
 import logging
 
-# from openai import OpenAI
-from openai import AsyncOpenAI
-from dotenv import dotenv_values
-
 import jinja2
-from tenacity import retry, stop_after_attempt
+from tenacity import retry, retry_if_exception, stop_after_attempt
 
 
 from AIDojoCoordinator.game_components import ActionType, Observation
@@ -14,6 +11,7 @@ from NetSecGameAgents.agents.llm_utils import (
     create_action_from_response,
     create_status_from_state,
 )
+from NetSecGameAgents.agents.llm_backends import create_client, messages_key
 
 
 local_services = ["can_attack_start_here"]
@@ -64,23 +62,68 @@ Action: """
 Q4 = """Provide the best next action in the correct JSON format. Action: """
 
 
-@retry(stop=stop_after_attempt(3))
+def _retryable(error: BaseException) -> bool:
+    """
+    Whether a failed query is retried: errors (not cancellation) before any part
+    of the response was passed to on_token.
+    """
+    return isinstance(error, Exception) and not getattr(error, "tokens_streamed", False)
+
+
+@retry(stop=stop_after_attempt(3), retry=retry_if_exception(_retryable))
 async def openai_query(
-    client: AsyncOpenAI,
+    client,
     msg_list: list,
     max_tokens: int = 60,
     model: str = "gpt-3.5-turbo",
     fmt={"type": "text"},
+    on_token=None,
 ):
-    """Send messages to OpenAI API and return the response."""
-    llm_response = await client.chat.completions.create(
-        model=model,
-        messages=msg_list,
-        max_tokens=max_tokens,
-        temperature=0.0,
-        response_format=fmt,
-    )
-    return llm_response.choices[0].message.content
+    """
+    Send messages to the LLM backend (async client, see llm_backends.py) and return the response.
+    With on_token, the response is streamed and on_token is called with every new piece of it.
+    A query failing after the first piece is not retried, the pieces would be passed to on_token again.
+    """
+    request = {
+        "model": model,
+        "messages": msg_list,
+        "max_tokens": max_tokens,
+        "temperature": 0.0,
+        "response_format": fmt,
+    }
+    if on_token is None:
+        llm_response = await client.chat.completions.create(**request)
+        return llm_response.choices[0].message.content
+
+    pieces = []
+    try:
+        async for chunk in await client.chat.completions.create(stream=True, **request):
+            if chunk.choices and chunk.choices[0].delta.content:
+                pieces.append(chunk.choices[0].delta.content)
+                on_token(pieces[-1])
+    except Exception as e:
+        if pieces:
+            e.tokens_streamed = True
+        raise
+    return "".join(pieces)
+
+
+class _TokenFanOut:
+    """on_token of a shared request: passes the streamed pieces to every waiter, late waiters get the pieces so far first"""
+
+    def __init__(self):
+        self.pieces = []
+        self.listeners = []
+
+    def add(self, on_token) -> None:
+        for piece in self.pieces:
+            on_token(piece)
+        self.listeners.append(on_token)
+
+    def __call__(self, piece: str) -> None:
+        self.pieces.append(piece)
+        for on_token in list(self.listeners):
+            on_token(piece)
 
 
 class LLMAssistant:
@@ -88,15 +131,14 @@ class LLMAssistant:
     An assistant that takes a state and returns an action to the user.
     """
 
-    def __init__(self, model_name: str, goal: str, memory_len: int = 10, api_url=None):
+    def __init__(self, model_name: str, goal: str, memory_len: int = 10, api_url=None, client=None):
         self.model = model_name
 
-        if "gpt" in self.model:
-            config = dotenv_values(".env")
-            self.client = AsyncOpenAI(api_key=config["OPENAI_API_KEY"])
-        else:
-            self.client = AsyncOpenAI(base_url=api_url, api_key="ollama")
+        # any async backend with the interface of the OpenAI client (see llm_backends.py)
+        self.client = client or create_client(self.model, api_url, async_client=True)
         self.memory_len = memory_len
+        # Requests in flight by state and memory with their token fan-out, the same suggestion is requested only once
+        self._in_flight = {}
         # self.memories = []
         self.logger = logging.getLogger("Interactive-TUI-agent")
         # Create the instructions from the template
@@ -141,12 +183,43 @@ class LLMAssistant:
         except:
             return llm_response, None
 
+    def cancel_pending(self) -> None:
+        """Cancel the requests in flight, e.g. when the state changed and their suggestions are outdated"""
+        for task, _ in list(self._in_flight.values()):
+            task.cancel()
+        self._in_flight.clear()
+
     async def get_action_from_obs_react(
-        self, observation: Observation, memory_buf: list
+        self, observation: Observation, memory_buf: list, on_token=None
     ) -> tuple:
         """
-        Use the ReAct architecture for the assistant
+        Use the ReAct architecture for the assistant.
+        Callers asking while the same state and memory are already being processed
+        wait for the request in flight instead of sending a new one. The request is streamed if its
+        first caller passed on_token, then every waiter with on_token gets all the streamed pieces.
+        Raises asyncio.CancelledError if the request is cancelled by cancel_pending().
         """
+        key = messages_key([observation.state.as_json(), self.create_mem_prompt(memory_buf), self.instructions])
+        if key in self._in_flight:
+            self.logger.info("The same suggestion is already requested, waiting for it")
+            task, fan_out = self._in_flight[key]
+        else:
+            fan_out = _TokenFanOut()
+            task = asyncio.ensure_future(self._get_action_from_obs_react(observation, memory_buf, fan_out if on_token else None))
+            self._in_flight[key] = (task, fan_out)
+            task.add_done_callback(lambda done: self._in_flight.pop(key) if self._in_flight.get(key, (None,))[0] is done else None)
+        if on_token is not None:
+            fan_out.add(on_token)
+        try:
+            # a waiter being cancelled does not cancel the request shared with the others
+            return await asyncio.shield(task)
+        finally:
+            if on_token is not None:
+                fan_out.listeners.remove(on_token)
+
+    async def _get_action_from_obs_react(
+        self, observation: Observation, memory_buf: list, on_token=None
+    ) -> tuple:
         #  Stage 1
         status_prompt = create_status_from_state(observation.state)
 
@@ -158,7 +231,7 @@ class LLMAssistant:
         self.logger.info(f"Text sent to the LLM: {messages}")
 
         response = await openai_query(
-            self.client, messages, max_tokens=1024, model=self.model
+            self.client, messages, max_tokens=1024, model=self.model, on_token=on_token
         )
         self.logger.info(f"(Stage 1) Response from LLM: {response}")
 
@@ -11,9 +11,11 @@ from textual.containers import Vertical, VerticalScroll, Horizontal
 from textual.validation import Function
 from textual import on
 from textual.reactive import reactive
+from rich.text import Text
 from NetSecGameAgents.agents.attackers.interactive_tui.assistant import LLMAssistant
 from AIDojoCoordinator.game_components import Network, IP, ActionType, Action, GameState, Observation, AgentStatus
 from NetSecGameAgents.agents.base_agent import BaseAgent
+from NetSecGameAgents.agents.llm_backends import BACKENDS, create_client, load_stub_responses
 log_filename = os.path.dirname(os.path.abspath(__file__)) + "/interactive_tui_agent.log"
 logging.basicConfig(
     filename=log_filename,
@@ -48,56 +50,89 @@ def is_valid_net(net_addr: str) -> bool:
         return False
 
 
+class LogStream:
+    """Writes a streamed LLM response to the log line by line, as the tokens arrive"""
+
+    def __init__(self, log: RichLog):
+        self.log = log
+        self._line = ""
+
+    def __call__(self, token: str) -> None:
+        *lines, self._line = (self._line + token).split("\n")
+        for line in lines:
+            self.log.write(Text(line, style="dim"))
+
+    def flush(self) -> None:
+        if self._line:
+            self.log.write(Text(self._line, style="dim"))
+        self._line = ""
+
+
 class TreeState(Widget):
     tree = reactive(Tree("State", classes="box"))
 
     def __init__(self, obs: Observation):
         super().__init__()
         self.init_obs = obs
-        # self.tree =
-
-    def _create_tree_from_obs(self, observation: Observation) -> Tree:
-        # tree: Tree[dict] = Tree("State", classes="box")
-        # tree = self.tree
+        # Nodes of the tree by element of the state, so a new state is applied
+        # as the difference from the previous one instead of rebuilding the tree
+        self._sections = {}
+        self._networks = {}
+        # host -> (section, node)
+        self._hosts = {}
+        # (host, "Services" or "Data") -> (node, {item: leaf})
+        self._details = {}
+
+    def _create_tree_from_obs(self, observation: Observation) -> None:
         self.tree.root.expand()
-        state = observation.state
-
-        contr_host_list = [host for host in state.controlled_hosts]
-        known_host_list = [
-            host for host in state.known_hosts if host not in contr_host_list
-        ]
-
-        networks = self.tree.root.add("Known Networks", expand=True)
-        for network in state.known_networks:
-            networks.add(str(network))
-
-        known_hosts = self.tree.root.add("Known Hosts", expand=True)
-        for host in known_host_list:
-            h = known_hosts.add(str(host))
-            for s_host in state.known_services:
-                if s_host == host:
-                    node = h.add("Services", expand=True)
-                    for service in state.known_services[s_host]:
-                        node.add_leaf(service.name)
-
-        owned_hosts = self.tree.root.add("Controlled Hosts", expand=True)
-        for host in contr_host_list:
-            h = owned_hosts.add(str(host))
-
-            # Add any services
-            for s_host in state.known_services:
-                if s_host == host:
-                    node = h.add("Services", expand=True)
-                    for service in state.known_services[s_host]:
-                        node.add_leaf(service.name)
-            # Add known data
-            for d_host in state.known_data:
-                if d_host == host:
-                    node = h.add("Data", expand=True)
-                    for datum in state.known_data[host]:
-                        node.add_leaf(f"{datum.owner} - {datum.id}")
-
-        # return tree
+        for section in ("Known Networks", "Known Hosts", "Controlled Hosts"):
+            self._sections[section] = self.tree.root.add(section, expand=True)
+        self.apply_state(observation.state)
+
+    def apply_state(self, state: GameState) -> None:
+        """Updates only the nodes of the elements which changed since the last state"""
+        networks = {str(network) for network in state.known_networks}
+        for network in self._networks.keys() - networks:
+            self._networks.pop(network).remove()
+        for network in networks - self._networks.keys():
+            self._networks[network] = self._sections["Known Networks"].add(network)
+
+        controlled_hosts = set(state.controlled_hosts)
+        hosts = {host: "Controlled Hosts" if host in controlled_hosts else "Known Hosts" for host in state.known_hosts}
+        hosts.update({host: "Controlled Hosts" for host in controlled_hosts})
+        for host, (section, node) in list(self._hosts.items()):
+            if hosts.get(host) != section:
+                # removed, or moved from the known to the controlled hosts
+                self._remove_host(host)
+        for host, section in hosts.items():
+            if host not in self._hosts:
+                self._hosts[host] = (section, self._sections[section].add(str(host), expand=True))
+            services = state.known_services.get(host)
+            self._update_details(host, "Services", None if services is None else {service: service.name for service in services})
+            # the data is shown only for the controlled hosts
+            data = state.known_data.get(host) if section == "Controlled Hosts" else None
+            self._update_details(host, "Data", None if data is None else {datum: f"{datum.owner} - {datum.id}" for datum in data})
+
+    def _update_details(self, host, title: str, items: dict) -> None:
+        node, leaves = self._details.get((host, title), (None, None))
+        if items is None:
+            if node is not None:
+                node.remove()
+                del self._details[host, title]
+            return
+        if node is None:
+            node, leaves = self._hosts[host][1].add(title, expand=True), {}
+            self._details[host, title] = (node, leaves)
+        for item in leaves.keys() - items.keys():
+            leaves.pop(item).remove()
+        for item in items.keys() - leaves.keys():
+            leaves[item] = node.add_leaf(items[item])
+
+    def _remove_host(self, host) -> None:
+        _, node = self._hosts.pop(host)
+        self._details.pop((host, "Services"), None)
+        self._details.pop((host, "Data"), None)
+        node.remove()
 
     def compose(self) -> ComposeResult:
         self._create_tree_from_obs(self.init_obs)
@@ -119,6 +154,8 @@ class InteractiveTUI(App):
         api_url: str,
         memory_len: int,
         max_repetitions: int,
+        llm_client=None,
+        stream: bool = False,
     ):
         super().__init__()
         self.returns = 0
@@ -140,18 +177,24 @@ class InteractiveTUI(App):
         self.repetitions = 1
         self.stop = False
         self.max_repetitions = max_repetitions
+        self._env_lock = asyncio.Lock()
 
         if llm != "None":
             self.model = llm
         else:
             self.model = None
 
+        # Show the reasoning of the assistant while it is generated
+        self.stream = stream
         if self.model is not None:
+            # One async client for all the requests of the session
+            self.llm_client = llm_client or create_client(self.model, api_url, async_client=True)
             self.assistant = LLMAssistant(
                 self.model,
                 self.current_obs.info["goal_description"],
                 memory_len,
                 api_url,
+                client=self.llm_client,
             )
 
     def compose(self) -> ComposeResult:
@@ -369,24 +412,18 @@ class InteractiveTUI(App):
             action = self.generate_action(self.current_obs.state)
 
             if action is not None:
-                self.update_state(action)
-
-                # Take the first node of TreeState which contains the tree
-                tree_state = self.query_one(TreeState)
-                tree = tree_state.children[0]
-                self.update_tree(tree)
+                # the environment is queried in a worker, the UI keeps handling events
+                self.run_worker(self.take_action(action), group="environment")
 
         elif event.button.id == "assist":
             if self.model is not None:
                 log.write("Waiting for the LLM...")
 
                 async def do_ask_llm():
-                    (
-                        act_str,
-                        action,
-                    ) = await self.assistant.get_action_from_obs_react(
-                        self.current_obs, self.memory_buf[-self.memory_len :]
-                    )
+                    result = await self.ask_assistant()
+                    if result is None:
+                        return
+                    act_str, action = result
 
                     if action is not None:
                         if action.type.name == "FindServices":
@@ -400,15 +437,16 @@ class InteractiveTUI(App):
                         msg = f"[bold red]:robot: Assistant proposed (invalid):[/bold red] {act_str}"
                         log.write(msg)
 
-                asyncio.create_task(do_ask_llm())
+                self.run_worker(do_ask_llm(), group="llm")
         else:
             if self.model is not None:
                 log.write(":hourglass: Waiting for the LLM...")
 
                 async def do_ask_llm():
-                    act_str, action = await self.assistant.get_action_from_obs_react(
-                        self.current_obs, self.memory_buf[-self.memory_len :]
-                    )
+                    result = await self.ask_assistant()
+                    if result is None:
+                        return
+                    act_str, action = result
 
                     if action is not None:
                         # To remove the discrepancy between scan and find services
@@ -420,11 +458,7 @@ class InteractiveTUI(App):
                         log.write(msg)
                         log.write(":hourglass: LLM finished.")
                         # if event.button.id == "hack":
-                        self.update_state(action)
-
-                        tree_state = self.query_one(TreeState)
-                        tree = tree_state.children[0]
-                        self.update_tree(tree)
+                        await self.take_action(action)
                     else:
                         msg = f"[bold red]:robot: Assistant proposed (invalid):[/bold red] {act_str}"
                         log.write(msg)
@@ -442,20 +476,55 @@ class InteractiveTUI(App):
                         else:
                             self.repetitions = 1
 
-                asyncio.create_task(do_ask_llm())
+                self.run_worker(do_ask_llm(), group="llm")
             else:
                 log.write(
                     "[bold red]No assistant is available at the moment.[/bold red]"
                 )
 
-    def update_state(self, action: Action) -> None:
+    async def ask_assistant(self):
+        """
+        Ask the assistant for an action in the current state. Returns None if the request was
+        cancelled because the state changed in the meantime.
+        """
+        log = self.query_one("RichLog")
+        on_token = LogStream(log) if self.stream else None
+        try:
+            return await self.assistant.get_action_from_obs_react(
+                self.current_obs, self.memory_buf[-self.memory_len :], on_token
+            )
+        except asyncio.CancelledError:
+            # the worker itself is cancelled (e.g. at shutdown), not only the request by cancel_pending()
+            if asyncio.current_task().cancelling():
+                raise
+            log.write(":hourglass: The state changed, the LLM request was cancelled.")
+            return None
+        finally:
+            if on_token is not None:
+                on_token.flush()
+
+    async def on_unmount(self) -> None:
+        if self.model is not None:
+            self.assistant.cancel_pending()
+            if hasattr(self.llm_client, "close"):
+                await self.llm_client.close()
+
+    async def take_action(self, action: Action) -> None:
+        """Play the action and show the new state"""
+        # the actions are sent one at a time over the connection of the agent
+        async with self._env_lock:
+            await self.update_state(action)
+            self.update_tree()
+
+    async def update_state(self, action: Action) -> None:
         """
         Take an action and receive the new state from the environment.
         """
         # Get next observation of the environment
         log = self.query_one("RichLog")
         log.write(":gear: Taking an action in the environment.")
-        next_observation = self.agent.make_step(action)
+        # the blocking round trip to the game server runs in a thread
+        next_observation = await asyncio.to_thread(self.agent.make_step, action)
         if next_observation.state != self.current_obs.state:
             good_action = True
         else:
@@ -465,6 +534,9 @@ class InteractiveTUI(App):
         self.returns += next_observation.reward
         # Move to next state
         self.current_obs = next_observation
+        if good_action and self.model is not None:
+            # the suggestions requested for the previous state are outdated
+            self.assistant.cancel_pending()
         self.memory_buf.append((action, good_action))
 
         if next_observation.end:
@@ -483,52 +555,11 @@ class InteractiveTUI(App):
                     severity="error",
                     timeout=10,
                 )
-            self._clear_state()
+            await self._clear_state()
 
-    def update_tree(self, tree: Widget) -> None:
+    def update_tree(self) -> None:
         """Update the tree with the new state"""
-
-        # Get the new state
-        new_state = self.current_obs.state
-
-        # First remove all the children and then rebuild the tree
-        # This is faster than looking at the delta
-        tree.root.remove_children()
-
-        contr_host_list = new_state.controlled_hosts
-        known_host_list = [
-            host for host in new_state.known_hosts if host not in contr_host_list
-        ]
-
-        networks = tree.root.add("Known Networks", expand=True)
-        for network in new_state.known_networks:
-            networks.add(str(network))
-
-        known_hosts = tree.root.add("Known Hosts", expand=True)
-        for host in known_host_list:
-            h = known_hosts.add(str(host), expand=True)
-            for s_host in new_state.known_services:
-                if s_host == host:
-                    node = h.add("Services", expand=True)
-                    for service in new_state.known_services[s_host]:
-                        node.add_leaf(service.name)
-
-        owned_hosts = tree.root.add("Controlled Hosts", expand=True)
-        for host in contr_host_list:
-            h = owned_hosts.add(str(host), expand=True)
-
-            # Add any services
-            for s_host in new_state.known_services:
-                if s_host == host:
-                    node = h.add("Services", expand=True)
-                    for service in new_state.known_services[s_host]:
-                        node.add_leaf(service.name)
-            # Add known data
-            for d_host in new_state.known_data:
-                if d_host == host:
-                    node = h.add("Data", expand=True)
-                    for datum in new_state.known_data[host]:
-                        node.add_leaf(f"{datum.owner} - {datum.id}")
+        self.query_one(TreeState).apply_state(self.current_obs.state)
 
     def generate_action(self, state: GameState) -> Action:
         """Generate a valid action from the user inputs"""
@@ -617,11 +648,12 @@ class InteractiveTUI(App):
 
         return action
 
-    def _clear_state(self) -> None:
+    async def _clear_state(self) -> None:
         """Reset the state and variables"""
         logger.info("Reset the environment and state")
-        self.current_obs = self.agent.request_game_reset()
+        self.current_obs = await asyncio.to_thread(self.agent.request_game_reset)
         if self.model is not None:
+            self.assistant.cancel_pending()
             self.assistant.update_instructions(
                 self.current_obs.info["goal_description"]
             )
@@ -681,8 +713,26 @@ if __name__ == "__main__":
     parser.add_argument("--api_url", type=str, default="http://127.0.0.1:11434/v1/")
     parser.add_argument("--memory_len", type=int, default=10)
     parser.add_argument("--max_repetitions", type=int, default=10)
+    parser.add_argument("--llm_backend", choices=BACKENDS, default="openai")
+    parser.add_argument(
+        "--stub_responses",
+        type=str,
+        default=None,
+        help="JSON file with the responses of the stub backend (a list of responses or a recorded trace)",
+    )
+    parser.add_argument("--stub_latency", type=float, default=0.0)
+    parser.add_argument(
+        "--stream_llm",
+        action="store_true",
+        help="Show the reasoning of the assistant while it is generated",
+    )
     args = parser.parse_args()
 
+    llm_client = None
+    if args.llm_backend == "stub":
+        stub_options = load_stub_responses(args.stub_responses) if args.stub_responses else {}
+        llm_client = create_client(args.llm, backend="stub", async_client=True, latency=args.stub_latency, **stub_options)
+
     logger.info("Creating the agent")
     app = InteractiveTUI(
         args.host,
@@ -693,5 +743,7 @@ if __name__ == "__main__":
         args.api_url,
         args.memory_len,
         args.max_repetitions,
+        llm_client,
+        args.stream_llm,
     )
     app.run()
\ No newline at end of file
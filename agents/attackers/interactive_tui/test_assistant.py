@@ -0,0 +1,128 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+pytest.importorskip("jinja2")
+pytest.importorskip("tenacity")
+from AIDojoCoordinator.game_components import GameState, IP, Network, Observation
+assistant = pytest.importorskip("NetSecGameAgents.agents.attackers.interactive_tui.assistant")
+from NetSecGameAgents.agents.llm_backends import AsyncStubBackend
+
+ACTION = {"action": "ScanNetwork", "parameters": {"target_network": "192.168.1.0/24", "source_host": "192.168.1.2"}}
+
+
+def respond(request: dict) -> str:
+    return "reasoning about the status" if request["response_format"]["type"] == "text" else json.dumps(ACTION)
+
+
+def observation(num_hosts: int = 1) -> Observation:
+    hosts = {IP(f"192.168.1.{i + 2}") for i in range(num_hosts)}
+    return Observation(GameState(controlled_hosts={IP("192.168.1.2")}, known_hosts=hosts, known_networks={Network("192.168.1.0", 24)}), 0, False, {})
+
+
+class BrokenStream:
+    """Async client whose streamed responses fail after `pieces` chunks"""
+
+    def __init__(self, pieces: int):
+        self.pieces = pieces
+        self.num_requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        self.num_requests += 1
+        return self.stream()
+
+    async def stream(self):
+        for i in range(self.pieces):
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=f"piece{i} "))])
+        raise ConnectionError("stream interrupted")
+
+
+class TestLLMAssistant(unittest.IsolatedAsyncioTestCase):
+    async def test_same_request_sent_once(self):
+        """Test that concurrent requests for the same state and memory share one query"""
+        client = AsyncStubBackend(responses=respond, latency=0.05)
+        llm = assistant.LLMAssistant("stub-model", "reach the data", client=client)
+        results = await asyncio.gather(*(llm.get_action_from_obs_react(observation(), []) for _ in range(3)))
+        self.assertEqual(client.num_requests, 2)
+        self.assertEqual(len(set(action_str for action_str, _ in results)), 1)
+        self.assertIsNotNone(results[0][1])
+        await llm.get_action_from_obs_react(observation(2), [])
+        self.assertEqual(client.num_requests, 4)
+
+    async def test_cancel_pending(self):
+        """Test that cancelled requests raise CancelledError, are not continued, and a new request is sent afterwards"""
+        client = AsyncStubBackend(responses=respond, latency=0.2)
+        llm = assistant.LLMAssistant("stub-model", "reach the data", client=client)
+        waiters = [asyncio.ensure_future(llm.get_action_from_obs_react(observation(), [])) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        llm.cancel_pending()
+        for waiter in waiters:
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+        await asyncio.sleep(0.3)
+        # the stage 1 query was cancelled while waiting for the response and stage 2 never sent
+        self.assertEqual(client.num_requests, 0)
+        _, action = await llm.get_action_from_obs_react(observation(), [])
+        self.assertIsNotNone(action)
+        self.assertEqual(client.num_requests, 2)
+
+    async def test_streamed_tokens(self):
+        """Test that the streamed pieces are passed to on_token and add up to the response"""
+        client = AsyncStubBackend(responses=respond, latency=0.01)
+        llm = assistant.LLMAssistant("stub-model", "reach the data", client=client)
+        tokens = []
+        await llm.get_action_from_obs_react(observation(), [], on_token=tokens.append)
+        self.assertEqual("".join(tokens), "reasoning about the status")
+
+    async def test_streamed_tokens_shared(self):
+        """Test that every waiter of a shared request gets all the streamed pieces, also when joining late"""
+        client = AsyncStubBackend(responses=respond, latency=0.05)
+        llm = assistant.LLMAssistant("stub-model", "reach the data", client=client)
+        first, late = [], []
+        waiter = asyncio.ensure_future(llm.get_action_from_obs_react(observation(), [], on_token=first.append))
+        await asyncio.sleep(0.07)
+        self.assertTrue(first)
+        await llm.get_action_from_obs_react(observation(), [], on_token=late.append)
+        await waiter
+        self.assertEqual(client.num_requests, 2)
+        self.assertEqual("".join(first), "reasoning about the status")
+        self.assertEqual(late, first)
+
+    async def test_ask_assistant_cancellation(self):
+        """Test that the TUI ignores a request cancelled by cancel_pending, but not the cancellation of its own task"""
+        interactive_tui = pytest.importorskip("NetSecGameAgents.agents.attackers.interactive_tui.interactive_tui")
+        client = AsyncStubBackend(responses=respond, latency=0.2)
+        messages = []
+        app = SimpleNamespace(assistant=assistant.LLMAssistant("stub-model", "reach the data", client=client), stream=False,
+                              current_obs=observation(), memory_buf=[], memory_len=10, query_one=lambda selector: SimpleNamespace(write=messages.append))
+        task = asyncio.ensure_future(interactive_tui.InteractiveTUI.ask_assistant(app))
+        await asyncio.sleep(0.05)
+        app.assistant.cancel_pending()
+        self.assertIsNone(await task)
+        self.assertEqual(len(messages), 1)
+        task = asyncio.ensure_future(interactive_tui.InteractiveTUI.ask_assistant(app))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(len(messages), 1)
+
+    async def test_no_retry_after_streaming(self):
+        """Test that a stream failing after the first piece is not retried, and one failing before it is"""
+        tokens = []
+        client = BrokenStream(pieces=2)
+        with self.assertRaises(ConnectionError):
+            await assistant.openai_query(client, [], on_token=tokens.append)
+        self.assertEqual((client.num_requests, tokens), (1, ["piece0 ", "piece1 "]))
+        client = BrokenStream(pieces=0)
+        with self.assertRaises(Exception):
+            await assistant.openai_query(client, [], on_token=tokens.append)
+        self.assertEqual(client.num_requests, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
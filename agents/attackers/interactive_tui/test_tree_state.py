@@ -0,0 +1,83 @@
+import random
+import unittest
+import pytest
+
+pytest.importorskip("textual")
+pytest.importorskip("AIDojoCoordinator")
+from textual.app import App
+from AIDojoCoordinator.game_components import GameState, IP, Network, Service, Data, Observation
+interactive_tui = pytest.importorskip("NetSecGameAgents.agents.attackers.interactive_tui.interactive_tui")
+
+
+def tree_labels(node) -> tuple:
+    """Label of the node and the labels of its subtrees, ignoring the order of the children"""
+    return (str(node.label), sorted(tree_labels(child) for child in node.children))
+
+
+def tree_from_scratch(state: GameState) -> tuple:
+    """Labels of the tree built from the state alone: networks, known and controlled hosts with their services and data"""
+    controlled = set(state.controlled_hosts)
+
+    def host_labels(host, is_controlled: bool) -> tuple:
+        children = []
+        if host in state.known_services:
+            children.append(("Services", sorted((service.name, []) for service in state.known_services[host])))
+        if is_controlled and host in state.known_data:
+            children.append(("Data", sorted((f"{datum.owner} - {datum.id}", []) for datum in state.known_data[host])))
+        return (str(host), sorted(children))
+
+    return ("State", sorted([
+        ("Known Networks", sorted((str(network), []) for network in state.known_networks)),
+        ("Known Hosts", sorted(host_labels(host, False) for host in state.known_hosts if host not in controlled)),
+        ("Controlled Hosts", sorted(host_labels(host, True) for host in controlled)),
+    ]))
+
+
+class TreeApp(App):
+    def compose(self):
+        self.tree_state = interactive_tui.TreeState(Observation(GameState(), 0, False, {}))
+        yield self.tree_state
+
+
+class TestTreeState(unittest.IsolatedAsyncioTestCase):
+    def states(self):
+        """A host discovered, scanned and then controlled (with data), followed by random states"""
+        host = IP("192.168.1.3")
+        start = IP("192.168.1.2")
+        ssh = Service("ssh", "passive", "8.1.0", False)
+        yield GameState(controlled_hosts={start}, known_hosts={start}, known_networks={Network("192.168.1.0", 24)})
+        yield GameState(controlled_hosts={start}, known_hosts={start, host}, known_networks={Network("192.168.1.0", 24)})
+        yield GameState(controlled_hosts={start}, known_hosts={start, host}, known_networks={Network("192.168.1.0", 24)},
+                        known_services={host: {ssh}}, known_data={host: {Data("User1", "DataA")}})
+        yield GameState(controlled_hosts={start, host}, known_hosts={start, host}, known_networks={Network("192.168.1.0", 24)},
+                        known_services={host: {ssh}}, known_data={host: {Data("User1", "DataA")}})
+        rng = random.Random(2)
+        hosts = [IP(f"10.0.{i // 50}.{i % 50}") for i in range(120)]
+        for _ in range(15):
+            known = set(rng.sample(hosts, rng.randint(0, 80)))
+            controlled = set(rng.sample(sorted(known), min(len(known), rng.randint(0, 10))))
+            yield GameState(
+                controlled_hosts=controlled,
+                known_hosts=known,
+                known_networks={Network(f"10.0.{i}.0", 24) for i in range(rng.randint(0, 3))},
+                known_services={h: {Service(name) for name in rng.sample(["ssh", "http", "smb"], rng.randint(0, 3))} for h in rng.sample(sorted(known), len(known) // 2)},
+                known_data={h: {Data("User1", f"Data{j}") for j in range(rng.randint(0, 3))} for h in rng.sample(sorted(known), len(known) // 3)},
+            )
+
+    async def test_apply_state_matches_scratch_build(self):
+        """Test that the tree updated state by state equals the tree built from every state alone"""
+        app = TreeApp()
+        async with app.run_test() as pilot:
+            for i, state in enumerate(self.states()):
+                app.tree_state.apply_state(state)
+                await pilot.pause()
+                self.assertEqual(tree_labels(app.tree_state.tree.root), tree_from_scratch(state))
+                if i == 3:
+                    # the host moved from the known to the controlled hosts, where its data is shown
+                    sections = dict(tree_labels(app.tree_state.tree.root)[1])
+                    self.assertEqual(sections["Known Hosts"], [])
+                    self.assertIn(("192.168.1.3", [("Data", [("User1 - DataA", [])]), ("Services", [("ssh", [])])]), sections["Controlled Hosts"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+"""
+@file batched_evaluation.py
+
+@brief Evaluation of the LLM agent over several episodes played concurrently.
+
+Each of the K workers plays episodes over its own connection to the coordinator and sends its LLM queries
+concurrently with the other workers, so a local server which processes concurrent requests in parallel
+(e.g. Ollama with OLLAMA_NUM_PARALLEL) is kept busy. Identical queries at temperature 0 in flight at the
+same time (e.g. episodes starting in the same state) are sent only once by the QueryDeduplicator.
+"""
+
+import json
+import queue
+import threading
+from concurrent.futures import Future
+
+from AIDojoCoordinator.game_components import AgentStatus
+
+
+class QueryDeduplicator:
+    """
+    Shares the chat completion requests of several threads: an identical deterministic request (temperature 0)
+    which is already in flight is not sent again, its caller waits for the response of the first one.
+    The other requests are sent right away from the thread of their caller.
+    """
+
+    def __init__(self):
+        self.num_requests = 0
+        self.num_sent = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def create(self, client, **request):
+        """Blocking equivalent of client.chat.completions.create"""
+        # sampled requests (temperature > 0) are sent on their own so they get independent responses
+        key = None
+        if request.get("temperature", 1.0) == 0:
+            key = (id(client), json.dumps(request, sort_keys=True, default=str))
+        with self._lock:
+            self.num_requests += 1
+            future = self._in_flight.get(key) if key is not None else None
+            if future is not None:
+                shared = True
+            else:
+                shared = False
+                future = Future()
+                self.num_sent += 1
+                if key is not None:
+                    self._in_flight[key] = future
+        if shared:
+            return future.result()
+        try:
+            response = client.chat.completions.create(**request)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            if key is not None:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+
+
+def update_memories(memories: list, response_dict: dict, is_valid: bool, good_action: bool, memory_buffer: int) -> None:
+    """Appends the evaluation of the last action to the memory of the agent"""
+    try:
+        if not is_valid:
+            memories.append(((response_dict["action"], response_dict["parameters"]), "not valid based on your status."))
+        elif good_action:
+            memories.append(((response_dict["action"], response_dict["parameters"]), "helpful."))
+        else:
+            memories.append(((response_dict["action"], response_dict["parameters"]), "not helpful."))
+    except (KeyError, TypeError):
+        # if the LLM sends a response that is not properly formatted.
+        memories.append(((response_dict, None), "badly formated."))
+    if len(memories) > memory_buffer:
+        # If the memory is full, remove the oldest memory
+        memories.pop(0)
+
+
+def play_episode(agent, create_planner, memory_buffer: int, logger, episode: int) -> dict:
+    """
+    Plays one episode with a new planner created by create_planner(goal) and returns its statistics
+    and the prompts, responses and evaluations of the prompt table.
+    """
+    logger.info(f"Running episode {episode}")
+
+    # Reset the game at every episode and store the goal that changes
+    observation = agent.request_game_reset()
+    llm_query = create_planner(observation.info["goal_description"])
+    llm_query.episode = episode
+    try:
+        return _play_steps(agent, llm_query, observation, memory_buffer, logger, episode)
+    finally:
+        llm_query.close()
+
+
+def _play_steps(agent, llm_query, observation, memory_buffer: int, logger, episode: int) -> dict:
+    """Steps of the episode from the reset observation until its end, see play_episode"""
+    evaluations = []  # used for prompt table storage.
+    actions_took_in_episode = []
+    num_iterations = observation.info["max_steps"]
+    current_state = observation.state
+
+    memories = []
+    total_reward = 0
+    repeated_actions = 0
+    result = {}
+    for i in range(num_iterations):
+        good_action = False
+        is_valid, response_dict, action = llm_query.get_action_from_obs_react(observation, memories)
+        if is_valid:
+            observation = agent.make_step(action)
+            logger.info(f"Observation received: {observation}")
+            total_reward += observation.reward
+
+            if observation.state != current_state:
+                good_action = True
+                current_state = observation.state
+                evaluations.append(8)
+            else:
+                evaluations.append(3)
+            # If the action was repeated count it
+            if action in actions_took_in_episode:
+                repeated_actions += 1
+            # Store action in memory of all actions so far
+            actions_took_in_episode.append(action)
+        else:
+            logger.info(f"Invalid action: {response_dict}")
+            evaluations.append(0)
+        update_memories(memories, response_dict, is_valid, good_action, memory_buffer)
+        logger.info(f"Iteration: {i} Valid: {is_valid} Good: {good_action}")
+
+        if observation.end or i == (num_iterations - 1):  # if it is the last iteration gather statistics
+            # an episode ending in its last iteration ends for its own reason, not by the timeout
+            if observation.end:
+                reason = observation.info
+            else:
+                reason = {"end_reason": AgentStatus.TimeoutReached}
+
+            steps = i + 1
+            if AgentStatus.Success == reason["end_reason"]:
+                type_of_end = "win"
+                evaluations[-1] = 10
+            elif AgentStatus.Fail == reason["end_reason"]:
+                type_of_end = "detection"
+            elif AgentStatus.TimeoutReached == reason["end_reason"]:
+                # running out of steps is scored with a fixed return of -100
+                type_of_end = "max_iterations"
+                total_reward = -100
+            else:
+                type_of_end = "max_steps"
+            logger.info(f"\tEpisode {episode} of game ended after {steps} steps. Reason: {reason}. Last reward: {observation.reward}")
+            result = {
+                "episode": episode,
+                "type_of_end": type_of_end,
+                "end_reason": str(reason["end_reason"]),
+                "steps": steps,
+                "return": total_reward,
+                "repeated_actions": repeated_actions,
+                "valid_action_rate": sum(1 for evaluation in evaluations if evaluation > 0) / len(evaluations),
+            }
+            break
+
+    result["llm_time"] = llm_query.llm_time
+    result["step_time"] = llm_query.step_time
+    result["prompt_table"] = {
+        "episode": episode,
+        "state": llm_query.get_states(),
+        "prompt": llm_query.get_prompts(),
+        "response": llm_query.get_responses(),
+        "evaluation": evaluations,
+        "end_reason": result.get("end_reason"),
+    }
+    return result
+
+
+def evaluate_concurrently(agents: list, create_planner, num_episodes: int, memory_buffer: int, logger):
+    """
+    Plays num_episodes episodes with len(agents) workers, each using its own (registered) agent.
+    create_planner(goal, query_deduplicator) creates the planner of an episode. The results are yielded
+    in the order the episodes finish.
+    """
+    deduplicator = QueryDeduplicator()
+    episodes = queue.Queue()
+    for episode in range(1, num_episodes + 1):
+        episodes.put(episode)
+    results = queue.Queue()
+
+    def worker(agent):
+        while True:
+            try:
+                episode = episodes.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results.put(play_episode(agent, lambda goal: create_planner(goal, deduplicator), memory_buffer, logger, episode))
+            except Exception as e:
+                logger.error(f"Episode {episode} failed: {e}")
+                results.put(e)
+
+    workers = [threading.Thread(target=worker, args=(agent,), daemon=True) for agent in agents]
+    for thread in workers:
+        thread.start()
+    try:
+        for _ in range(num_episodes):
+            result = results.get()
+            if isinstance(result, Exception):
+                raise result
+            yield result
+    finally:
+        # stop the workers after their current episode
+        while not episodes.empty():
+            try:
+                episodes.get_nowait()
+            except queue.Empty:
+                break
+        for thread in workers:
+            thread.join()
+        logger.info(f"LLM queries: {deduplicator.num_requests}, sent: {deduplicator.num_sent}")
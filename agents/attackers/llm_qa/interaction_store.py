@@ -0,0 +1,99 @@
+"""
+@file interaction_store.py
+
+@brief Streaming store of the interactions of the LLM action planner with the model.
+
+Every step of the planner is appended as one JSON record to a (gzip compressed) JSON Lines file:
+    {"run": str, "episode": int, "step": int, "state": state JSON, "memories": [[action, evaluation]],
+     "queries": [{"prompt": messages, "response": str, "latency": float}],
+     "response": str (stage 2), "action": {"action", "parameters"}, "valid": bool, "latency": float}
+The records are written when the step finishes, so nothing is kept in memory. The store can be replayed
+through a planner (answering the queries with the recorded responses) to re-evaluate a run offline.
+"""
+
+import gzip
+import json
+import threading
+import time
+from os import path, makedirs
+
+from AIDojoCoordinator.game_components import GameState, Observation
+
+
+def _open(file_path: str, mode: str):
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, mode + "t", encoding="utf-8")
+    return open(file_path, mode, encoding="utf-8")
+
+
+class InteractionWriter:
+    """Appends the step records to the store. Safe to share between the planners of concurrent episodes."""
+
+    def __init__(self, file_path: str, run_id: str = None):
+        if path.dirname(file_path):
+            makedirs(path.dirname(file_path), exist_ok=True)
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self._lock = threading.Lock()
+        self._file = _open(file_path, "a")
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(dict(record, run=self.run_id), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_interactions(file_path: str):
+    """
+    Yields the step records of the store in the order they were written. The store of an interrupted
+    run is read up to its last complete record (a gzip file may end in the middle of a compressed block).
+    """
+    with _open(file_path, "r") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last record of an interrupted run may be incomplete
+                        return
+        except (EOFError, gzip.BadGzipFile):
+            return
+
+
+def replay_interactions(file_path: str, create_planner) -> dict:
+    """
+    Replays the recorded steps through new planners created by create_planner(goal), which should use
+    a StubBackend with the responses of the store (see llm_backends.load_stub_responses). Returns the number
+    of replayed steps, of valid actions and of actions equal to the recorded ones.
+    """
+    planners = {}
+    stats = {"steps": 0, "valid": 0, "recorded_valid": 0, "same_action": 0}
+    for record in read_interactions(file_path):
+        key = (record.get("run"), record.get("episode"))
+        if key not in planners:
+            for planner in planners.values():
+                planner.close()
+            planners.clear()
+            planners[key] = create_planner(record.get("goal", ""))
+        observation = Observation(GameState.from_json(record["state"]), 0, False, {})
+        # the memories are ((action, parameters), evaluation) tuples, which are lists in JSON
+        memories = [(tuple(action), evaluation) for action, evaluation in record.get("memories", [])]
+        valid, response_dict, _ = planners[key].get_action_from_obs_react(observation, memories)
+        stats["steps"] += 1
+        stats["valid"] += int(valid)
+        stats["recorded_valid"] += int(bool(record.get("valid")))
+        stats["same_action"] += int(json.dumps(response_dict, sort_keys=True, default=str) == json.dumps(record.get("action"), sort_keys=True, default=str))
+    for planner in planners.values():
+        planner.close()
+    return stats
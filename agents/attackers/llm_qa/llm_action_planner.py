@@ -20,14 +20,17 @@ from os import path
 import yaml
 import logging
 import json
-from dotenv import dotenv_values
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt
+import time
+import functools
+from tenacity import retry, retry_if_exception, stop_after_attempt, RetryError
 import jinja2
 
 import re
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import validate_responses
+from response_cache import ResponseCache, get_cache
+from prompt_builder import PromptBuilder
 
 # Add parent directories dynamically
 sys.path.append(
@@ -36,7 +39,9 @@ sys.path.append(
 sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
 
 from AIDojoCoordinator.game_components import ActionType, Observation
-from NetSecGameAgents.agents.llm_utils import create_action_from_response, create_status_from_state
+from NetSecGameAgents.agents.llm_utils import create_action_from_response, validate_action_in_state
+from NetSecGameAgents.agents.agent_utils import generate_valid_actions
+from NetSecGameAgents.agents.llm_backends import create_client
 
 
 class ConfigLoader:
@@ -65,19 +70,80 @@ ACTION_MAPPER = {
 }
 
 
+DEFAULT_CACHE_PATH = path.join(path.dirname(path.abspath(__file__)), "llm_cache.sqlite")
+
+
+def _llm_wait(method):
+    """
+    Adds the wall-clock time of the call to llm_time of the planner. The time is measured in the calling
+    thread, so the concurrent requests of sample_queries count once, and nested calls are not counted twice.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._waiting_for_llm:
+            return method(self, *args, **kwargs)
+        self._waiting_for_llm = True
+        start_time = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.llm_time += time.perf_counter() - start_time
+            self._waiting_for_llm = False
+    return wrapper
+
+
+def _is_format_rejection(error: Exception) -> bool:
+    """
+    Whether the error is the backend rejecting the request (a 4xx status other than authentication,
+    timeout and rate limits) or its response format, rather than a transient failure.
+    """
+    if isinstance(error, RetryError):
+        error = error.last_attempt.exception()
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return 400 <= status_code < 500 and status_code not in (401, 403, 408, 429)
+    message = str(error).lower()
+    return "response_format" in message or "json_schema" in message
+
+
 class LLMActionPlanner:
-    def __init__(self, model_name: str, goal: str, memory_len: int = 10, api_url=None, config: dict = None, use_reasoning: bool = False, use_reflection: bool = False, use_self_consistency: bool = False):
+    def __init__(self, model_name: str, goal: str, memory_len: int = 10, api_url=None, config: dict = None, use_reasoning: bool = False, use_reflection: bool = False, use_self_consistency: bool = False,
+                 use_cache: bool = True, cache: ResponseCache = None, query_deduplicator=None, status_token_budget: int = None,
+                 use_constrained_decoding: bool = False, client=None, interaction_writer=None):
         self.model = model_name
+        # Optional InteractionWriter (interaction_store.py) streaming every step to disk. With it,
+        # the prompts, states and responses are not kept in memory.
+        self.interaction_writer = interaction_writer
+        self.episode = None
+        self._step = 0
+        self._step_queries = None
+        # Stage 2 responses restricted by a JSON schema of the valid actions (None until tried on the backend)
+        self.use_constrained_decoding = use_constrained_decoding
+        self.supports_json_schema = None
+        self.valid_action_index = None
+        self.status_token_budget = status_token_budget
+        # Optional QueryDeduplicator (batched_evaluation.py) sharing the identical queries of concurrent episodes
+        self.query_deduplicator = query_deduplicator
+        # Responses of deterministic queries (temperature 0) are cached on disk. Without a given cache,
+        # the default one is opened with the first query and shared by all the planners of the process.
+        self.use_cache = use_cache
+        self._cache = cache
         self.config = config or ConfigLoader.load_config()
         self.use_reasoning = use_reasoning
         self.use_reflection = use_reflection
         self.use_self_consistency = use_self_consistency
 
-        if "gpt" in self.model:
-            env_config = dotenv_values(".env")
-            self.client = OpenAI(api_key=env_config["OPENAI_API_KEY"])
-        else:
-            self.client = OpenAI(base_url=api_url, api_key="ollama")
+        # any backend with the interface of the OpenAI client (see llm_backends.py)
+        self.client = client or create_client(self.model, api_url)
+        # seconds spent waiting for the LLM and in the whole steps (the rest is the planner overhead)
+        self.llm_time = 0.0
+        self.step_time = 0.0
+        self._waiting_for_llm = False
+
+        # Whether the backend returns several choices for the `n` parameter (None until tried).
+        # Local OpenAI compatible servers (e.g. Ollama) ignore it and return only one choice.
+        self.supports_n = True if "gpt" in self.model else None
+        self._executor = None
 
         self.memory_len = memory_len
         self.logger = logging.getLogger("REACT-agent")
@@ -86,6 +152,12 @@ class LLMActionPlanner:
         self.states = []
         self.responses = []
 
+    def close(self) -> None:
+        """Stops the threads of the concurrent sample queries, the planner can still be used afterwards"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
     def get_prompts(self) -> list:
         """
         Returns the list of prompts sent to the LLM."""
@@ -104,8 +176,19 @@ class LLMActionPlanner:
         return self.states
     
     def update_instructions(self, new_goal: str) -> None:
+        self.goal = new_goal
         template = jinja2.Environment().from_string(self.config['prompts']['INSTRUCTIONS_TEMPLATE'])
         self.instructions = template.render(goal=new_goal)
+        # the stable prefix of the prompts changes only with the goal
+        self.prompt_builder = PromptBuilder(self.instructions, self.config['prompts']['COT_PROMPT'], self.status_token_budget)
+
+    @property
+    def cache(self) -> ResponseCache:
+        if not self.use_cache:
+            return None
+        if self._cache is None:
+            self._cache = get_cache(DEFAULT_CACHE_PATH)
+        return self._cache
 
     def create_mem_prompt(self, memory_list: list) -> str:
         prompt = ""
@@ -113,16 +196,98 @@ class LLMActionPlanner:
             prompt += f"You have taken action {memory} in the past. This action was {goodness}.\n"
         return prompt
 
-    @retry(stop=stop_after_attempt(3))
+    @_llm_wait
     def openai_query(self, msg_list: list, max_tokens: int = 60, model: str = None, fmt=None, temperature: float = 0.0):
-        llm_response = self.client.chat.completions.create(
-            model=model or self.model,
-            messages=msg_list,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            response_format=fmt or {"type": "text"},
-        )
-        return llm_response.choices[0].message.content
+        model = model or self.model
+        fmt = fmt or {"type": "text"}
+        if self.cache is None or temperature != 0:
+            return self._completion(msg_list, max_tokens, model, fmt, temperature)
+
+        key = ResponseCache.make_key(model, msg_list, temperature, fmt, max_tokens)
+        response = self.cache.get(key)
+        if response is not None:
+            self._record_query(msg_list, response, 0.0)
+        else:
+            response = self._completion(msg_list, max_tokens, model, fmt, temperature)
+            if response is not None:
+                self.cache.put(key, response, model)
+        return response
+
+    def _completion(self, msg_list: list, max_tokens: int, model: str, fmt: dict, temperature: float):
+        return self._completions(msg_list, max_tokens, model, fmt, temperature)[0]
+
+    # a rejected request or response format fails the same way again, query_action falls back to JSON mode at once
+    @retry(stop=stop_after_attempt(3), retry=retry_if_exception(lambda e: not _is_format_rejection(e)))
+    def _completions(self, msg_list: list, max_tokens: int, model: str, fmt: dict, temperature: float, n: int = 1) -> list:
+        request = {
+            "model": model,
+            "messages": msg_list,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "response_format": fmt,
+        }
+        if n > 1:
+            request["n"] = n
+        start_time = time.perf_counter()
+        if self.query_deduplicator is not None:
+            llm_response = self.query_deduplicator.create(self.client, **request)
+        else:
+            llm_response = self.client.chat.completions.create(**request)
+        latency = time.perf_counter() - start_time
+        responses = [choice.message.content for choice in llm_response.choices]
+        for response in responses:
+            self._record_query(msg_list, response, latency)
+        return responses
+
+    def _record_query(self, msg_list: list, response: str, latency: float) -> None:
+        if self._step_queries is not None:
+            self._step_queries.append({"prompt": msg_list, "response": response, "latency": latency})
+
+    @_llm_wait
+    def sample_queries(self, msg_list: list, n: int, max_tokens: int = 60, model: str = None, fmt=None, temperature: float = 0.0) -> list:
+        """
+        Returns n responses to the same messages. They are requested at once with the `n` parameter
+        when the backend supports it, otherwise (or for the missing ones) with concurrent requests.
+        """
+        if temperature == 0:
+            # deterministic, all the samples are the same
+            return [self.openai_query(msg_list, max_tokens, model, fmt, temperature)] * n
+        model = model or self.model
+        fmt = fmt or {"type": "text"}
+        responses = []
+        if self.supports_n is not False:
+            try:
+                responses = self._completions(msg_list, max_tokens, model, fmt, temperature, n=n)[:n]
+                # only a successful request with fewer choices shows that `n` is ignored
+                self.supports_n = len(responses) == n
+            except Exception as e:
+                self.logger.warning(f"Request with n={n} failed, falling back to concurrent requests: {e}")
+        missing = n - len(responses)
+        if missing > 0:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=n, thread_name_prefix="llm-query")
+            futures = [self._executor.submit(self._completion, msg_list, max_tokens, model, fmt, temperature) for _ in range(missing)]
+            responses += [future.result() for future in futures]
+        return responses
+
+    def query_action(self, messages: list) -> str:
+        """
+        Stage 2 query. With constrained decoding the response format is the JSON schema of the valid actions,
+        if the backend rejects it (see _is_format_rejection), the planner falls back to free JSON for the
+        rest of the run. Other errors (e.g. timeouts) are raised.
+        """
+        fmt = self.valid_action_index.response_format() if self.valid_action_index is not None else None
+        if fmt is not None and self.supports_json_schema is not False:
+            try:
+                response = self.openai_query(messages, max_tokens=80, fmt=fmt)
+                self.supports_json_schema = True
+                return response
+            except Exception as e:
+                if self.supports_json_schema or not _is_format_rejection(e):
+                    raise
+                self.logger.warning(f"Constrained decoding is not supported by the backend, using JSON mode: {e}")
+                self.supports_json_schema = False
+        return self.openai_query(messages, max_tokens=80, fmt={"type": "json_object"})
 
     def parse_response_deprecated(self, llm_response: str, state: Observation.state):
         try:
@@ -152,7 +317,15 @@ class LLMActionPlanner:
             action_params = response.get("parameters", None)
             
             if action_str and action_params:
-                valid, action = create_action_from_response(response, state)
+                # fast path: the response is one of the indexed actions, which passed the rules of
+                # create_action_from_response when the index was built. Other responses are checked by the rules.
+                action = None
+                if self.valid_action_index is not None:
+                    action = self.valid_action_index.lookup(response)
+                if action is not None:
+                    valid = True
+                else:
+                    valid, action = create_action_from_response(response, state)
                 response_dict["action"] = action_str
                 response_dict["parameters"] = action_params
             else:
@@ -182,10 +355,7 @@ class LLMActionPlanner:
         return repetitions
 
     def get_self_consistent_response(self, messages, temp=0.4, max_tokens=1024, n=3):
-        candidates = []
-        for _ in range(n):
-            response = self.openai_query(messages, temperature=temp, max_tokens=max_tokens)
-            candidates.append(response.strip())
+        candidates = [response.strip() for response in self.sample_queries(messages, n, temperature=temp, max_tokens=max_tokens)]
 
         counts = Counter(candidates)
         most_common = counts.most_common(1)
@@ -195,20 +365,47 @@ class LLMActionPlanner:
         return candidates[0]  # fallback
 
     def get_action_from_obs_react(self, observation: Observation, memory_buf: list) -> tuple:
-        self.states.append(observation.state.as_json())
-        status_prompt = create_status_from_state(observation.state)
+        start_time, start_llm_time = time.perf_counter(), self.llm_time
+        if self.interaction_writer is not None:
+            self._step_queries = []
+        result = self._get_action_from_obs_react(observation, memory_buf)
+        step_time = time.perf_counter() - start_time
+        self.step_time += step_time
+        self.logger.info(f"Step took {step_time:.3f}s, {self.llm_time - start_llm_time:.3f}s of it waiting for the LLM")
+        if self.interaction_writer is not None:
+            self._write_interaction(observation, memory_buf, result, step_time)
+        self._step += 1
+        return result
+
+    def _write_interaction(self, observation: Observation, memory_buf: list, result: tuple, step_time: float) -> None:
+        valid, response_dict, _ = result
+        queries, self._step_queries = self._step_queries, None
+        self.interaction_writer.write({
+            "episode": self.episode,
+            "step": self._step,
+            "goal": self.goal,
+            "state": observation.state.as_json(),
+            "memories": memory_buf,
+            "queries": queries,
+            "response": queries[-1]["response"] if queries else None,
+            "action": response_dict,
+            "valid": valid,
+            "latency": step_time,
+        })
+
+    def _get_action_from_obs_react(self, observation: Observation, memory_buf: list) -> tuple:
+        if self.interaction_writer is None:
+            self.states.append(observation.state.as_json())
         q1 = self.config['questions'][0]['text']
         q4 = self.config['questions'][3]['text']
-        cot_prompt = self.config['prompts']['COT_PROMPT']
         memory_prompt = self.create_mem_prompt(memory_buf)
+        # the status is rendered incrementally from the previous step
+        status_prompt = self.prompt_builder.update(observation.state, memory_prompt)
+        if self.prompt_builder.status_tokens is not None:
+            self.logger.info(f"Status summarized to {self.prompt_builder.status_tokens} tokens (budget {self.status_token_budget})")
 
         repetitions = self.check_repetition(memory_buf)
-        messages = [
-            {"role": "user", "content": self.instructions},
-            {"role": "user", "content": status_prompt},
-            {"role": "user", "content": memory_prompt},
-            {"role": "user", "content": q1},
-        ]
+        messages = self.prompt_builder.stage1(q1)
         self.logger.info(f"Text sent to the LLM: {messages}")
 
         if self.use_self_consistency:
@@ -244,18 +441,15 @@ class LLMActionPlanner:
             response = self.remove_reasoning(response)
         self.logger.info(f"(Stage 1) Response from LLM: {response}")
 
-        #memory_prompt = self.create_mem_prompt(memory_buf)
-
-        messages = [
-            {"role": "user", "content": self.instructions},
-            {"role": "user", "content": status_prompt},
-            {"role": "user", "content": cot_prompt},
-            {"role": "user", "content": response},
-            {"role": "user", "content": memory_prompt},
-            {"role": "user", "content": q4},
-        ]
-        self.prompts.append(messages)
-        response = self.openai_query(messages, max_tokens=80, fmt={"type": "json_object"})
+        messages = self.prompt_builder.stage2(response, q4)
+        if self.interaction_writer is None:
+            self.prompts.append(messages)
+        if self.use_constrained_decoding:
+            # valid actions of the state which also pass the rules of the response validation
+            self.valid_action_index = validate_responses.ValidActionIndex(
+                generate_valid_actions(observation.state), accepts=lambda action_response: validate_action_in_state(action_response, observation.state)
+            )
+        response = self.query_action(messages)
         
         validated, error_msg = validate_responses.validate_agent_response(response)
         if validated is None:
@@ -276,7 +470,8 @@ class LLMActionPlanner:
         if self.use_reasoning:
             response = self.remove_reasoning(response)
 
-        self.responses.append(response)
+        if self.interaction_writer is None:
+            self.responses.append(response)
         self.logger.info(f"(Stage 2) Response from LLM: {response}")
         print(f"(Stage 2) Response from LLM: {response}")
         return self.parse_response(response, observation.state)
\ No newline at end of file
@@ -10,7 +10,10 @@ import pandas as pd
 import mlflow
 import sys
 import json
-from llm_action_planner import LLMActionPlanner
+from llm_action_planner import LLMActionPlanner, DEFAULT_CACHE_PATH
+from batched_evaluation import play_episode, evaluate_concurrently
+from response_cache import get_cache
+from interaction_store import InteractionWriter, replay_interactions
 from os import path
 from transformers import AutoModelForCausalLM, AutoTokenizer, GenerationConfig
 
@@ -18,8 +21,8 @@ sys.path.append(
     path.dirname(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))
 )
 
-from AIDojoCoordinator.game_components import AgentStatus
 from NetSecGameAgents.agents.base_agent import BaseAgent
+from NetSecGameAgents.agents.llm_backends import BACKENDS, create_client, load_stub_responses
 
 #mlflow.set_tracking_uri("http://147.32.83.60")
 #mlflow.set_experiment("LLM_QA_netsecgame_dec2024")
@@ -96,6 +99,76 @@ if __name__ == "__main__":
         help="To use self-consistency prompting technique in the LLM calls."
     )
 
+    parser.add_argument(
+        "--parallel_episodes",
+        help="Number of episodes played concurrently, each over its own connection to the game server. Their LLM queries are sent to the model server concurrently",
+        default=1,
+        required=False,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--status_token_budget",
+        help="Maximal number of tokens of the status prompt. Large states are summarized to fit (default: full status)",
+        default=None,
+        required=False,
+        type=int,
+    )
+
+    parser.add_argument(
+        "--constrained_decoding",
+        action="store_true",
+        help="Restrict the action responses with a JSON schema of the valid actions (if the backend supports it)",
+    )
+
+    parser.add_argument(
+        "--llm_backend",
+        choices=BACKENDS,
+        default="openai",
+        help="Backend answering the LLM queries. 'stub' answers in-process with the --stub_responses (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--stub_responses",
+        type=str,
+        default=None,
+        help="JSON file with the responses of the stub backend: a list of responses, or a recorded episode_data.json replayed by prompt",
+    )
+
+    parser.add_argument(
+        "--stub_latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stub backend waits before every response (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--llm_cache",
+        type=str,
+        default=DEFAULT_CACHE_PATH,
+        help="SQLite file caching the responses of deterministic (temperature 0) LLM queries (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--disable_llm_cache",
+        action="store_true",
+        help="Query the LLM for every prompt, without the response cache",
+    )
+
+    parser.add_argument(
+        "--interaction_store",
+        type=str,
+        default=None,
+        help="JSON Lines file (gzip compressed if it ends with .gz) the state, prompts, responses, action and latency of every step are appended to. With it, they are not kept in memory",
+    )
+
+    parser.add_argument(
+        "--replay_interactions",
+        type=str,
+        default=None,
+        help="Replay an interaction store through the planner with the recorded responses (offline, without the game) and exit",
+    )
+
     parser.add_argument(
         "--mlflow_tracking_uri",
         type=str,
@@ -136,6 +209,31 @@ if __name__ == "__main__":
 
     logger = logging.getLogger("llm_react")
     logger.info("Start")
+
+    if args.replay_interactions:
+        # offline re-evaluation, the LLM queries are answered with the recorded responses
+        replay_client = create_client(args.llm, backend="stub", **load_stub_responses(args.replay_interactions))
+        replay_stats = replay_interactions(
+            args.replay_interactions,
+            lambda goal: LLMActionPlanner(
+                model_name=args.llm,
+                goal=goal,
+                memory_len=args.memory_buffer,
+                use_reasoning=args.use_reasoning,
+                use_reflection=args.use_reflection,
+                use_self_consistency=args.use_self_consistency,
+                use_cache=False,
+                status_token_budget=args.status_token_budget,
+                use_constrained_decoding=args.constrained_decoding,
+                client=replay_client,
+            ),
+        )
+        replay_stats["replayed_queries"] = replay_client.num_replayed
+        replay_stats["queries"] = replay_client.num_requests
+        print(f"Replayed {args.replay_interactions}: {replay_stats}")
+        logger.info(f"Replayed {args.replay_interactions}: {replay_stats}")
+        sys.exit(0)
+
     agent = BaseAgent(args.host, args.port, "Attacker")
     
     if not args.disable_mlflow:
@@ -156,6 +254,11 @@ if __name__ == "__main__":
             "host": args.host,
             "port": args.port,
             "api_url": args.api_url,
+            "parallel_episodes": args.parallel_episodes,
+            "status_token_budget": args.status_token_budget,
+            "constrained_decoding": args.constrained_decoding,
+            "llm_backend": args.llm_backend,
+            "interaction_store": args.interaction_store,
         }
         mlflow.log_params(params)
         mlflow.set_tag("agent_role", "Attacker")
@@ -169,6 +272,9 @@ if __name__ == "__main__":
     num_win_steps = []
     num_detected_steps = []
     num_actions_repeated = []
+    valid_action_rates = []
+    llm_time = 0.0
+    step_time = 0.0
     reward_memory = ""
 
  
@@ -179,188 +285,99 @@ if __name__ == "__main__":
     # We are still not using this, but we keep track
     is_detected = False
 
-    # Initialize the game
-    print("Registering")
-    agent.register()
-    print("Done")
-    for episode in range(1, args.test_episodes + 1):
-        actions_took_in_episode = []
-        evaluations = [] # used for prompt table storage.
-        logger.info(f"Running episode {episode}")
-        print(f"Running episode {episode}")
+    # The cache is shared by the planners of all episodes. The stub backend is not cached,
+    # its responses would be stored under the name of the real model.
+    use_llm_cache = not args.disable_llm_cache and args.llm_backend != "stub"
+    response_cache = get_cache(args.llm_cache) if use_llm_cache else None
 
-        # Reset the game at every episode and store the goal that changes
-        observation = agent.request_game_reset()
-        num_iterations = observation.info["max_steps"]
-        current_state = observation.state
+    # The interactions of all episodes are streamed to the same store
+    interaction_writer = InteractionWriter(args.interaction_store) if args.interaction_store else None
 
-        
-        taken_action = None
-        memories = []
-        total_reward = 0
-        num_actions = 0
-        repeated_actions = 0
-
-        if args.llm is not None:
-            llm_query = LLMActionPlanner(
+    # One client shared by the planners of all episodes
+    if args.llm_backend == "stub":
+        stub_options = load_stub_responses(args.stub_responses) if args.stub_responses else {}
+        llm_client = create_client(args.llm, backend="stub", latency=args.stub_latency, **stub_options)
+    else:
+        llm_client = create_client(args.llm, args.api_url)
+
+    def create_planner(goal, query_deduplicator=None):
+        return LLMActionPlanner(
             model_name=args.llm,
-            goal=observation.info["goal_description"],
+            goal=goal,
             memory_len=args.memory_buffer,
             api_url=args.api_url,
             use_reasoning=args.use_reasoning,
             use_reflection=args.use_reflection,
-            use_self_consistency=args.use_self_consistency
+            use_self_consistency=args.use_self_consistency,
+            use_cache=use_llm_cache,
+            cache=response_cache,
+            query_deduplicator=query_deduplicator,
+            status_token_budget=args.status_token_budget,
+            use_constrained_decoding=args.constrained_decoding,
+            client=llm_client,
+            interaction_writer=interaction_writer,
         )
-        print(observation)
-        for i in range(num_iterations):
-            good_action = False
-            #is_json_ok = True
-            is_valid, response_dict, action = llm_query.get_action_from_obs_react(observation, memories)
-            if is_valid:
-                observation = agent.make_step(action)
-                logger.info(f"Observation received: {observation}")
-                taken_action = action
-                total_reward += observation.reward
-
-                if observation.state != current_state:
-                    good_action = True
-                    current_state = observation.state
-                    evaluations.append(8)
-                else:
-                    evaluations.append(3)
+
+    # Initialize the game
+    print("Registering")
+    agent.register()
+    print("Done")
+    try:
+        if args.parallel_episodes > 1:
+            # Every worker plays over its own connection to the coordinator
+            agents = [agent] + [BaseAgent(args.host, args.port, "Attacker") for _ in range(args.parallel_episodes - 1)]
+            for worker_agent in agents[1:]:
+                worker_agent.register()
+            episode_results = evaluate_concurrently(agents, create_planner, args.test_episodes, args.memory_buffer, logger)
+        else:
+            episode_results = (play_episode(agent, create_planner, args.memory_buffer, logger, episode) for episode in range(1, args.test_episodes + 1))
+
+        for finished, result in enumerate(episode_results, start=1):
+            # Episodes played concurrently finish out of order, the metrics are logged in the order they finish
+            episode = finished
+            steps = result["steps"]
+            total_reward = result["return"]
+            num_actions_repeated += [result["repeated_actions"]]
+            valid_action_rates += [result["valid_action_rate"]]
+            llm_time += result["llm_time"]
+            step_time += result["step_time"]
+            if result["type_of_end"] == "win":
+                wins += 1
+                num_win_steps += [steps]
+            elif result["type_of_end"] == "detection":
+                detected += 1
+                num_detected_steps += [steps]
             else:
-                print("Invalid action: ")
-                evaluations.append(0)
-
-            try:
-                if not is_valid:
-                    memories.append(
-                        (
-                            (response_dict["action"],
-                            response_dict["parameters"]),
-                            "not valid based on your status."
-                        )
-                    )
-                    print("not valid based on your status.")
-
-                else:
-                    # This is based on the assumption that more valid actions in the state are better/more helpful.
-                    # But we could a manual evaluation based on the prior knowledge and weight the different components.
-                    # For example: finding new data is better than discovering hosts (?)
-                    if good_action:
-                        memories.append(
-                            (
-                                (response_dict["action"],
-                                response_dict["parameters"]),
-                                "helpful."
-                            )
-                        )
-                        print("Helpful")
-                    else:
-                        memories.append(
-                            (
-                                (response_dict["action"],
-                                response_dict["parameters"]),
-                                "not helpful."
-                            )
-                        )
-                        print("Not Helpful")
-                    # If the action was repeated count it
-                    if action in actions_took_in_episode:
-                        repeated_actions += 1
-
-                    # Store action in memory of all actions so far
-                    actions_took_in_episode.append(action)
-            except:
-                # if the LLM sends a response that is not properly formatted.
-                memories.append(
-                                (response_dict["action"],
-                                response_dict["parameters"]),
-                                "badly formated."
-                )
-                print("badly formated")
-            if len(memories) > args.memory_buffer:
-                # If the memory is full, remove the oldest memory
-                memories.pop(0)
-            # logger.info(f"Iteration: {i} JSON: {is_json_ok} Valid: {is_valid} Good: {good_action}")
-            logger.info(f"Iteration: {i} Valid: {is_valid} Good: {good_action}")
-            
-            if observation.end or i == (
-                num_iterations - 1
-            ):  # if it is the last iteration gather statistics
-                if i < (num_iterations - 1):
-                    # TODO: Fix this
-                    reason = observation.info
-                else:
-                    reason = {"end_reason": AgentStatus.TimeoutReached }
-
-                win = 0
-                # is_detected if boolean
-                # is_detected = observation.info.detected
-                # TODO: Fix this
-                steps = i
-                epi_last_reward = observation.reward
-                num_actions_repeated += [repeated_actions]
-                if AgentStatus.Success == reason["end_reason"]:
-                    wins += 1
-                    num_win_steps += [steps]
-                    type_of_end = "win"
-                    evaluations[-1] = 10
-                elif AgentStatus.Fail == reason["end_reason"]:
-                    detected += 1
-                    num_detected_steps += [steps]
-                    type_of_end = "detection"
-                elif AgentStatus.TimeoutReached == reason["end_reason"]:
-                    # TODO: Fix this
-                    reach_max_steps += 1
-                    type_of_end = "max_iterations"
-                    total_reward = -100
-                    #steps = observation.info["max_steps"] #this fails
-                    steps = num_iterations
-                else:
-                    reach_max_steps += 1
-                    type_of_end = "max_steps"
-                returns += [total_reward]
-                num_steps += [steps]
-
-                if not args.disable_mlflow:
-                    # Episodic value
-                    mlflow.log_metric("wins", wins, step=episode)
-                    mlflow.log_metric("num_steps", steps, step=episode)
-                    mlflow.log_metric("return", total_reward, step=episode)
-
-                    # Running metrics
-                    mlflow.log_metric("wins", wins, step=episode)
-                    mlflow.log_metric("reached_max_steps", reach_max_steps, step=episode)
-                    mlflow.log_metric("detected", detected, step=episode)
-
-                    # Running averages
-                    mlflow.log_metric("win_rate", (wins / (episode)) * 100, step=episode)
-                    mlflow.log_metric("avg_returns", np.mean(returns), step=episode)
-                    mlflow.log_metric("avg_steps", np.mean(num_steps), step=episode)
-
-                logger.info(
-                    f"\tEpisode {episode} of game ended after {steps} steps. Reason: {reason}. Last reward: {epi_last_reward}"
-                )
-                print(
-                    f"\tEpisode {episode} of game ended after {steps} steps. Reason: {reason}. Last reward: {epi_last_reward}"
-                )
-                break
-
-        episode_prompt_table = {
-            "episode": episode,
-            "state": llm_query.get_states(),
-            "prompt": llm_query.get_prompts(),
-            "response": llm_query.get_responses(),
-            "evaluation": evaluations,
-            "end_reason": str(reason["end_reason"])
-        }
-        prompt_table.append(episode_prompt_table)
-        #episode_prompt_table = pd.DataFrame(episode_prompt_table)
-        #prompt_table = pd.concat([prompt_table,episode_prompt_table],axis=0,ignore_index=True)
+                reach_max_steps += 1
+            returns += [total_reward]
+            num_steps += [steps]
+
+            if not args.disable_mlflow:
+                # Episodic value
+                mlflow.log_metric("wins", wins, step=episode)
+                mlflow.log_metric("num_steps", steps, step=episode)
+                mlflow.log_metric("return", total_reward, step=episode)
+
+                # Running metrics
+                mlflow.log_metric("wins", wins, step=episode)
+                mlflow.log_metric("reached_max_steps", reach_max_steps, step=episode)
+                mlflow.log_metric("detected", detected, step=episode)
+
+                # Running averages
+                mlflow.log_metric("win_rate", (wins / (episode)) * 100, step=episode)
+                mlflow.log_metric("avg_returns", np.mean(returns), step=episode)
+                mlflow.log_metric("avg_steps", np.mean(num_steps), step=episode)
+                mlflow.log_metric("avg_valid_action_rate", np.mean(valid_action_rates), step=episode)
+
+            prompt_table.append(result["prompt_table"])
+    finally:
+        # the records of the finished steps are kept when the evaluation fails
+        if interaction_writer is not None:
+            interaction_writer.close()
         
     #prompt_table.to_csv("states_prompts_responses_new.csv", index=False)
     # Save the JSON file
+    prompt_table.sort(key=lambda episode_prompt_table: episode_prompt_table["episode"])
     with open("episode_data.json", "w") as json_file:
         json.dump(prompt_table, json_file, indent=4)
 
@@ -378,6 +395,7 @@ if __name__ == "__main__":
     test_std_detected_steps = np.std(num_detected_steps)
     test_average_repeated_steps = np.mean(num_actions_repeated)
     test_std_repeated_steps = np.std(num_actions_repeated)
+    test_average_valid_action_rate = np.mean(valid_action_rates)
     # Store in tensorboard
     tensorboard_dict = {
         "test_avg_win_rate": test_win_rate,
@@ -393,8 +411,15 @@ if __name__ == "__main__":
         "test_std_detected_steps": test_std_detected_steps,
         "test_avg_repeated_steps": test_average_repeated_steps,
         "test_std_repeated_steps": test_std_repeated_steps,
+        "test_avg_valid_action_rate": test_average_valid_action_rate,
+        "test_llm_time": llm_time,
+        "test_planner_overhead_time": step_time - llm_time,
     }
 
+    if response_cache is not None:
+        tensorboard_dict.update(response_cache.stats())
+        response_cache.close()
+
     if not args.disable_mlflow:
         mlflow.log_metrics(tensorboard_dict)
 
@@ -408,7 +433,12 @@ if __name__ == "__main__":
         average_episode_steps={test_average_episode_steps:.3f} +- {test_std_episode_steps:.3f},
         average_win_steps={test_average_win_steps:.3f} +- {test_std_win_steps:.3f},
         average_detected_steps={test_average_detected_steps:.3f} +- {test_std_detected_steps:.3f}
-        average_repeated_steps={test_average_repeated_steps:.3f} += {test_std_repeated_steps:.3f}"""
+        average_repeated_steps={test_average_repeated_steps:.3f} += {test_std_repeated_steps:.3f},
+        average_valid_action_rate={test_average_valid_action_rate:.3f},
+        planner_time={step_time:.3f}s of which waiting for the LLM={llm_time:.3f}s"""
+    if response_cache is not None:
+        text += f""",
+        llm_cache_hits={response_cache.hits}, llm_cache_misses={response_cache.misses}"""
 
     print(text)
     logger.info(text)
@@ -0,0 +1,62 @@
+"""
+@file prompt_builder.py
+
+@brief Construction of the message lists of the LLM action planner with a layout friendly to prefix caching.
+
+The prompts keep the messages of the former planner in the same order:
+    stage 1: instructions, status, memory, question 1
+    stage 2: instructions, status, CoT examples, stage 1 response, memory, question 4
+No message is reordered. The instructions are byte-identical for the whole episode and the status is
+rendered incrementally, so its text changes only where the state changed, and both stages of a step
+share the instructions and the status. Local inference servers which reuse the KV cache of a common
+prefix (e.g. Ollama, vLLM, llama.cpp) then only process the part of the prompt after the first change.
+"""
+
+import sys
+from os import path
+
+sys.path.append(path.dirname(path.dirname(path.dirname(path.dirname(path.dirname(path.abspath(__file__)))))))
+
+from NetSecGameAgents.agents.llm_utils import IncrementalStatus, summarize_state
+
+
+class PromptBuilder:
+    """Builds the stage 1 and stage 2 prompts from the instructions, the messages of the step and the stage question."""
+
+    def __init__(self, instructions: str, cot_prompt: str, status_token_budget: int = None):
+        self._instructions = {"role": "user", "content": instructions}
+        self._cot = {"role": "user", "content": cot_prompt}
+        self._status = IncrementalStatus()
+        # with a budget, the status is summarized to at most this number of tokens (if possible)
+        self.status_token_budget = status_token_budget
+        self.status_prompt = ""
+        self.status_tokens = None
+        self.memory_prompt = ""
+
+    def update(self, state, memory_prompt: str) -> str:
+        """Sets the messages of the current step and returns the status prompt of the state"""
+        if self.status_token_budget is None:
+            self.status_prompt = self._status.update(state)
+        else:
+            self.status_prompt, self.status_tokens = summarize_state(state, self.status_token_budget)
+        self.memory_prompt = memory_prompt
+        return self.status_prompt
+
+    def stage1(self, question: str) -> list:
+        return [
+            self._instructions,
+            {"role": "user", "content": self.status_prompt},
+            {"role": "user", "content": self.memory_prompt},
+            {"role": "user", "content": question},
+        ]
+
+    def stage2(self, reasoning: str, question: str) -> list:
+        """The stage 2 prompt shares the instructions and the status with the stage 1 prompt of the step"""
+        return [
+            self._instructions,
+            {"role": "user", "content": self.status_prompt},
+            self._cot,
+            {"role": "user", "content": reasoning},
+            {"role": "user", "content": self.memory_prompt},
+            {"role": "user", "content": question},
+        ]
@@ -0,0 +1,84 @@
+"""
+@file response_cache.py
+
+@brief Persistent prompt-to-response cache for the LLM action planner.
+
+The responses are stored in a SQLite database keyed by the SHA-256 hash of the request
+(model, messages, temperature, response format and max_tokens). Only deterministic requests
+(temperature 0) should be cached, otherwise repeated sampling would always return the same response.
+get_cache returns one cache per database path, opened on its first use in the process.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from os import path, makedirs
+
+
+class ResponseCache:
+    """SQLite cache of LLM responses with hit/miss counters. Safe to share between threads."""
+
+    def __init__(self, db_path: str = "llm_cache.sqlite"):
+        if path.dirname(db_path):
+            makedirs(path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, fmt: dict = None, max_tokens: int = None) -> str:
+        request = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "format": fmt,
+            "max_tokens": max_tokens,
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached response or None, and counts the hit or miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = None) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, model, response) VALUES (?, ?, ?)", (key, model, response))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        with _caches_lock:
+            if _caches.get(self.db_path) is self:
+                del _caches[self.db_path]
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_path: str) -> ResponseCache:
+    """Returns the ResponseCache of the database path shared in the process, opening it on the first call."""
+    with _caches_lock:
+        if db_path not in _caches:
+            _caches[db_path] = ResponseCache(db_path)
+        return _caches[db_path]
@@ -0,0 +1,42 @@
+import threading
+import unittest
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from batched_evaluation import QueryDeduplicator
+from NetSecGameAgents.agents.llm_backends import StubBackend
+
+REQUEST = {"model": "stub-model", "messages": [{"role": "user", "content": "List the objects"}], "max_tokens": 10}
+
+
+class TestQueryDeduplicator(unittest.TestCase):
+    def create_concurrently(self, deduplicator, client, request, num_threads=3):
+        responses = [None] * num_threads
+
+        def query(i):
+            responses[i] = deduplicator.create(client, **request)
+
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_identical_deterministic_requests_sent_once(self):
+        """Test that identical requests at temperature 0 in flight together share one response, sampled ones do not"""
+        client = StubBackend(responses=["first", "second", "third"], latency=0.1)
+        deduplicator = QueryDeduplicator()
+        responses = self.create_concurrently(deduplicator, client, dict(REQUEST, temperature=0))
+        self.assertEqual(client.num_requests, 1)
+        self.assertEqual(len({id(response) for response in responses}), 1)
+        responses = self.create_concurrently(deduplicator, client, dict(REQUEST, temperature=0.7))
+        self.assertEqual(client.num_requests, 4)
+        self.assertEqual((deduplicator.num_requests, deduplicator.num_sent), (6, 4))
+        # the finished request is not in flight anymore
+        deduplicator.create(client, **dict(REQUEST, temperature=0))
+        self.assertEqual(client.num_requests, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
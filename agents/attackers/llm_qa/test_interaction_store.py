@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from AIDojoCoordinator.game_components import GameState, IP, Network, Observation, Service
+from interaction_store import InteractionWriter, read_interactions, replay_interactions
+
+llm_action_planner = pytest.importorskip("llm_action_planner")
+from NetSecGameAgents.agents.llm_backends import StubBackend, load_stub_responses
+
+CONFIG = {
+    "prompts": {"INSTRUCTIONS_TEMPLATE": "You are a pentester. Your goal is {{goal}}.", "COT_PROMPT": "Example reasoning."},
+    "questions": [{"text": "List the objects in the current status and the actions they can be used."}, {"text": ""}, {"text": ""},
+                  {"text": "Provide the best next action in the correct JSON format."}],
+}
+
+
+def respond(request: dict) -> str:
+    """Stage 1 reasoning, or a stage 2 action: a scan of the last known network from the first controlled host"""
+    status = request["messages"][1]["content"]
+    if request["response_format"]["type"] == "text":
+        return f"reasoning about {len(status)} characters of status"
+    controlled = status.split("Controlled hosts are ")[1].split("\n")[0].split(" and ")[0]
+    network = status.split("Known networks are ")[1].split("\n")[0].split(" and ")[-1]
+    return json.dumps({"action": "ScanNetwork", "parameters": {"target_network": network, "source_host": controlled}})
+
+
+def states():
+    networks = [Network("192.168.1.0", 24)]
+    hosts = {IP("192.168.1.2")}
+    for i in range(3):
+        networks.append(Network(f"192.168.{i + 2}.0", 24))
+        hosts.add(IP(f"192.168.1.{i + 3}"))
+        yield GameState(controlled_hosts={IP("192.168.1.2")}, known_hosts=set(hosts), known_networks=set(networks),
+                        known_services={IP("192.168.1.3"): {Service("ssh", "passive", "8.1.0", False)}})
+
+
+class TestInteractionStore(unittest.TestCase):
+    def create_planner(self, client, writer=None):
+        return lambda goal: llm_action_planner.LLMActionPlanner("stub-model", goal, config=CONFIG, use_cache=False, client=client, interaction_writer=writer)
+
+    def record_episode(self, store:str) -> list:
+        """Plays the states with a planner streaming its steps to the store, returns the actions"""
+        actions = []
+        with InteractionWriter(store) as writer:
+            planner = self.create_planner(StubBackend(responses=respond), writer)("reach the data")
+            planner.episode = 1
+            memories = []
+            for state in states():
+                valid, response_dict, _ = planner.get_action_from_obs_react(Observation(state, 0, False, {}), memories)
+                actions.append(response_dict)
+                memories.append(((response_dict["action"], response_dict["parameters"]), "helpful." if valid else "not valid based on your status."))
+        return actions
+
+    def test_write_read_replay(self):
+        """Test that the recorded steps are read back and replayed with the recorded responses"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for store in (os.path.join(tmp, "run.jsonl"), os.path.join(tmp, "run.jsonl.gz")):
+                actions = self.record_episode(store)
+                records = list(read_interactions(store))
+                self.assertEqual([record["step"] for record in records], [0, 1, 2])
+                self.assertEqual([record["action"] for record in records], actions)
+                self.assertTrue(all(record["valid"] for record in records))
+                self.assertEqual([len(record["queries"]) for record in records], [2, 2, 2])
+                self.assertEqual(len({record["run"] for record in records}), 1)
+
+                client = StubBackend(**load_stub_responses(store))
+                stats = replay_interactions(store, self.create_planner(client))
+                self.assertEqual(stats, {"steps": 3, "valid": 3, "recorded_valid": 3, "same_action": 3})
+                self.assertEqual(client.num_replayed, 6)
+                self.assertEqual(client.num_requests, 6)
+
+    def test_truncated_store(self):
+        """Test that the store of an interrupted run is read up to its last complete record"""
+        with tempfile.TemporaryDirectory() as tmp:
+            for store in (os.path.join(tmp, "run.jsonl"), os.path.join(tmp, "run.jsonl.gz")):
+                with InteractionWriter(store) as writer:
+                    for step in range(200):
+                        writer.write({"episode": 1, "step": step, "queries": [{"prompt": [{"role": "user", "content": f"prompt {step}"}], "response": str(step)}]})
+                with open(store, "rb") as f:
+                    content = f.read()
+                with open(store, "wb") as f:
+                    f.write(content[:len(content) * 2 // 3])
+                steps = [record["step"] for record in read_interactions(store)]
+                self.assertGreater(len(steps), 0)
+                self.assertEqual(steps, list(range(len(steps))))
+                self.assertEqual(len(load_stub_responses(store)["replay"]), len(steps))
+
+
+if __name__ == '__main__':
+    unittest.main()
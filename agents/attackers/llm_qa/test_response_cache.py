@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import unittest
+from response_cache import ResponseCache, get_cache
+
+MESSAGES = [{"role": "system", "content": "instructions"}, {"role": "user", "content": "status"}]
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_stability(self):
+        """Test that the key depends only on the content of the request"""
+        key = ResponseCache.make_key("model", MESSAGES, 0.0, {"type": "text"}, 60)
+        self.assertEqual(key, ResponseCache.make_key("model", [dict(reversed(m.items())) for m in MESSAGES], 0.0, {"type": "text"}, 60))
+        for other in (ResponseCache.make_key("other", MESSAGES, 0.0, {"type": "text"}, 60),
+                      ResponseCache.make_key("model", MESSAGES[1:], 0.0, {"type": "text"}, 60),
+                      ResponseCache.make_key("model", MESSAGES, 0.5, {"type": "text"}, 60),
+                      ResponseCache.make_key("model", MESSAGES, 0.0, {"type": "json_object"}, 60),
+                      ResponseCache.make_key("model", MESSAGES, 0.0, {"type": "text"}, 100)):
+            self.assertNotEqual(key, other)
+
+    def test_hits_and_misses(self):
+        """Test that the responses are stored across connections and the lookups are counted"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "cache", "llm_cache.sqlite")
+            cache = ResponseCache(db_path)
+            key = ResponseCache.make_key("model", MESSAGES, 0.0)
+            self.assertIsNone(cache.get(key))
+            cache.put(key, "response", "model")
+            self.assertEqual(cache.get(key), "response")
+            self.assertEqual(cache.stats(), {"cache_hits": 1, "cache_misses": 1, "cache_hit_rate": 0.5})
+            cache.close()
+            cache = ResponseCache(db_path)
+            self.assertEqual(cache.get(key), "response")
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            cache.close()
+
+    def test_shared_between_threads(self):
+        """Test that one cache is shared per path and can be used from several threads"""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "llm_cache.sqlite")
+            cache = get_cache(db_path)
+            self.assertIs(get_cache(db_path), cache)
+            self.assertIsNot(get_cache(os.path.join(tmp, "other.sqlite")), cache)
+
+            def worker(i):
+                shared = get_cache(db_path)
+                for j in range(20):
+                    key = ResponseCache.make_key("model", [{"role": "user", "content": str(j)}], 0.0)
+                    if shared.get(key) is None:
+                        shared.put(key, str(j), "model")
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(cache.hits + cache.misses, 8 * 20)
+            for j in range(20):
+                self.assertEqual(cache.get(ResponseCache.make_key("model", [{"role": "user", "content": str(j)}], 0.0)), str(j))
+            cache.close()
+            get_cache(os.path.join(tmp, "other.sqlite")).close()
+            self.assertIsNot(get_cache(db_path), cache)
+            get_cache(db_path).close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import json
+import unittest
+from unittest import mock
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from AIDojoCoordinator.game_components import ActionType, GameState, IP, Network, Service, Data
+from validate_responses import ValidActionIndex
+
+llm_action_planner = pytest.importorskip("llm_action_planner")
+from NetSecGameAgents.agents.agent_utils import generate_valid_actions
+from NetSecGameAgents.agents.llm_utils import validate_action_in_state
+from NetSecGameAgents.agents.llm_backends import StubBackend
+
+FIND_DATA = {"action": "FindData", "parameters": {"target_host": "192.168.1.2", "source_host": "192.168.1.2"}}
+# exploit of a controlled host: generated as valid, but rejected by the rules of the response validation
+EXPLOIT_CONTROLLED = {"action": "ExploitService", "parameters": {"target_host": "192.168.1.2", "target_service": "http", "source_host": "213.47.23.195"}}
+
+
+def game_state() -> GameState:
+    return GameState(
+        controlled_hosts={IP("192.168.1.2"), IP("213.47.23.195")},
+        known_hosts={IP("192.168.1.2"), IP("192.168.1.3"), IP("213.47.23.195")},
+        known_networks={Network("192.168.1.0", 24)},
+        known_services={IP("192.168.1.3"): {Service("ssh", "passive", "8.1.0", False)}, IP("192.168.1.2"): {Service("http", "passive", "2.4", False)}},
+        known_data={IP("192.168.1.2"): {Data("User1", "DataA")}},
+    )
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+class SchemaFailingBackend(StubBackend):
+    """StubBackend raising the error for every request constrained by a JSON schema"""
+
+    def __init__(self, error: Exception):
+        super().__init__(responses=[json.dumps(FIND_DATA)])
+        self.error = error
+        self.num_schema_requests = 0
+        create = self.chat.completions.create
+
+        def create_or_fail(**request):
+            if (request.get("response_format") or {}).get("type") == "json_schema":
+                self.num_schema_requests += 1
+                raise self.error
+            return create(**request)
+
+        self.chat.completions.create = create_or_fail
+
+
+class TestValidActionIndex(unittest.TestCase):
+    def setUp(self):
+        self.state = game_state()
+        self.index = ValidActionIndex(generate_valid_actions(self.state))
+
+    def test_lookup(self):
+        """Test that the responses of valid actions return their action, in any spelling of the type or the service"""
+        action = self.index.lookup({"action": "ScanNetwork", "parameters": {"target_network": "192.168.1.0/24", "source_host": "192.168.1.2"}})
+        self.assertEqual((action.type, str(action.parameters["target_network"])), (ActionType.ScanNetwork, "192.168.1.0/24"))
+        for name in ("ScanServices", "FindServices"):
+            action = self.index.lookup({"action": name, "parameters": {"target_host": "192.168.1.3", "source_host": "192.168.1.2"}})
+            self.assertEqual(action.type, ActionType.FindServices)
+        action = self.index.lookup({"action": "ExploitService", "parameters": {"target_host": "192.168.1.3", "target_service": "SSH", "source_host": "192.168.1.2"}})
+        self.assertEqual(action.parameters["target_service"].name, "ssh")
+        action = self.index.lookup({"action": "ExfiltrateData", "parameters": {"target_host": "213.47.23.195", "source_host": "192.168.1.2", "data": {"owner": "User1", "id": "DataA"}}})
+        self.assertEqual(action.type, ActionType.ExfiltrateData)
+        # unknown host, unknown type, malformed responses
+        self.assertIsNone(self.index.lookup({"action": "FindData", "parameters": {"target_host": "192.168.1.3", "source_host": "192.168.1.3"}}))
+        self.assertIsNone(self.index.lookup({"action": "BlockIP", "parameters": {"target_host": "192.168.1.3", "source_host": "192.168.1.2"}}))
+        self.assertIsNone(self.index.lookup({"action": "ExfiltrateData", "parameters": {"target_host": "213.47.23.195", "source_host": "192.168.1.2", "data": "DataA"}}))
+        self.assertIsNone(self.index.lookup({"action": "FindData"}))
+        # actions rejected by accepts are not indexed
+        self.assertIsNotNone(self.index.lookup(EXPLOIT_CONTROLLED))
+        index = ValidActionIndex(generate_valid_actions(self.state), accepts=lambda response: validate_action_in_state(response, self.state))
+        self.assertIsNone(index.lookup(EXPLOIT_CONTROLLED))
+        self.assertIsNotNone(index.lookup(FIND_DATA))
+
+    def test_json_schema(self):
+        """Test that the schema has one variant per action type, restricted to the values of the valid actions"""
+        variants = {variant["properties"]["action"]["const"]: variant for variant in self.index.json_schema()["anyOf"]}
+        self.assertEqual(set(variants), {"ScanNetwork", "ScanServices", "ExploitService", "FindData", "ExfiltrateData"})
+        parameters = variants["ExploitService"]["properties"]["parameters"]
+        self.assertEqual(set(parameters["required"]), {"target_host", "target_service", "source_host"})
+        self.assertEqual(parameters["properties"]["target_service"]["enum"], ["http", "ssh"])
+        self.assertEqual(variants["ScanNetwork"]["properties"]["parameters"]["properties"]["target_network"]["enum"], ["192.168.1.0/24"])
+        data = variants["ExfiltrateData"]["properties"]["parameters"]["properties"]["data"]
+        self.assertEqual((data["properties"]["owner"]["enum"], data["properties"]["id"]["enum"]), (["User1"], ["DataA"]))
+        self.assertEqual(self.index.response_format()["json_schema"]["schema"], self.index.json_schema())
+        self.assertIsNone(ValidActionIndex([]).response_format())
+
+
+class TestConstrainedDecoding(unittest.TestCase):
+    def planner(self, client) -> "llm_action_planner.LLMActionPlanner":
+        planner = llm_action_planner.LLMActionPlanner("stub-model", "reach the data", use_cache=False, use_constrained_decoding=True, client=client)
+        planner.valid_action_index = ValidActionIndex(generate_valid_actions(game_state()))
+        return planner
+
+    def test_fallback_to_json_mode(self):
+        """Test that a rejected schema is sent once before falling back to JSON mode, and a transient error is retried and raised"""
+        client = SchemaFailingBackend(StatusError(400))
+        planner = self.planner(client)
+        self.assertEqual(json.loads(planner.query_action([{"role": "user", "content": "Next action?"}])), FIND_DATA)
+        self.assertEqual((client.num_schema_requests, planner.supports_json_schema), (1, False))
+        planner.query_action([{"role": "user", "content": "Next action?"}])
+        self.assertEqual(client.num_schema_requests, 1)
+
+        client = SchemaFailingBackend(TimeoutError("Request timed out"))
+        planner = self.planner(client)
+        with self.assertRaises(Exception):
+            planner.query_action([{"role": "user", "content": "Next action?"}])
+        self.assertEqual((client.num_schema_requests, planner.supports_json_schema), (3, None))
+
+    def test_parse_response_lookup(self):
+        """Test that an indexed response is valid without the rule check, and other responses are checked by the rules"""
+        state = game_state()
+        planner = self.planner(StubBackend())
+        with mock.patch.object(llm_action_planner, "create_action_from_response", wraps=llm_action_planner.create_action_from_response) as rules:
+            valid, response_dict, action = planner.parse_response(json.dumps(FIND_DATA), state)
+            self.assertTrue(valid)
+            self.assertEqual(action.type, ActionType.FindData)
+            self.assertEqual(rules.call_count, 0)
+            # an unknown network is not in the index
+            valid, _, action = planner.parse_response(json.dumps({"action": "ScanNetwork", "parameters": {"target_network": "192.168.5.0/24", "source_host": "192.168.1.2"}}), state)
+            self.assertFalse(valid)
+            self.assertEqual(rules.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -136,3 +136,107 @@ def validate_agent_response(raw_response: str) -> tuple[dict | None, str | None]
 
     except json.JSONDecodeError as e:
         return None, f"Error: Invalid JSON format. {e}"
+
+
+# Names of the action types in the LLM responses
+ACTION_NAMES = {
+    "ActionType.ScanNetwork": "ScanNetwork",
+    "ActionType.FindServices": "ScanServices",
+    "ActionType.ExploitService": "ExploitService",
+    "ActionType.FindData": "FindData",
+    "ActionType.ExfiltrateData": "ExfiltrateData",
+}
+
+
+def _response_key(action: str, parameters: dict) -> tuple:
+    """Canonical key of the action in a response (parameters as strings)"""
+    if action == "FindServices":
+        action = "ScanServices"
+    if action == "ExfiltrateData":
+        data = parameters["data"]
+        return (action, str(parameters["target_host"]), str(parameters["source_host"]), str(data["owner"]), str(data["id"]))
+    if action == "ExploitService":
+        return (action, str(parameters["target_host"]), str(parameters["target_service"]).lower(), str(parameters["source_host"]))
+    if action == "ScanNetwork":
+        return (action, str(parameters["target_network"]), str(parameters["source_host"]))
+    return (action, str(parameters["target_host"]), str(parameters["source_host"]))
+
+
+def _action_response(action) -> tuple:
+    """Name and parameters of a valid Action as they appear in the responses"""
+    name = ACTION_NAMES.get(str(action.type))
+    params = action.parameters
+    if name == "ExfiltrateData":
+        parameters = {"target_host": str(params["target_host"]), "source_host": str(params["source_host"]),
+                      "data": {"owner": str(params["data"].owner), "id": str(params["data"].id)}}
+    elif name == "ExploitService":
+        parameters = {"target_host": str(params["target_host"]), "target_service": params["target_service"].name,
+                      "source_host": str(params["source_host"])}
+    elif name == "ScanNetwork":
+        parameters = {"target_network": str(params["target_network"]), "source_host": str(params["source_host"])}
+    else:
+        parameters = {"target_host": str(params["target_host"]), "source_host": str(params["source_host"])}
+    return name, parameters
+
+
+class ValidActionIndex:
+    """
+    Lookup of the valid actions of a state by their response. Validates a response and
+    builds its action with one dictionary lookup, without evaluating the parameters.
+    Actions whose response is rejected by accepts(response) are left out.
+    """
+
+    def __init__(self, valid_actions, accepts=None):
+        self._actions = {}
+        self._parameters = {}
+        for action in valid_actions:
+            name, parameters = _action_response(action)
+            if name is None or (accepts is not None and not accepts({"action": name, "parameters": parameters})):
+                continue
+            self._actions.setdefault(_response_key(name, parameters), action)
+            self._parameters.setdefault(name, []).append(parameters)
+
+    def lookup(self, response: dict):
+        """Returns the valid action of the response or None"""
+        try:
+            return self._actions.get(_response_key(response["action"], response["parameters"]))
+        except (KeyError, TypeError, AttributeError):
+            return None
+
+    def json_schema(self) -> dict:
+        """
+        JSON schema of the responses restricted to the valid actions: one variant per valid action type,
+        with the action fixed to the type and every parameter one of the values it has in the valid actions of the type.
+        """
+        variants = []
+        for name, parameter_list in self._parameters.items():
+            properties = {}
+            for key in parameter_list[0]:
+                if key == "data":
+                    properties[key] = {
+                        "type": "object",
+                        "properties": {
+                            "owner": {"enum": sorted({p["data"]["owner"] for p in parameter_list})},
+                            "id": {"enum": sorted({p["data"]["id"] for p in parameter_list})},
+                        },
+                        "required": ["owner", "id"],
+                        "additionalProperties": False,
+                    }
+                else:
+                    properties[key] = {"enum": sorted({p[key] for p in parameter_list})}
+            variants.append({
+                "type": "object",
+                "properties": {
+                    "action": {"const": name},
+                    "parameters": {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False},
+                },
+                "required": ["action", "parameters"],
+                "additionalProperties": False,
+            })
+        return {"type": "object", "anyOf": variants}
+
+    def response_format(self) -> dict:
+        """response_format of a chat completion constrained to the valid actions (None without valid actions)"""
+        if not self._parameters:
+            return None
+        return {"type": "json_schema", "json_schema": {"name": "action", "schema": self.json_schema()}}
@@ -0,0 +1,177 @@
+"""
+Per-step action sampling of the MarkovChainAgent.
+
+The action type is sampled in O(1) from a Walker alias table of the transition row of the last
+action type (or of the context of a higher-order transition model). The valid actions of every type are kept in ValidActionSets, which is updated
+with only the elements added to the state since the previous step.
+"""
+import random
+import numpy as np
+
+from AIDojoCoordinator.game_components import Action, ActionType
+
+# Order of the action types in the transition probabilities
+ACTION_TYPES = [
+    ActionType.ScanNetwork,
+    ActionType.FindServices,
+    ActionType.ExploitService,
+    ActionType.FindData,
+    ActionType.ExfiltrateData,
+]
+
+
+class AliasTable:
+    """Walker alias table (Vose's construction) for O(1) sampling from a discrete distribution"""
+
+    def __init__(self, probabilities) -> None:
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        total = probabilities.sum()
+        if total <= 0:
+            raise ValueError("Probabilities must have a positive sum")
+        n = len(probabilities)
+        scaled = probabilities * n / total
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # leftovers are 1 up to rounding errors
+        self.probabilities = probabilities / total
+        self._prob = prob.tolist()
+        self._alias = alias.tolist()
+        self._n = n
+
+    def sample(self, rng=random) -> int:
+        i = int(rng.random() * self._n)
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+class _RandomAccessSet:
+    """Set with O(1) add and uniform random choice"""
+
+    def __init__(self) -> None:
+        self._items = []
+        self._index = {}
+
+    def add(self, item) -> None:
+        if item not in self._index:
+            self._index[item] = len(self._items)
+            self._items.append(item)
+
+    def choice(self, rng=random):
+        return self._items[int(rng.random() * len(self._items))]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+class ValidActionSets:
+    """
+    Valid actions of each type (in the order of ACTION_TYPES) with the rules of
+    MarkovChainAgent.generate_valid_actions_separated. The sets are updated incrementally
+    while the state only grows; when an element disappears from the state they are rebuilt.
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.by_type = [_RandomAccessSet() for _ in ACTION_TYPES]
+        self._networks = set()
+        self._hosts = set()
+        self._controlled = set()
+        self._services = set()
+        self._data = set()
+
+    def update(self, state) -> None:
+        networks = set(state.known_networks)
+        hosts = set(state.known_hosts)
+        controlled = set(state.controlled_hosts)
+        services = {(host, service) for host, service_list in state.known_services.items() for service in service_list}
+        data = {(host, item) for host, data_list in state.known_data.items() for item in data_list}
+        if not (self._networks <= networks and self._hosts <= hosts and self._controlled <= controlled
+                and self._services <= services and self._data <= data):
+            self.reset()
+        new_networks, new_hosts, new_controlled = networks - self._networks, hosts - self._hosts, controlled - self._controlled
+        new_services, new_data = services - self._services, data - self._data
+        self._networks, self._hosts, self._controlled, self._services, self._data = networks, hosts, controlled, services, data
+
+        scan_network, find_services, exploit_service, find_data, exfiltrate_data = self.by_type
+        # actions from the newly controlled hosts
+        for src_host in new_controlled:
+            for network in networks:
+                scan_network.add(Action(ActionType.ScanNetwork, {"target_network": network, "source_host": src_host}))
+            for host in hosts:
+                find_services.add(Action(ActionType.FindServices, {"target_host": host, "source_host": src_host}))
+            for host, service in services:
+                exploit_service.add(Action(ActionType.ExploitService, {"target_host": host, "target_service": service, "source_host": src_host}))
+            find_data.add(Action(ActionType.FindData, {"target_host": src_host, "source_host": src_host}))
+            for host, item in data:
+                if host != src_host:
+                    exfiltrate_data.add(Action(ActionType.ExfiltrateData, {"target_host": src_host, "source_host": host, "data": item}))
+        # actions on the new elements from the already controlled hosts
+        old_controlled = controlled - new_controlled
+        for src_host in old_controlled:
+            for network in new_networks:
+                scan_network.add(Action(ActionType.ScanNetwork, {"target_network": network, "source_host": src_host}))
+            for host in new_hosts:
+                find_services.add(Action(ActionType.FindServices, {"target_host": host, "source_host": src_host}))
+            for host, service in new_services:
+                exploit_service.add(Action(ActionType.ExploitService, {"target_host": host, "target_service": service, "source_host": src_host}))
+            for host, item in new_data:
+                if host != src_host:
+                    exfiltrate_data.add(Action(ActionType.ExfiltrateData, {"target_host": src_host, "source_host": host, "data": item}))
+
+
+class MarkovActionSampler:
+    """
+    Samples the next action: the action type from the alias table of the transition row of the
+    key (last action type or "Initial"), then an action uniformly among the valid actions of that type.
+    """
+
+    def __init__(self, transitions:dict, rng=random) -> None:
+        for key, probabilities in transitions.items():
+            if len(probabilities) != len(ACTION_TYPES):
+                raise ValueError(f"Mismatch between number of action groups ({len(ACTION_TYPES)}) and "
+                                 f"provided probabilities ({len(probabilities)}) for {key}.")
+        # rows without any probability cannot be sampled (as with the former numpy sampling)
+        self._tables = {key: AliasTable(probabilities) for key, probabilities in transitions.items() if sum(probabilities) > 0}
+        self._rng = rng
+        self.valid_actions = ValidActionSets()
+
+    def reset(self, state) -> None:
+        """Starts a new episode in the given state"""
+        self.valid_actions.reset()
+        self.valid_actions.update(state)
+
+    def update(self, state) -> None:
+        self.valid_actions.update(state)
+
+    def sample(self, key, max_rejections:int=8, probabilities=None) -> Action:
+        """
+        Samples an action from the row of the key. Rows of keys without a table (e.g. contexts of a
+        higher-order transition model) are built from the given probabilities on their first use.
+        """
+        if key not in self._tables and probabilities is not None and sum(probabilities) > 0:
+            self._tables[key] = AliasTable(probabilities)
+        if key not in self._tables:
+            raise ValueError(f"Transition probabilities for key {key} not found or all zero.")
+        table = self._tables[key]
+        by_type = self.valid_actions.by_type
+        for _ in range(max_rejections):
+            actions = by_type[table.sample(self._rng)]
+            if len(actions):
+                return actions.choice(self._rng)
+        # the sampled types had no valid actions: sample among the types which have some
+        weights = np.array([p if len(actions) else 0.0 for p, actions in zip(table.probabilities, by_type)])
+        if weights.sum() <= 0:
+            raise ValueError(f"No valid action of the types with positive probability for {key}.")
+        return by_type[AliasTable(weights).sample(self._rng)].choice(self._rng)
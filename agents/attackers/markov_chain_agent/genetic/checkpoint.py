@@ -0,0 +1,76 @@
+"""
+Checkpoints and metrics files of the GeneticAgent runs.
+
+A checkpoint stores the population of the last completed generation, its fitness, the generation
+counter, the state of the random generator and the sizes of the metrics files at that point.
+Resuming truncates the metrics files to these sizes, so the rows of the generations played after
+the checkpoint are written only once.
+"""
+import csv
+import json
+import os
+from os import path
+import numpy as np
+
+
+def save_checkpoint(filename, population, scores, generation, rng, metrics_sizes=None, finished=False):
+    """
+    Stores the population (genomes), their fitness tuples, the generation counter, the state
+    of the random generator and the sizes of the metrics files (see MetricsWriter.sizes()).
+    finished marks the checkpoint of a completed run. The file is replaced atomically,
+    so a crash never leaves a partial checkpoint.
+    """
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        np.savez(f, population=population, scores=scores, generation=generation, rng_state=json.dumps(rng.bit_generator.state),
+                 metrics_sizes=np.array(metrics_sizes if metrics_sizes is not None else [], dtype=np.int64), finished=finished)
+    os.replace(tmp_filename, filename)
+
+
+def load_checkpoint(filename, rng):
+    """
+    Returns (population, scores, generation, metrics_sizes, finished) stored by save_checkpoint and restores
+    the state of rng. metrics_sizes is None for checkpoints without them.
+    """
+    with np.load(filename) as data:
+        rng.bit_generator.state = json.loads(str(data["rng_state"]))
+        metrics_sizes = data["metrics_sizes"].tolist() if "metrics_sizes" in data and len(data["metrics_sizes"]) else None
+        finished = bool(data["finished"]) if "finished" in data else False
+        return data["population"], data["scores"], int(data["generation"]), metrics_sizes, finished
+
+
+class MetricsWriter:
+    """
+    Buffered CSV writers of the best, mean and std fitness tuples of every generation,
+    kept open for the whole run. With sizes (of a checkpoint), the files are first truncated
+    to them, dropping the rows written after the checkpoint.
+    """
+    FILENAMES = ("best_scores.csv", "metrics_mean.csv", "metrics_std.csv")
+
+    def __init__(self, path_results, sizes=None):
+        filenames = [path.join(path_results, filename) for filename in self.FILENAMES]
+        if sizes is not None:
+            for filename, size in zip(filenames, sizes):
+                if path.exists(filename) and path.getsize(filename) > size:
+                    with open(filename, "r+b") as f:
+                        f.truncate(size)
+        self._files = [open(filename, 'a', newline='') for filename in filenames]
+        self._writers = [csv.writer(f) for f in self._files]
+
+    def write(self, best_scores, metrics_mean, metrics_std):
+        for writer_csv, row in zip(self._writers, (best_scores, metrics_mean, metrics_std)):
+            writer_csv.writerow(row)
+
+    def flush(self):
+        for f in self._files:
+            f.flush()
+
+    def sizes(self) -> list:
+        """Flushes the files and returns their sizes in bytes"""
+        self.flush()
+        return [path.getsize(f.name) for f in self._files]
+
+    def close(self):
+        for f in self._files:
+            if not f.closed:
+                f.close()
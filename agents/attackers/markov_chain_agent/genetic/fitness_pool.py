@@ -0,0 +1,133 @@
+"""
+Parallel fitness evaluation of the GeneticAgent populations.
+
+The pool only uses the evaluation interface of the GeneticAgent (register, evaluate_individual,
+parsed_population, surrogate, ...), so it does not depend on the environment.
+"""
+import multiprocessing
+from multiprocessing.util import Finalize
+import numpy as np
+
+
+class FitnessCache:
+    """
+    Fitness tuples of already evaluated individuals keyed by their genome (sequence of action indices).
+    Assumes a deterministic environment: the same sequence always gets the same fitness.
+    """
+
+    def __init__(self):
+        self._scores = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(genome):
+        return genome.tobytes()
+
+    def get(self, key):
+        scores = self._scores.get(key)
+        if scores is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return scores
+
+    def put(self, key, scores):
+        self._scores[key] = scores
+
+    def __len__(self):
+        return len(self._scores)
+
+
+# Agent of the fitness evaluation worker process and the list of all actions, created in _init_fitness_worker
+_worker_agent = None
+_worker_actions = None
+
+def _init_fitness_worker(agent_class, role, host, port_queue, all_actions, prefix_sharing, surrogate):
+    """Creates and registers the agent of the worker process with its own coordinator connection"""
+    global _worker_agent, _worker_actions
+    _worker_actions = all_actions
+    _worker_agent = agent_class(host, port_queue.get(), role)
+    if prefix_sharing:
+        _worker_agent.enable_prefix_sharing()
+    if surrogate:
+        _worker_agent.enable_surrogate(all_actions)
+    _worker_agent.register()
+    # disconnect when the worker exits
+    Finalize(_worker_agent, _worker_agent.terminate_connection, exitpriority=10)
+
+def _evaluate_in_worker(task):
+    genome, is_final_generation = task
+    scores = _worker_agent.evaluate_individual([_worker_actions[idx] for idx in genome], is_final_generation)
+    parsed_individuals = _worker_agent.parsed_population
+    _worker_agent.parsed_population = []
+    surrogate_updates = _worker_agent.surrogate.pop_updates() if _worker_agent.surrogate is not None else None
+    return scores, parsed_individuals, surrogate_updates
+
+
+class FitnessEvaluationPool:
+    """
+    Evaluates the fitness of a whole population of genomes (rows of indices into all_actions)
+    spread over worker processes.
+    Each worker has its own agent (of the class and role of the given agent) connected to the
+    coordinator; the ports are assigned to the workers round-robin. With one worker, the individuals are evaluated serially
+    by the given agent over its own connection.
+
+    With fitness_cache, individuals already evaluated (e.g. survivors of the previous generation,
+    or children equal to their parents) are not played again. With prefix_sharing, every evaluating
+    agent keeps a PrefixTrie. With surrogate, every evaluating agent learns a SurrogateModel and
+    the models of the workers are merged into the one of the given agent. All of them assume a
+    deterministic environment.
+    """
+
+    def __init__(self, agent, host, ports, all_actions, num_workers=1, fitness_cache=False, prefix_sharing=False, surrogate=False):
+        self._agent = agent
+        self._all_actions = all_actions
+        self._pool = None
+        self.num_workers = num_workers
+        self.cache = FitnessCache() if fitness_cache else None
+        if prefix_sharing:
+            agent.enable_prefix_sharing()
+        if surrogate:
+            agent.enable_surrogate(all_actions)
+        if num_workers > 1:
+            port_queue = multiprocessing.Queue()
+            for i in range(num_workers):
+                port_queue.put(ports[i % len(ports)])
+            self._pool = multiprocessing.Pool(num_workers, initializer=_init_fitness_worker, initargs=(type(agent), agent.role, host, port_queue, all_actions, prefix_sharing, surrogate))
+
+    def _evaluate_all(self, population, is_final_generation):
+        if self._pool is None:
+            return [self._agent.evaluate_individual([self._all_actions[idx] for idx in genome], is_final_generation) for genome in population]
+        chunksize = max(1, len(population) // (4 * self.num_workers))
+        results = self._pool.map(_evaluate_in_worker, [(genome, is_final_generation) for genome in population], chunksize=chunksize)
+        for _, parsed_individuals, surrogate_updates in results:
+            for parsed_individual in parsed_individuals:
+                self._agent.append_to_parsed_population(parsed_individual)
+            if surrogate_updates:
+                self._agent.surrogate.merge(surrogate_updates)
+        return [scores for scores, _, _ in results]
+
+    def evaluate(self, population, is_final_generation=False) -> np.ndarray:
+        """Returns the array of fitness tuples of the individuals in the population"""
+        # the final generation is always played to collect the winning individuals
+        if self.cache is None or is_final_generation:
+            return np.array(self._evaluate_all(population, is_final_generation))
+        keys = [self.cache.key(genome) for genome in population]
+        scores = [self.cache.get(key) for key in keys]
+        # play each missing sequence only once
+        missing = {}
+        for i, key in enumerate(keys):
+            if scores[i] is None and key not in missing:
+                missing[key] = population[i]
+        evaluated = dict(zip(missing, self._evaluate_all(list(missing.values()), False)))
+        for key, result in evaluated.items():
+            self.cache.put(key, result)
+        return np.array([score if score is not None else evaluated[key] for key, score in zip(keys, scores)])
+
+    def close(self):
+        """Stops the worker processes, their agents disconnect on exit"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
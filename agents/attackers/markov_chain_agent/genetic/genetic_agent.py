@@ -26,21 +26,80 @@ import argparse
 import numpy as np
 import math
 import json
-import csv
-import random
 from random import choice
 from env.worlds.network_security_game import NetworkSecurityEnvironment
 from env.game_components import Action, Observation, ActionType
 from NetSecGameAgents.agents.base_agent import BaseAgent
 from NetSecGameAgents.agents.agent_utils import generate_valid_actions
+from genetic_operators import encode_individual, tournament_selection, crossover_n_points, crossover_uniform, mutation_by_action, mutation_by_parameter, steady_state_selection
+from surrogate_model import SurrogateModel
+from checkpoint import save_checkpoint, load_checkpoint, MetricsWriter
+from fitness_pool import FitnessEvaluationPool
+from island_model import run_island_processes
+
+# Reward of an action which changed the state, by action type
+GOOD_ACTION_REWARDS = {
+    ActionType.ScanNetwork: 10,
+    ActionType.FindServices: 20,
+    ActionType.ExploitService: 50,
+    ActionType.FindData: 75,
+    ActionType.ExfiltrateData: 75,
+}
+
+
+class PrefixTrieNode:
+    """
+    Result of playing one action after the prefix given by the path from the root.
+    counts are (reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps) after the step.
+    """
+    __slots__ = ("children", "result", "changed", "counts", "ended", "won")
+
+    def __init__(self, result=0, changed=False, counts=(0, 0, 0, 0, 0), ended=False, won=0):
+        self.children = {}
+        self.result = result
+        self.changed = changed
+        self.counts = counts
+        self.ended = ended
+        self.won = won
+
+
+class PrefixTrie:
+    """
+    Trie of the visited (action prefix -> step result) for a deterministic environment.
+    Individuals sharing a prefix with an already played one only need the actions of the
+    prefix which changed the state to be replayed, and the rest of the fitness computation
+    is done only for the divergent suffix. The trie is cleared when it exceeds max_nodes.
+    """
+
+    def __init__(self, max_nodes=1000000):
+        self.max_nodes = max_nodes
+        self.root = PrefixTrieNode()
+        self.num_nodes = 0
+        self.full_hits = 0
+        self.replayed_steps = 0
+
+    def add_child(self, node, action, child):
+        if self.num_nodes >= self.max_nodes:
+            self.clear()
+        node.children[action] = child
+        self.num_nodes += 1
+        return child
+
+    def clear(self):
+        self.root.children = {}
+        self.num_nodes = 0
 
 
 class GeneticAgent(BaseAgent):
 
-    def __init__(self, host, port,role) -> None:
+    def __init__(self, host, port,role, prefix_sharing=False) -> None:
         super().__init__(host, port, role)
         np.set_printoptions(suppress=True, precision=6)
         self.parsed_population = []
+        # results of played prefixes, only valid for deterministic environments
+        self._prefix_trie = PrefixTrie() if prefix_sharing else None
+        # model of the environment learned from the rollouts, used to pre-screen offspring
+        self.surrogate = None
 
     def append_to_parsed_population(self, individual):
         self.parsed_population.append(individual)
@@ -72,245 +131,230 @@ class GeneticAgent(BaseAgent):
             # Store returns in the episode
             episodic_returns.append(observation.reward)
             # Select the action randomly
-            action = agent.select_action_random_agent(observation)
+            action = self.select_action_random_agent(observation)
             taken_actions[action] = True
             actions.append(action)
             
-            observation = agent.make_step(action)
+            observation = self.make_step(action)
 
         # select random actions to fill the rest of the list
         while len(actions) < 100:
             #print("Filling the rest of the list")
-            valid_action = agent.select_action_random_agent(observation)
+            valid_action = self.select_action_random_agent(observation)
             actions.append(valid_action)
         
         return actions
 
 
 
-    def play_game(self):
+    def fitness_eval_v02(self, individual, observation, is_final_generation, num_steps = 0):
         """
-        The main function for the gameplay. Handles agent registration and the main interaction loop.
+        Plays the individual from the given observation and returns its fitness as a tuple
+        (reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won).
+        In the final generation, winning individuals are stored in parsed_population.
         """
+        i = 0
+        num_good_actions = 0
+        num_boring_actions = 0
+        num_bad_actions = 0
+        reward = 0
+        reward_goal = 0
 
-        default_path_results = "./results"
-
-        def choose_parents_tournament(population, goal, fitness_func, num_per_tournament=2, parents_should_differ=True):
-            """ Tournament selection """
-            from_population = population.copy()
-            chosen = []
-            for i in range(2):
-                options = []
-                for _ in range(num_per_tournament):
-                    options.append(random.choice(from_population))
-                chosen.append(max(options, key=lambda x:fitness_func(x,agent.request_game_reset(),goal)[0])) # add [0] because fitness_eval_v3 returns a tuple
-                if i==0 and parents_should_differ:
-                    from_population.remove(chosen[0])
-            return chosen[0], chosen[1]
-        
-        def mutation_operator_by_parameter(individual, all_actions_by_type, mutation_prob):
-            new_individual = []
-            for i in range(len(individual)):
-                if random.random() < mutation_prob:
-                    action_type = individual[i].type
-                    new_individual.append(random.choice(all_actions_by_type[str(action_type)]))
-                else:
-                    new_individual.append(individual[i])
-            return new_individual
-
-
-        def mutation_operator_by_action(individual, all_actions, mutation_prob):
-            new_individual = []
-            for i in range(len(individual)):
-                if random.random() < mutation_prob:
-                    new_individual.append(random.choice(all_actions))
-                else: 
-                    new_individual.append(individual[i])
-            return new_individual
-
-
-        def crossover_operator_n_points(parent1, parent2, num_points, cross_prob):
-            if random.random() < cross_prob:
-                len_ind = len(parent1)
-                cross_points = np.sort(np.random.choice(len_ind, num_points, replace=False))
-                child1 = []
-                child2 = []
-                current_parent1 = parent1
-                current_parent2 = parent2
-                for i in range(len_ind):
-                    child1.append(current_parent1[i])
-                    child2.append(current_parent2[i])
-                    if i in cross_points:
-                        current_parent1 = parent2 if current_parent1 is parent1 else parent1
-                        current_parent2 = parent1 if current_parent2 is parent2 else parent2
-            else:
-                child1 = parent1.copy()
-                child2 = parent2.copy()
-            return child1, child2
-
-
-        def crossover_operator_uniform(parent1, parent2, p_value, cross_prob):
-            if random.random() < cross_prob:
-                len_ind = len(parent1)
-                child1 = []
-                child2 = []
-                for i in range(len_ind):
-                    if random.random() < p_value:
-                        child1.append(parent1[i])
-                        child2.append(parent2[i])
-                    else:
-                        child1.append(parent2[i])
-                        child2.append(parent1[i])
-            else:
-                child1 = parent1.copy()
-                child2 = parent2.copy()
-            return child1, child2
-        
-
-        def fitness_eval_v02(individual, observation, is_final_generation, num_steps = 0):
-            i = 0
-            num_good_actions = 0
-            num_boring_actions = 0
-            num_bad_actions = 0
-            reward = 0
-            reward_goal = 0
+        individual_result = [[0,0] for _ in range(len(individual))]
 
-            individual_result = [[0,0] for _ in range(len(individual))]
+        if observation is None:
+            observation = self._reset_game()
 
-            if observation is None:
-                observation = agent.request_game_reset()
+        current_state = observation.state
+        while i < len(individual) and not observation.end:
+            valid_actions = generate_valid_actions(current_state)
 
-            current_state = observation.state
-            while i < len(individual) and not observation.end:
-                valid_actions = generate_valid_actions(current_state)
+            individual_result[i][0] = individual[i]
+            
+            if individual[i] in valid_actions:
+                observation = self.make_step(individual[i])
+                if self.surrogate is not None:
+                    self.surrogate.observe_step(current_state, individual[i], observation.state, self._goal_reached(observation))
+            if num_steps is None:
+                num_steps = 0
+            num_steps += 1 
+            new_state = observation.state
 
-                individual_result[i][0] = individual[i]
-                
+            
+            if current_state != new_state:
+                num_good_actions += 1
+                individual_result[i][1] = 1
+                reward = GOOD_ACTION_REWARDS.get(individual[i].type, reward)
+            else:
                 if individual[i] in valid_actions:
-                    observation = agent.make_step(individual[i])
-                if num_steps is None:
-                    num_steps = 0
-                num_steps += 1 
-                new_state = observation.state
-
-                
-                if current_state != new_state:
-                    num_good_actions += 1
-                    individual_result[i][1] = 1
-                    action_type = individual[i].type
-                    if action_type == ActionType.ScanNetwork:
-                        reward = 10
-                    elif action_type == ActionType.FindServices:
-                        reward = 20
-                    elif action_type == ActionType.ExploitService:
-                        reward = 50
-                    elif action_type == ActionType.FindData:
-                        reward = 75
-                    elif action_type == ActionType.ExfiltrateData:
-                        reward = 75
+                    reward += -10
+                    num_boring_actions += 1
+                    individual_result[i][1] = 0
+
                 else:
-                    if individual[i] in valid_actions:
-                        reward += -10
-                        num_boring_actions += 1
-                        individual_result[i][1] = 0
+                    reward += -100
+                    num_bad_actions += 1
+                    individual_result[i][1] = -1
+            current_state = observation.state
+            i += 1
+            #print(reward)
+        
 
-                    else:
-                        reward += -100
-                        num_bad_actions += 1
-                        individual_result[i][1] = -1
-                current_state = observation.state
-                i += 1
-                #print(reward)
-            
+        if self._goal_reached(observation):
+            individual_result[i - 1][1] = 9
+            won = 1
+        else:
+            won = 0
 
-            if "end_reason" in observation.info and observation.info["end_reason"] == "goal_reached":
-                individual_result[i - 1][1] = 9
-                won = 1
-            else:
-                won = 0
+        return_reward = self._fitness_from_counts(reward + reward_goal, num_good_actions, num_bad_actions, num_steps, won)
 
-            final_reward = reward + reward_goal
-            div_aux = num_steps - num_good_actions + num_bad_actions
+        if is_final_generation is True:
+            parsed_individual_result = []
+            i = 0
+            while i < len(individual):
+                parsed_individual_result.append([individual[i], individual_result[i][1]])
+                i += 1
+                if individual_result[i - 1][1] == 9:
+                    self.append_to_parsed_population(parsed_individual_result)
+                    break
+
+        return return_reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won
+
+    @staticmethod
+    def _fitness_from_counts(final_reward, num_good_actions, num_bad_actions, num_steps, won):
+        """Fitness value of a played individual"""
+        div_aux = num_steps - num_good_actions + num_bad_actions
+        if div_aux == 0:
+            # i.e. when num_steps == num_good_actions and num_bad_actions == 0
+            # if num_bad_actions > 0, then num_steps + num_bad_actions != num_good_actions because num_steps > num_good_actions
+            div = num_steps
+        else:
+            div = div_aux
 
+        if final_reward >= 0:
+            return_reward = final_reward / div
+        else:
+            return_reward = final_reward 
 
-          
-                
-            #print(reward,reward_goal,num_steps,div_aux)
-            if div_aux == 0:
-                # i.e. when num_steps == num_good_actions and num_bad_actions == 0
-                # if num_bad_actions > 0, then num_steps + num_bad_actions != num_good_actions because num_steps > num_good_actions
-                div = num_steps
-            else:
-                div = div_aux
+        if won == 1:
+            return_reward = 7500 + 100000/num_steps
+        return return_reward
 
-            if final_reward >= 0:
-                return_reward = final_reward / div
-            else:
-                return_reward = final_reward 
-
-            if won == 1:
-                return_reward = 7500 + 100000/num_steps
-            #print(return_reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps)
-
-            if is_final_generation is True:
-                parsed_individual_result = []
-                i = 0
-                while i < len(individual):
-                    parsed_individual_result.append([individual[i], individual_result[i][1]])
-                    i += 1
-                    if individual_result[i - 1][1] == 9:
-                        agent.append_to_parsed_population(parsed_individual_result)
-                        break
-
-            return return_reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won
-        
+    def fitness_eval_prefix_shared(self, individual, is_final_generation):
+        """
+        Same fitness as fitness_eval_v02 (from a reset) using the prefix trie.
+        The longest already played prefix of the individual is taken from the trie. If the episode
+        ended in it or it covers the whole individual, no step is sent to the environment. Otherwise
+        the environment is reset, only the prefix actions which changed the state are replayed and the
+        suffix is played and added to the trie.
+        """
+        trie = self._prefix_trie
+        node = trie.root
+        path = []
+        for action in individual:
+            child = node.children.get(action)
+            if child is None:
+                break
+            node = child
+            path.append(node)
+            if node.ended:
+                break
+
+        if node.ended or len(path) == len(individual):
+            trie.full_hits += 1
+        else:
+            # recreate the state after the prefix
+            observation = self._reset_game()
+            for step, action in zip(path, individual):
+                if step.changed:
+                    observation = self.make_step(action)
+                    trie.replayed_steps += 1
+            current_state = observation.state
+            reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps = node.counts
+            for action in individual[len(path):]:
+                valid_actions = set(generate_valid_actions(current_state))
+                is_valid = action in valid_actions
+                if is_valid:
+                    observation = self.make_step(action)
+                    if self.surrogate is not None:
+                        self.surrogate.observe_step(current_state, action, observation.state, self._goal_reached(observation))
+                num_steps += 1
+                changed = current_state != observation.state
+                if changed:
+                    num_good_actions += 1
+                    result = 1
+                    reward = GOOD_ACTION_REWARDS.get(action.type, reward)
+                elif is_valid:
+                    reward += -10
+                    num_boring_actions += 1
+                    result = 0
+                else:
+                    reward += -100
+                    num_bad_actions += 1
+                    result = -1
+                won = 1 if self._goal_reached(observation) else 0
+                counts = (reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps)
+                node = trie.add_child(node, action, PrefixTrieNode(result, changed, counts, observation.end, won))
+                path.append(node)
+                current_state = observation.state
+                if observation.end:
+                    break
+
+        reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps = node.counts
+        won = node.won
+        return_reward = self._fitness_from_counts(reward, num_good_actions, num_bad_actions, num_steps, won)
+        if is_final_generation is True and won == 1:
+            parsed_individual_result = [[action, step.result] for action, step in zip(individual, path)]
+            parsed_individual_result[-1][1] = 9
+            self.append_to_parsed_population(parsed_individual_result)
+        return return_reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won
+
+    def enable_prefix_sharing(self):
+        """Starts keeping the prefix trie (if not kept already)"""
+        if self._prefix_trie is None:
+            self._prefix_trie = PrefixTrie()
+
+    def enable_surrogate(self, all_actions):
+        """Starts learning the surrogate model from the played individuals (if not learning already)"""
+        if self.surrogate is None:
+            self.surrogate = SurrogateModel(all_actions, GOOD_ACTION_REWARDS, self._fitness_from_counts)
+
+    @staticmethod
+    def _goal_reached(observation):
+        return "end_reason" in observation.info and observation.info["end_reason"] == "goal_reached"
+
+    def _reset_game(self):
+        observation = self.request_game_reset()
+        if self.surrogate is not None:
+            self.surrogate.observe_reset(observation.state)
+        return observation
+
+    def evaluate_individual(self, individual, is_final_generation=False):
+        """Fitness of the individual played from a reset, using the prefix trie if enabled"""
+        if self._prefix_trie is not None:
+            return self.fitness_eval_prefix_shared(individual, is_final_generation)
+        return self.fitness_eval_v02(individual, self._reset_game(), is_final_generation, 0)
+
+
+    def play_game(self, worker_ports=None, island=None, resume=False):
+        """
+        The main function for the gameplay. Handles agent registration and the main interaction loop.
+        worker_ports: ports of the coordinators used by the fitness evaluation workers (defaults to the port of this agent)
+        island: MigrationChannel of this island when running in the island model (see run_islands)
+        resume: continue from the checkpoint in the results directory (if it exists)
+        """
 
-        def steady_state_selection(parents, parents_scores, offspring, offspring_scores, num_replace):
-            # parents
-            best_indices_parents = np.argsort(parents_scores, axis=0)[:,0] # min to max fitness (higher is better)
-            parents_sort = [parents[i] for i in best_indices_parents]
-            # offspring
-            best_indices_offspring = np.argsort(offspring_scores, axis=0)[:,0] # min to max fitness (higher is better)
-            offspring_sort = [offspring[i] for i in best_indices_offspring]
-            # new generation
-            new_generation = parents_sort[num_replace:] + offspring_sort[population_size-num_replace:]
-            return new_generation
-
-
-        def get_all_actions_by_type(all_actions):
-            all_actions_by_type = {}
-            scan_network_list=[]
-            find_services_list=[]
-            exploit_service_list=[]
-            find_data_list=[]
-            exfiltrate_data_list=[]
-            for i in range(len(all_actions)):
-                if ActionType.ScanNetwork==all_actions[i].type:
-                    scan_network_list.append(all_actions[i])
-                elif ActionType.FindServices==all_actions[i].type:
-                    find_services_list.append(all_actions[i])
-                elif ActionType.ExploitService==all_actions[i].type:
-                    exploit_service_list.append(all_actions[i])
-                elif ActionType.FindData==all_actions[i].type:
-                    find_data_list.append(all_actions[i])
-                elif ActionType.ExfiltrateData==all_actions[i].type:
-                    exfiltrate_data_list.append(all_actions[i])
-                    #print("Action: ", all_actions[i])
-            all_actions_by_type["ActionType.ScanNetwork"] = scan_network_list
-            all_actions_by_type["ActionType.FindServices"] = find_services_list
-            all_actions_by_type["ActionType.ExploitService"] = exploit_service_list
-            all_actions_by_type["ActionType.FindData"] = find_data_list
-            all_actions_by_type["ActionType.ExfiltrateData"] = exfiltrate_data_list
-            return all_actions_by_type
-        
-        
-        
+        default_path_results = "./results"
 
         env = NetworkSecurityEnvironment(path.join(base_path, 'env', 'netsecenv_conf.yaml'))
         all_actions = env.get_all_actions()
         max_number_steps = env._max_steps
 
-        all_actions_by_type = get_all_actions_by_type(all_actions)
+        # Genomes are rows of action indices into all_actions
+        action_to_idx = {action:idx for idx, action in enumerate(all_actions)}
+        action_types = sorted({action.type for action in all_actions}, key=str)
+        type_codes = np.array([action_types.index(action.type) for action in all_actions], dtype=np.int32)
+        actions_by_type = [np.flatnonzero(type_codes == code).astype(np.int32) for code in range(len(action_types))]
 
 
         # GA parameters
@@ -342,40 +386,67 @@ class GeneticAgent(BaseAgent):
         # Survivor selection parameters
         num_replace = config["num_replace"]
 
+        # Parallel fitness evaluation
+        num_workers = config.get("num_workers", 1)
+        # Reuse of fitness of evaluated individuals and of played prefixes (deterministic environment)
+        fitness_cache = config.get("fitness_cache", False)
+        prefix_sharing = config.get("prefix_sharing", False)
+        # Fraction of the offspring (ranked by the surrogate model) played in the environment, 1 disables the pre-screening
+        surrogate_fraction = config.get("surrogate_fraction", 1.0)
+
         initialization_with_random_agent = config["initialization_with_random_agent"]
         reward_threshold = config["reward_threshold"]
 
-        path_results = default_path_results
-
+        # Island model parameters
+        migration_interval = config.get("migration_interval", 5)
+        num_migrants = config.get("num_migrants", 10)
 
+        # Generations between checkpoints of the run
+        checkpoint_interval = config.get("checkpoint_interval", 1)
 
-        # Initialize population
-        population = [[random.choice(all_actions) for _ in range(max_number_steps)] for _ in range(population_size)]
+        seed = config.get("seed")
+        if island is not None and seed is not None:
+            seed += island.island_id
+        rng = np.random.default_rng(seed)
 
-        # the given percentage of the population is initialized with Random Agent behavior
-        for i in range(int(population_size * initialization_with_random_agent)):
-            population[i] = agent.play_game_random_agent(agent.request_game_reset())
-            print("Random Agent behavior initialized: ", i)
+        path_results = default_path_results
+        if island is not None:
+            path_results = path.join(default_path_results, f"island_{island.island_id}")
+            os.makedirs(path_results, exist_ok=True)
+
+        checkpoint_path = path.join(path_results, 'checkpoint.npz')
+        if resume and os.path.exists(checkpoint_path):
+            # continue an interrupted run from its last completed generation
+            population, population_scores, generation, metrics_sizes, finished = load_checkpoint(checkpoint_path, rng)
+            if finished:
+                print(f"The run of {checkpoint_path} already finished at generation {generation}")
+                return
+            print(f"Resumed from {checkpoint_path} at generation {generation}")
+            # the metrics rows of the generations after the checkpoint are dropped and written again
+            metrics_writer = MetricsWriter(path_results, metrics_sizes)
+        else:
+            # Initialize population
+            population = rng.integers(0, len(all_actions), (population_size, max_number_steps), dtype=np.int32)
 
+            # the given percentage of the population is initialized with Random Agent behavior
+            for i in range(int(population_size * initialization_with_random_agent)):
+                population[i] = encode_individual(self.play_game_random_agent(self.request_game_reset()), action_to_idx, max_number_steps, len(all_actions), rng)
+                print("Random Agent behavior initialized: ", i)
+            population_scores = np.full([population_size, 6], np.nan)
+            generation = 0
+            metrics_writer = MetricsWriter(path_results)
+            save_checkpoint(checkpoint_path, population, population_scores, generation, rng, metrics_writer.sizes())
 
-        #print("Best initial fitness: ", max([fitness_eval_v02(individual, agent.request_game_reset(),False, 0)[0] for individual in population]))
+        fitness_pool = FitnessEvaluationPool(self, self._connection_details[0], worker_ports or [self._connection_details[1]], all_actions, num_workers, fitness_cache, prefix_sharing, surrogate_fraction < 1)
 
         # Generations
 
-        generation = 0
         best_score = -math.inf
 
-
         try:
             while (generation < num_generations) and (best_score < reward_threshold):
                 print("Generation: ", generation)
-                #print(generation)
-                offspring = []
-                #print("inic offspring")
-                popu_crossover = population.copy()
-                #print("copy population")
-                parents_scores = np.array([fitness_eval_v02(individual, agent.request_game_reset(),False, 0) for individual in population])
-                #print("parents_scores")
+                parents_scores = fitness_pool.evaluate(population)
                 index_best_score = np.argmax(parents_scores[:, 0])
                 best_score_complete = parents_scores[index_best_score, :]
                 best_score = best_score_complete[0]
@@ -383,85 +454,78 @@ class GeneticAgent(BaseAgent):
                 index_worst_score = np.argmin(parents_scores[:, 0])
                 worst_score_complete = parents_scores[index_worst_score, :]
 
-                #print("Amount of individuals: ", len(parents_scores))
-                #print("Total good actions: ", np.sum(parents_scores[:, 1]))
                 print("Best score complete: ", best_score_complete)
                 print("Worst score complete: ", worst_score_complete)
                 print("Average score complete: ", np.mean(parents_scores, axis=0))
                 metrics_mean = np.mean(parents_scores, axis=0)
                 metrics_std = np.std(parents_scores, axis=0)
                 print("Standard deviation: ", metrics_std)
+                if fitness_pool.cache is not None:
+                    print(f"Fitness cache: {fitness_pool.cache.hits} hits, {fitness_pool.cache.misses} misses, {len(fitness_pool.cache)} individuals")
 
-                #print(best_score,metrics_mean,metrics_std)
                 # save best, mean and std scores
-                with open(path.join(path_results, 'best_scores.csv'), 'a', newline='') as partial_file:
-                    writer_csv = csv.writer(partial_file)
-                    writer_csv.writerow(best_score_complete)
-                with open(path.join(path_results, 'metrics_mean.csv'), 'a', newline='') as partial_file:
-                    writer_csv = csv.writer(partial_file)
-                    writer_csv.writerow(metrics_mean)
-                with open(path.join(path_results, 'metrics_std.csv'), 'a', newline='') as partial_file:
-                    writer_csv = csv.writer(partial_file)
-                    writer_csv.writerow(metrics_std)
-                for j in range(int(population_size/2)):
-                    parent1, parent2 = choose_parents_tournament(popu_crossover, None, fitness_eval_v02, num_per_tournament, True)
-
-                    if not select_parents_with_replacement:
-                        try:
-                            popu_crossover.remove(parent1)
-                        except ValueError:
-                            pass
-                        try:
-                            if parent1 is not parent2:
-                                popu_crossover.remove(parent2)
-                        except ValueError:
-                            pass
-
-                    if n_points:
-                        child1, child2 = crossover_operator_n_points(parent1, parent2, num_points, cross_prob)
-                    else:
-                        child1, child2 = crossover_operator_uniform(parent1, parent2, p_value, cross_prob)
+                metrics_writer.write(best_score_complete, metrics_mean, metrics_std)
 
-                    if parameter_mutation:
-                        child1 = mutation_operator_by_parameter(child1, all_actions_by_type, mutation_prob)
-                        child2 = mutation_operator_by_parameter(child2, all_actions_by_type, mutation_prob)
-                    else:
-                        child1 = mutation_operator_by_action(child1, all_actions, mutation_prob)
-                        child2 = mutation_operator_by_action(child2, all_actions, mutation_prob)
+                # parents selection
+                parents1, parents2 = tournament_selection(parents_scores[:, 0], population_size // 2, num_per_tournament, rng, select_parents_with_replacement)
 
-                    offspring.append(child1)
-                    offspring.append(child2)
+                # crossover
+                if n_points:
+                    children1, children2 = crossover_n_points(population[parents1], population[parents2], num_points, cross_prob, rng)
+                else:
+                    children1, children2 = crossover_uniform(population[parents1], population[parents2], p_value, cross_prob, rng)
+                offspring = np.concatenate([children1, children2])
+
+                # mutation
+                if parameter_mutation:
+                    offspring = mutation_by_parameter(offspring, type_codes, actions_by_type, mutation_prob, rng)
+                else:
+                    offspring = mutation_by_action(offspring, len(all_actions), mutation_prob, rng)
 
-                offspring_scores = np.array([fitness_eval_v02(individual, agent.request_game_reset(),False, 0) for individual in offspring])
+                # pre-screening: only the offspring with the best estimated fitness are played,
+                # at least num_replace of them so the survivor selection uses only real scores
+                if self.surrogate is not None:
+                    screened = self.surrogate.screen(offspring, surrogate_fraction, num_replace)
+                    print(f"Surrogate model: {len(screened)} of {len(offspring)} offspring evaluated")
+                    offspring = offspring[screened]
+
+                offspring_scores = fitness_pool.evaluate(offspring)
                 # survivor selection
-                new_generation = steady_state_selection(population, parents_scores, offspring, offspring_scores, num_replace)
-                population = new_generation
+                population, kept_parents, selected_offspring = steady_state_selection(population, parents_scores[:, 0], offspring, offspring_scores[:, 0], num_replace)
+                population_scores = np.concatenate([parents_scores[kept_parents], offspring_scores[selected_offspring]])
                 generation += 1
-                #print("survivor")
-                print("\n")
 
-        except Exception as e:
-                print(f"Error: {e}")
+                # migration: the best individuals are sent to the next island and the immigrants replace the worst ones
+                if island is not None and generation % migration_interval == 0:
+                    population, population_scores = island.migrate(population, population_scores, num_migrants)
+                    if fitness_pool.cache is not None:
+                        # scores of the immigrants are known (deterministic environment)
+                        for genome, scores in zip(population, population_scores):
+                            fitness_pool.cache.put(fitness_pool.cache.key(genome), scores)
 
+                if generation % checkpoint_interval == 0:
+                    save_checkpoint(checkpoint_path, population, population_scores, generation, rng, metrics_writer.sizes())
+                print("\n")
 
+        except BaseException:
+            # the checkpoint of the last completed generation is kept, the run can be continued with --resume
+            metrics_writer.close()
+            fitness_pool.close()
+            raise
 
         # calculate scores for last generation, and update files:
 
-        last_generation_scores = np.array([fitness_eval_v02(individual,  agent.request_game_reset(),True, 0) for individual in population])
+        last_generation_scores = fitness_pool.evaluate(population, is_final_generation=True)
+        fitness_pool.close()
         index_best_score = np.argmax(last_generation_scores[:,0])
         best_score_complete = last_generation_scores[index_best_score, :]
         metrics_mean = np.mean(last_generation_scores, axis=0)
         metrics_std = np.std(last_generation_scores, axis=0)
         # save best, mean and std scores from last generation
-        with open(path.join(path_results, 'best_scores.csv'), 'a', newline='') as partial_file:
-            writer_csv = csv.writer(partial_file)
-            writer_csv.writerow(best_score_complete)
-        with open(path.join(path_results, 'metrics_mean.csv'), 'a', newline='') as partial_file:
-            writer_csv = csv.writer(partial_file)
-            writer_csv.writerow(metrics_mean)
-        with open(path.join(path_results, 'metrics_std.csv'), 'a', newline='') as partial_file:
-            writer_csv = csv.writer(partial_file)
-            writer_csv.writerow(metrics_std)
+        metrics_writer.write(best_score_complete, metrics_mean, metrics_std)
+        # resuming a finished run does nothing
+        save_checkpoint(checkpoint_path, population, last_generation_scores, generation, rng, metrics_writer.sizes(), finished=True)
+        metrics_writer.close()
 
         print("\nGeneration = ", generation)
 
@@ -503,20 +567,47 @@ class GeneticAgent(BaseAgent):
                 json.dump(outer_array, f, indent=4)
 
         # Usage
-        save_population_json(agent, os.path.join(path_results, 'parsed_population.json'))
+        save_population_json(self, os.path.join(path_results, 'parsed_population.json'))
+
+
+def _run_island(island, host, port, resume, worker_ports):
+    agent = GeneticAgent(host, port, "Attacker")
+    agent.register()
+    agent.play_game(worker_ports, island=island, resume=resume)
+    agent.terminate_connection()
+
+
+def run_islands(host, ports, resume=False, worker_ports=None):
+    """
+    Island model: one population per port, each evolved by its own process and agent connected
+    to the coordinator on that port. The islands form a ring and exchange their best
+    individuals every migration_interval generations (see config.json).
+    The worker_ports of the fitness evaluation workers are split round-robin among the islands,
+    an island without worker ports uses its own port.
+    """
+    island_worker_ports = [(worker_ports or [])[i::len(ports)] or None for i in range(len(ports))]
+    run_island_processes(_run_island, [(host, port, resume, island_worker_ports[i]) for i, port in enumerate(ports)])
+
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", help="Host where the game server is", default="127.0.0.1", action='store', required=False)
     parser.add_argument("--port", help="Port where the game server is", default=9000, type=int, action='store', required=False)
+    parser.add_argument("--worker_ports", help="Ports of the game servers used by the fitness evaluation workers (see num_workers in config.json). Defaults to --port. With --island_ports, they are split round-robin among the islands.", nargs='*', type=int, required=False)
+    parser.add_argument("--resume", help="Continue the run from the checkpoint in the results directory", action='store_true', required=False)
+    parser.add_argument("--island_ports", help="Runs the island model with one island per port of a game server (see migration_interval in config.json)", nargs='*', type=int, required=False)
 
     args = parser.parse_args()
-    
+
+    if args.island_ports:
+        run_islands(args.host, args.island_ports, args.resume, args.worker_ports)
+        sys.exit(0)
+
     agent = GeneticAgent(args.host, args.port,"Attacker")
 
     observation = agent.register()
-    agent.play_game()
+    agent.play_game(args.worker_ports, resume=args.resume)
     agent._logger.info("Terminating interaction")
     agent.terminate_connection()
     
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Vectorized genetic operators for the GeneticAgent.
+
+The population is a 2-D int32 matrix [population_size x num_steps] where every row is
+an individual (genome) and every value is an index into the list of all actions.
+All operators work on the whole population at once.
+"""
+import numpy as np
+
+
+def encode_individual(actions, action_to_idx, num_steps, num_actions, rng):
+    """
+    Converts a list of Actions to a genome of length num_steps.
+    Longer lists are truncated; unknown actions and missing steps are replaced by random actions.
+    """
+    genome = rng.integers(0, num_actions, num_steps, dtype=np.int32)
+    for i, action in enumerate(actions[:num_steps]):
+        if action in action_to_idx:
+            genome[i] = action_to_idx[action]
+    return genome
+
+
+def tournament_selection(fitness, num_pairs, num_per_tournament, rng, with_replacement=True):
+    """
+    Selects num_pairs pairs of parents by tournaments of num_per_tournament random individuals.
+    The two parents of a pair always differ (if the population has more than one individual).
+    Without replacement, an individual is a parent at most once until all individuals
+    were used, then all of them become available again.
+
+    Args:
+        fitness: [population_size] fitness of the individuals (higher is better)
+    Returns:
+        (parents1, parents2): [num_pairs] indices of the parents
+    """
+    fitness = np.asarray(fitness, dtype=np.float64)
+    population_size = len(fitness)
+    if with_replacement:
+        candidates = rng.integers(0, population_size, (num_pairs, num_per_tournament))
+        parents1 = candidates[np.arange(num_pairs), np.argmax(fitness[candidates], axis=1)]
+        candidates = rng.integers(0, population_size, (num_pairs, num_per_tournament))
+        candidate_fitness = np.where(candidates == parents1[:, None], -np.inf, fitness[candidates])
+        parents2 = candidates[np.arange(num_pairs), np.argmax(candidate_fitness, axis=1)]
+        # tournaments where all candidates were the first parent
+        repeated = np.isneginf(candidate_fitness).all(axis=1) & (population_size > 1)
+        parents2[repeated] = (parents1[repeated] + rng.integers(1, population_size, repeated.sum())) % population_size
+        return parents1, parents2
+
+    available = np.ones(population_size, dtype=bool)
+    parents = np.empty([num_pairs, 2], dtype=np.int64)
+    for pair in range(num_pairs):
+        for j in range(2):
+            if available.sum() < 2 - j:
+                available[:] = True
+                available[parents[pair, :j]] = False
+            pool = np.flatnonzero(available)
+            candidates = pool[rng.integers(0, len(pool), num_per_tournament)]
+            parents[pair, j] = candidates[np.argmax(fitness[candidates])]
+            available[parents[pair, j]] = False
+    return parents[:, 0], parents[:, 1]
+
+
+def crossover_n_points(parents1, parents2, num_points, cross_prob, rng):
+    """
+    N-point crossover of each pair of rows. Genes up to and including the first cut point
+    come from the own parent, then the source alternates after each cut point.
+    Pairs are crossed with probability cross_prob, otherwise the children are copies of the parents.
+    """
+    num_pairs, num_steps = parents1.shape
+    # num_points distinct cut positions per pair
+    cut_points = np.argsort(rng.random((num_pairs, num_steps)), axis=1)[:, :num_points]
+    cuts = np.zeros((num_pairs, num_steps), dtype=np.int32)
+    np.put_along_axis(cuts, cut_points, 1, axis=1)
+    # number of cut points strictly before each position
+    segment = np.cumsum(cuts, axis=1) - cuts
+    swap = (segment % 2 == 1) & (rng.random(num_pairs) < cross_prob)[:, None]
+    return np.where(swap, parents2, parents1), np.where(swap, parents1, parents2)
+
+
+def crossover_uniform(parents1, parents2, p_value, cross_prob, rng):
+    """
+    Uniform crossover: each gene comes from the own parent with probability p_value.
+    Pairs are crossed with probability cross_prob, otherwise the children are copies of the parents.
+    """
+    num_pairs, num_steps = parents1.shape
+    swap = (rng.random((num_pairs, num_steps)) >= p_value) & (rng.random(num_pairs) < cross_prob)[:, None]
+    return np.where(swap, parents2, parents1), np.where(swap, parents1, parents2)
+
+
+def mutation_by_action(genomes, num_actions, mutation_prob, rng):
+    """Replaces each gene with a random action with probability mutation_prob"""
+    genomes = genomes.copy()
+    mutate = rng.random(genomes.shape) < mutation_prob
+    genomes[mutate] = rng.integers(0, num_actions, mutate.sum(), dtype=genomes.dtype)
+    return genomes
+
+
+def mutation_by_parameter(genomes, type_codes, actions_by_type, mutation_prob, rng):
+    """
+    Replaces each gene with probability mutation_prob by a random action of the same type,
+    i.e. only the parameters of the action change.
+
+    Args:
+        type_codes: [num_actions] type code of each action
+        actions_by_type: list where item t is the array of indices of actions with type code t
+    """
+    genomes = genomes.copy()
+    rows, cols = np.nonzero(rng.random(genomes.shape) < mutation_prob)
+    mutated_types = type_codes[genomes[rows, cols]]
+    for code, actions in enumerate(actions_by_type):
+        if len(actions) == 0:
+            continue
+        selected = mutated_types == code
+        genomes[rows[selected], cols[selected]] = actions[rng.integers(0, len(actions), selected.sum())]
+    return genomes
+
+
+def steady_state_selection(parents, parents_fitness, offspring, offspring_fitness, num_replace):
+    """
+    The num_replace worst parents are replaced by the num_replace best offspring.
+    Returns the new population and the indices of the kept parents and of the selected offspring.
+    """
+    best_parents = np.argsort(parents_fitness, kind="stable")[num_replace:]
+    best_offspring = np.argsort(offspring_fitness, kind="stable")[len(offspring_fitness) - num_replace:]
+    return np.concatenate([parents[best_parents], offspring[best_offspring]]), best_parents, best_offspring
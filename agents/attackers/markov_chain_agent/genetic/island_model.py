@@ -0,0 +1,61 @@
+"""
+Island model of the GeneticAgent: populations evolved in separate processes which form a ring
+and exchange their best individuals.
+"""
+import multiprocessing
+import queue
+import numpy as np
+
+
+class MigrationChannel:
+    """
+    Connection of an island to its neighbours in the ring of islands.
+    Emigrants are put to the outbox (inbox of the next island) and immigrants are taken from
+    the inbox without waiting, so the islands never block each other.
+    """
+
+    def __init__(self, island_id, inbox, outbox):
+        self.island_id = island_id
+        self._inbox = inbox
+        self._outbox = outbox
+
+    def migrate(self, population, scores, num_migrants):
+        """Sends the num_migrants best individuals and replaces the worst ones by the received immigrants"""
+        order = np.argsort(scores[:, 0], kind="stable")
+        self._outbox.put((population[order[-num_migrants:]], scores[order[-num_migrants:]]))
+        immigrants = []
+        while True:
+            try:
+                immigrants.append(self._inbox.get_nowait())
+            except queue.Empty:
+                break
+        if not immigrants:
+            return population, scores
+        genomes = np.concatenate([genomes for genomes, _ in immigrants])[-num_migrants:]
+        immigrant_scores = np.concatenate([scores for _, scores in immigrants])[-num_migrants:]
+        population, scores = population.copy(), scores.copy()
+        population[order[:len(genomes)]] = genomes
+        scores[order[:len(genomes)]] = immigrant_scores
+        print(f"Island {self.island_id}: {len(genomes)} immigrants received")
+        return population, scores
+
+
+def _island_process(run_island, island_id, inbox, outbox, args):
+    # migrants not read by a neighbour which already finished are dropped instead of blocking the exit
+    outbox.cancel_join_thread()
+    run_island(MigrationChannel(island_id, inbox, outbox), *args)
+
+
+def run_island_processes(run_island, island_args):
+    """
+    Runs run_island(channel, *args) for every args of island_args in its own process and waits
+    for all of them. Island i gets a MigrationChannel with id i whose outbox is the inbox of the
+    island i + 1 (the last one sends to the first one).
+    """
+    queues = [multiprocessing.Queue() for _ in island_args]
+    islands = [multiprocessing.Process(target=_island_process, args=(run_island, i, queues[i], queues[(i + 1) % len(island_args)], args))
+               for i, args in enumerate(island_args)]
+    for island in islands:
+        island.start()
+    for island in islands:
+        island.join()
@@ -0,0 +1,147 @@
+"""
+Surrogate fitness model for pre-screening the offspring of the GeneticAgent.
+
+The state of the game is represented as a set of facts (known networks and hosts, controlled hosts,
+known services, data and blocks). The validity of an action is checked with the rules of
+generate_valid_actions on the facts, and the effect of an action is the set of facts it added
+when it was played in the real environment. This assumes a deterministic environment.
+"""
+import math
+import numpy as np
+from env.game_components import ActionType
+
+
+def state_facts(state) -> set:
+    """Set of facts describing a GameState"""
+    facts = {("network", network) for network in state.known_networks}
+    facts.update(("host", host) for host in state.known_hosts)
+    facts.update(("controlled", host) for host in state.controlled_hosts)
+    facts.update(("service", host, service) for host, services in state.known_services.items() for service in services)
+    facts.update(("data", host, data) for host, data_list in state.known_data.items() for data in data_list)
+    facts.update(("block", host, blocked) for host, blocks in state.known_blocks.items() for blocked in blocks)
+    return facts
+
+
+class SurrogateModel:
+    """
+    Estimates the fitness of genomes (sequences of indices into all_actions) without playing them.
+
+    The model is learned with observe_reset and observe_step during the real rollouts. Valid actions
+    which were never played are assumed to change the state once per simulated episode, so
+    unexplored actions are not screened out. Actions which reached the goal end the simulated episode.
+    """
+
+    def __init__(self, all_actions, good_action_rewards, fitness_from_counts):
+        self._all_actions = all_actions
+        self._action_to_idx = {action:idx for idx, action in enumerate(all_actions)}
+        self._good_action_rewards = good_action_rewards
+        self._fitness_from_counts = fitness_from_counts
+        self.initial_facts = None
+        # action index -> facts added by the action, and indices of actions which reached the goal
+        self.effects = {}
+        self.goal_actions = set()
+        # learned since the last pop_updates (sent from the workers to the main process)
+        self._updates = {}
+
+    def observe_reset(self, state):
+        if self.initial_facts is None:
+            self.initial_facts = frozenset(state_facts(state))
+            self._updates["initial_facts"] = self.initial_facts
+
+    def observe_step(self, state, action, new_state, won):
+        """Stores the effect of a valid action played in the real environment"""
+        idx = self._action_to_idx.get(action)
+        if idx is None:
+            return
+        # the action may have been played when its facts were already known, so the effects are accumulated
+        effect = self.effects.get(idx, frozenset()) | (state_facts(new_state) - state_facts(state))
+        self.effects[idx] = effect
+        self._updates.setdefault("effects", {})[idx] = effect
+        if won:
+            self.goal_actions.add(idx)
+            self._updates.setdefault("goal_actions", set()).add(idx)
+
+    def pop_updates(self) -> dict:
+        """Returns what was learned since the last call"""
+        updates, self._updates = self._updates, {}
+        return updates
+
+    def merge(self, updates:dict):
+        """Adds the updates learned by another model (e.g. in a worker process)"""
+        if self.initial_facts is None and "initial_facts" in updates:
+            self.initial_facts = updates["initial_facts"]
+        for idx, effect in updates.get("effects", {}).items():
+            self.effects[idx] = self.effects.get(idx, frozenset()) | effect
+        self.goal_actions.update(updates.get("goal_actions", ()))
+
+    @property
+    def ready(self) -> bool:
+        return self.initial_facts is not None
+
+    @staticmethod
+    def is_valid(facts, action) -> bool:
+        """Validity of the action in the state given by the facts (see generate_valid_actions)"""
+        params = action.parameters
+        source = params.get("source_host")
+        if action.type == ActionType.ScanNetwork:
+            return ("controlled", source) in facts and ("network", params["target_network"]) in facts
+        target = params.get("target_host")
+        if action.type == ActionType.FindServices:
+            return ("controlled", source) in facts and ("host", target) in facts and ("block", source, target) not in facts
+        if action.type == ActionType.ExploitService:
+            return (("controlled", source) in facts and ("service", target, params["target_service"]) in facts
+                    and ("block", source, target) not in facts)
+        if action.type == ActionType.FindData:
+            return (source == target and ("controlled", target) in facts
+                    and any(fact[0] == "controlled" and ("block", fact[1], target) not in facts for fact in facts))
+        if action.type == ActionType.ExfiltrateData:
+            return (source != target and ("controlled", target) in facts and ("data", source, params["data"]) in facts
+                    and ("block", source, target) not in facts)
+        return False
+
+    def simulate(self, genome) -> tuple:
+        """Counts (reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won) of the simulated genome"""
+        facts = set(self.initial_facts)
+        unexplored_played = set()
+        reward = 0
+        num_good_actions = num_boring_actions = num_bad_actions = num_steps = won = 0
+        for idx in genome:
+            idx = int(idx)
+            action = self._all_actions[idx]
+            num_steps += 1
+            if not self.is_valid(facts, action):
+                reward += -100
+                num_bad_actions += 1
+                continue
+            effect = self.effects.get(idx)
+            if effect is None:
+                changed = idx not in unexplored_played
+                unexplored_played.add(idx)
+            else:
+                changed = not effect <= facts
+                facts |= effect
+            if changed:
+                num_good_actions += 1
+                reward = self._good_action_rewards.get(action.type, reward)
+                if idx in self.goal_actions:
+                    won = 1
+                    break
+            else:
+                reward += -10
+                num_boring_actions += 1
+        return reward, num_good_actions, num_boring_actions, num_bad_actions, num_steps, won
+
+    def estimate(self, genome) -> float:
+        reward, num_good_actions, _, num_bad_actions, num_steps, won = self.simulate(genome)
+        return self._fitness_from_counts(reward, num_good_actions, num_bad_actions, num_steps, won)
+
+    def screen(self, genomes, fraction:float, min_selected:int=0) -> np.ndarray:
+        """
+        Indices of the genomes with the best estimated fitness to be evaluated in the real environment:
+        the top fraction of them, but at least min_selected. All of them if the model is not ready.
+        """
+        num_selected = min(len(genomes), max(min_selected, math.ceil(fraction * len(genomes))))
+        if not self.ready or num_selected == len(genomes):
+            return np.arange(len(genomes))
+        estimates = np.array([self.estimate(genome) for genome in genomes])
+        return np.sort(np.argsort(-estimates, kind="stable")[:num_selected])
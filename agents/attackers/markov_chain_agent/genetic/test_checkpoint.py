@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from checkpoint import save_checkpoint, load_checkpoint, MetricsWriter
+
+class TestCheckpoint(unittest.TestCase):
+    def run_generations(self, path_results, checkpoint_path, rng, population, writer, first, last, checkpoint_interval):
+        """Stand-in for the generation loop: one metrics row per generation and periodic checkpoints"""
+        for generation in range(first, last):
+            writer.write([generation, 1.0], [generation, 0.5], [generation, 0.1])
+            population = rng.integers(0, 100, population.shape, dtype=np.int32)
+            if (generation + 1) % checkpoint_interval == 0:
+                save_checkpoint(checkpoint_path, population, np.zeros([len(population), 6]), generation + 1, rng, writer.sizes())
+        return population
+
+    def read_rows(self, path_results):
+        with open(os.path.join(path_results, "best_scores.csv")) as f:
+            return f.read().splitlines()
+
+    def test_resume_matches_uninterrupted_run(self):
+        """Test that a run stopped after a checkpoint continues with the same population, random state and metrics rows"""
+        with tempfile.TemporaryDirectory() as uninterrupted, tempfile.TemporaryDirectory() as interrupted:
+            rng = np.random.default_rng(7)
+            writer = MetricsWriter(uninterrupted)
+            expected_population = self.run_generations(uninterrupted, os.path.join(uninterrupted, "checkpoint.npz"), rng, np.zeros([4, 5], dtype=np.int32), writer, 0, 6, 2)
+            writer.close()
+
+            checkpoint_path = os.path.join(interrupted, "checkpoint.npz")
+            rng = np.random.default_rng(7)
+            writer = MetricsWriter(interrupted)
+            # stopped in generation 5, after the checkpoint of generation 4 and the row of generation 4 was written
+            self.run_generations(interrupted, checkpoint_path, rng, np.zeros([4, 5], dtype=np.int32), writer, 0, 5, 2)
+            writer.close()
+            self.assertEqual(len(self.read_rows(interrupted)), 5)
+
+            rng = np.random.default_rng(0)
+            population, _, generation, metrics_sizes, finished = load_checkpoint(checkpoint_path, rng)
+            self.assertEqual(generation, 4)
+            self.assertFalse(finished)
+            writer = MetricsWriter(interrupted, metrics_sizes)
+            self.assertEqual(len(self.read_rows(interrupted)), 4)
+            population = self.run_generations(interrupted, checkpoint_path, rng, population, writer, generation, 6, 2)
+            writer.close()
+            np.testing.assert_array_equal(population, expected_population)
+            self.assertEqual(self.read_rows(interrupted), self.read_rows(uninterrupted))
+
+    def test_finished_checkpoint(self):
+        """Test that the checkpoint of a finished run is marked and old checkpoints load without metrics sizes"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "checkpoint.npz")
+            rng = np.random.default_rng(1)
+            save_checkpoint(filename, np.ones([2, 3], dtype=np.int32), np.zeros([2, 6]), 3, rng, [10, 20, 30], finished=True)
+            *_, metrics_sizes, finished = load_checkpoint(filename, np.random.default_rng(2))
+            self.assertEqual(metrics_sizes, [10, 20, 30])
+            self.assertTrue(finished)
+            np.savez(filename, population=np.ones([2, 3]), scores=np.zeros([2, 6]), generation=3, rng_state=np.array(json.dumps(rng.bit_generator.state)))
+            *_, metrics_sizes, finished = load_checkpoint(filename, np.random.default_rng(2))
+            self.assertIsNone(metrics_sizes)
+            self.assertFalse(finished)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from fitness_pool import FitnessEvaluationPool
+
+NUM_ACTIONS = 20
+# action whose evaluation fails
+FAILING_ACTION = NUM_ACTIONS - 1
+
+
+class FakeAgent:
+    """
+    Stand-in of the GeneticAgent without a coordinator: the fitness is computed from the actions.
+    The host is the directory where every agent records its port when it disconnects.
+    """
+
+    def __init__(self, host, port, role):
+        self._host = host
+        self._port = port
+        self._role = role
+        self.parsed_population = []
+        self.surrogate = None
+
+    @property
+    def role(self):
+        return self._role
+
+    def register(self):
+        pass
+
+    def terminate_connection(self):
+        with open(os.path.join(self._host, f"disconnected_{os.getpid()}"), "w") as f:
+            f.write(str(self._port))
+
+    def enable_prefix_sharing(self):
+        pass
+
+    def append_to_parsed_population(self, individual):
+        self.parsed_population.append(individual)
+
+    def evaluate_individual(self, individual, is_final_generation=False):
+        if FAILING_ACTION in individual:
+            raise RuntimeError("evaluation failed")
+        num_good_actions = sum(action % 2 for action in individual)
+        won = int(individual[0] == 0)
+        if is_final_generation and won:
+            self.append_to_parsed_population([[action, 1] for action in individual])
+        reward = 10.0 * num_good_actions - 100.0 * (len(individual) - num_good_actions)
+        return reward, num_good_actions, 0, len(individual) - num_good_actions, len(individual), won
+
+
+class TestFitnessEvaluationPool(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.population = rng.integers(0, FAILING_ACTION, (60, 8), dtype=np.int32)
+        self.population[::7, 0] = 0
+        # duplicates for the fitness cache
+        self.population[40:50] = self.population[:10]
+        self.all_actions = list(range(NUM_ACTIONS))
+
+    def disconnected_ports(self, host):
+        ports = []
+        for filename in os.listdir(host):
+            with open(os.path.join(host, filename)) as f:
+                ports.append(int(f.read()))
+        return sorted(ports)
+
+    def test_workers_match_serial_evaluation(self):
+        """Test that N workers return the scores and winning individuals of the serial evaluation in the same order"""
+        with tempfile.TemporaryDirectory() as host:
+            serial_agent = FakeAgent(host, 1, "Attacker")
+            serial = FitnessEvaluationPool(serial_agent, host, [1], self.all_actions)
+            expected = serial.evaluate(self.population)
+            expected_final = serial.evaluate(self.population, is_final_generation=True)
+            serial.close()
+            for fitness_cache in (False, True):
+                agent = FakeAgent(host, 1, "Attacker")
+                pool = FitnessEvaluationPool(agent, host, [1], self.all_actions, num_workers=3, fitness_cache=fitness_cache)
+                try:
+                    np.testing.assert_array_equal(pool.evaluate(self.population), expected)
+                    np.testing.assert_array_equal(pool.evaluate(self.population), expected)
+                    np.testing.assert_array_equal(pool.evaluate(self.population, is_final_generation=True), expected_final)
+                finally:
+                    pool.close()
+                self.assertEqual(agent.parsed_population, serial_agent.parsed_population)
+                if fitness_cache:
+                    self.assertEqual(len(pool.cache), len(self.population) - 10)
+
+    def test_worker_failure_and_shutdown(self):
+        """Test that a failed evaluation is raised, and that closing stops every worker and disconnects its agent"""
+        with tempfile.TemporaryDirectory() as host:
+            pool = FitnessEvaluationPool(FakeAgent(host, 1, "Attacker"), host, [1, 2], self.all_actions, num_workers=3)
+            population = self.population.copy()
+            population[5, 3] = FAILING_ACTION
+            with self.assertRaises(RuntimeError):
+                pool.evaluate(population)
+            # the workers are still usable after the failure
+            self.assertEqual(len(pool.evaluate(self.population)), len(self.population))
+            self.assertEqual(os.listdir(host), [])
+            pool.close()
+            pool.close()
+            # ports are assigned to the workers round-robin
+            self.assertEqual(self.disconnected_ports(host), [1, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
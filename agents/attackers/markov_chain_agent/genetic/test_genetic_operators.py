@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from genetic_operators import (encode_individual, tournament_selection, crossover_n_points, crossover_uniform,
+                               mutation_by_action, mutation_by_parameter, steady_state_selection)
+
+class TestGeneticOperators(unittest.TestCase):
+    def setUp(self):
+        """Initialize a small population of genomes"""
+        self.rng = np.random.default_rng(42)
+        self.num_actions = 20
+        self.population = self.rng.integers(0, self.num_actions, (10, 30), dtype=np.int32)
+        self.fitness = np.arange(10, dtype=np.float64)
+
+    def test_encode_individual(self):
+        """Test that known actions are kept and the genome is padded to num_steps"""
+        action_to_idx = {"a": 3, "b": 7}
+        genome = encode_individual(["a", "b", "unknown", "a"], action_to_idx, 6, self.num_actions, self.rng)
+        self.assertEqual(genome.shape, (6,))
+        self.assertEqual(genome.dtype, np.int32)
+        self.assertEqual(list(genome[[0, 1, 3]]), [3, 7, 3])
+        self.assertTrue(((genome >= 0) & (genome < self.num_actions)).all())
+
+    def test_tournament_selection(self):
+        """Test that the parents of a pair differ and the winner of a full tournament is the best"""
+        for with_replacement in (True, False):
+            parents1, parents2 = tournament_selection(self.fitness, 50, 3, self.rng, with_replacement)
+            self.assertEqual(parents1.shape, (50,))
+            self.assertTrue((parents1 != parents2).all())
+        parents1, _ = tournament_selection(self.fitness, 5, 200, self.rng)
+        self.assertTrue((parents1 == 9).all())
+
+    def test_crossover_n_points(self):
+        """Test that every gene of a child comes from one of its parents and genes are exchanged"""
+        parents1, parents2 = self.population[:5], self.population[5:]
+        children1, children2 = crossover_n_points(parents1, parents2, 3, 1.0, self.rng)
+        self.assertTrue(((children1 == parents1) | (children1 == parents2)).all())
+        # genes are swapped, never duplicated
+        self.assertTrue((np.where(children1 == parents1, children2 == parents2, children2 == parents1)).all())
+        self.assertFalse((children1 == parents1).all())
+        children1, children2 = crossover_n_points(parents1, parents2, 3, 0.0, self.rng)
+        self.assertTrue((children1 == parents1).all() and (children2 == parents2).all())
+
+    def test_crossover_uniform(self):
+        """Test that uniform crossover keeps genes at their positions"""
+        parents1, parents2 = self.population[:5], self.population[5:]
+        children1, children2 = crossover_uniform(parents1, parents2, 0.5, 1.0, self.rng)
+        self.assertTrue(((children1 == parents1) | (children1 == parents2)).all())
+        self.assertTrue(((children2 == parents1) | (children2 == parents2)).all())
+
+    def test_mutation_by_parameter(self):
+        """Test that mutated genes keep the action type"""
+        type_codes = np.arange(self.num_actions, dtype=np.int32) % 4
+        actions_by_type = [np.flatnonzero(type_codes == code) for code in range(4)]
+        mutated = mutation_by_parameter(self.population, type_codes, actions_by_type, 1.0, self.rng)
+        self.assertTrue((type_codes[mutated] == type_codes[self.population]).all())
+        mutated = mutation_by_action(self.population, self.num_actions, 0.0, self.rng)
+        self.assertTrue((mutated == self.population).all())
+
+    def test_steady_state_selection(self):
+        """Test that the worst parents are replaced by the best offspring"""
+        offspring = self.population[::-1].copy()
+        offspring_fitness = np.arange(10, dtype=np.float64) * 10
+        new_population, kept, selected = steady_state_selection(self.population, self.fitness, offspring, offspring_fitness, 3)
+        self.assertEqual(new_population.shape, self.population.shape)
+        self.assertEqual(sorted(kept), list(range(3, 10)))
+        self.assertEqual(sorted(selected), [7, 8, 9])
+
+if __name__ == '__main__':
+    unittest.main()
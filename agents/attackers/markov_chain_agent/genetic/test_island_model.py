@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+from checkpoint import save_checkpoint, load_checkpoint
+from island_model import MigrationChannel, run_island_processes
+
+POPULATION_SIZE = 20
+NUM_MIGRANTS = 3
+
+
+def initial_population(island_id):
+    """Genomes filled with the island id, scores increasing with the position"""
+    population = np.full([POPULATION_SIZE, 8], island_id, dtype=np.int32)
+    scores = np.zeros([POPULATION_SIZE, 6])
+    scores[:, 0] = np.arange(POPULATION_SIZE) + 100 * island_id
+    return population, scores
+
+
+def toy_island(island, path_results, num_generations, migration_interval, resume):
+    """
+    Stand-in for GeneticAgent.play_game: the population only changes by migration. The generations are
+    logged to generations.txt and at the first migration the island waits until it receives immigrants.
+    """
+    path_results = os.path.join(path_results, f"island_{island.island_id}")
+    os.makedirs(path_results, exist_ok=True)
+    checkpoint_path = os.path.join(path_results, "checkpoint.npz")
+    rng = np.random.default_rng(island.island_id)
+    if resume and os.path.exists(checkpoint_path):
+        population, scores, generation, _, _ = load_checkpoint(checkpoint_path, rng)
+    else:
+        (population, scores), generation = initial_population(island.island_id), 0
+    received = (population != island.island_id).any()
+    while generation < num_generations:
+        generation += 1
+        if generation % migration_interval == 0:
+            population, scores = island.migrate(population, scores, NUM_MIGRANTS)
+            deadline = time.monotonic() + 10
+            while not received and not (population != island.island_id).any() and time.monotonic() < deadline:
+                time.sleep(0.01)
+                population, scores = island.migrate(population, scores, NUM_MIGRANTS)
+            if not received and (population != island.island_id).any():
+                received = True
+                with open(os.path.join(path_results, "first_immigrants.txt"), "w") as f:
+                    f.write(str(generation))
+        with open(os.path.join(path_results, "generations.txt"), "a") as f:
+            f.write(f"{generation}\n")
+        save_checkpoint(checkpoint_path, population, scores, generation, rng)
+
+
+class TestMigrationChannel(unittest.TestCase):
+    def test_ring_migration(self):
+        """Test that the best individuals go to the next island and replace its worst ones, without waiting for immigrants"""
+        queues = [queue.Queue() for _ in range(3)]
+        channels = [MigrationChannel(i, queues[i], queues[(i + 1) % 3]) for i in range(3)]
+        populations = [initial_population(i) for i in range(3)]
+        # the first island has no immigrants yet
+        population, scores = channels[0].migrate(*populations[0], NUM_MIGRANTS)
+        np.testing.assert_array_equal(population, populations[0][0])
+        population, scores = channels[1].migrate(*populations[1], NUM_MIGRANTS)
+        # the worst individuals of island 1 were replaced by the best ones of island 0, with their scores
+        np.testing.assert_array_equal(population[:NUM_MIGRANTS], 0)
+        np.testing.assert_array_equal(population[NUM_MIGRANTS:], 1)
+        np.testing.assert_array_equal(scores[:NUM_MIGRANTS, 0], np.arange(POPULATION_SIZE - NUM_MIGRANTS, POPULATION_SIZE))
+        np.testing.assert_array_equal(populations[1][0], 1)
+        self.assertTrue(queues[0].empty())
+        self.assertEqual(queues[2].qsize(), 1)
+
+
+class TestRunIslandProcesses(unittest.TestCase):
+    def run_islands(self, island_args, timeout=60):
+        thread = threading.Thread(target=run_island_processes, args=(toy_island, island_args))
+        thread.start()
+        thread.join(timeout)
+        if thread.is_alive():
+            for process in multiprocessing.active_children():
+                process.terminate()
+            self.fail("the islands did not exit")
+
+    def read(self, path_results, island_id, filename):
+        with open(os.path.join(path_results, f"island_{island_id}", filename)) as f:
+            return [int(line) for line in f.read().split()]
+
+    def test_two_islands_migrate_exit_and_resume(self):
+        """Test that 2 islands exchange migrants at the migration interval, exit cleanly and resume from their checkpoints"""
+        with tempfile.TemporaryDirectory() as tmp:
+            # island 0 keeps sending migrants (more than the pipe holds) after island 1 finished
+            self.run_islands([(tmp, 2000, 2, False), (tmp, 3, 2, False)])
+            for island_id, num_generations in ((0, 2000), (1, 3)):
+                self.assertEqual(self.read(tmp, island_id, "first_immigrants.txt"), [2])
+                self.assertEqual(self.read(tmp, island_id, "generations.txt"), list(range(1, num_generations + 1)))
+                population, _, generation, _, _ = load_checkpoint(os.path.join(tmp, f"island_{island_id}", "checkpoint.npz"), np.random.default_rng())
+                self.assertEqual(generation, num_generations)
+                self.assertEqual(set(np.unique(population)), {0, 1})
+
+            self.run_islands([(tmp, 2000, 2, True), (tmp, 6, 2, True)])
+            self.assertEqual(self.read(tmp, 0, "generations.txt"), list(range(1, 2001)))
+            self.assertEqual(self.read(tmp, 1, "generations.txt"), list(range(1, 7)))
+
+
+if __name__ == '__main__':
+    unittest.main()
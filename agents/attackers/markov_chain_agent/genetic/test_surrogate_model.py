@@ -0,0 +1,106 @@
+import unittest
+import numpy as np
+import pytest
+
+pytest.importorskip("env.game_components")
+from env.game_components import Action, ActionType, GameState, IP, Network, Service, Data
+from surrogate_model import SurrogateModel, state_facts
+
+GOOD_ACTION_REWARDS = {
+    ActionType.ScanNetwork: 10,
+    ActionType.FindServices: 20,
+    ActionType.ExploitService: 50,
+    ActionType.FindData: 75,
+    ActionType.ExfiltrateData: 75,
+}
+
+
+def fitness_from_counts(final_reward, num_good_actions, num_bad_actions, num_steps, won):
+    """Simplified fitness of the GeneticAgent: negative rewards are kept, winners score the highest"""
+    if won == 1:
+        return 7500 + 100000 / num_steps
+    return final_reward / num_steps if final_reward >= 0 else final_reward
+
+
+class TestSurrogateModel(unittest.TestCase):
+    def setUp(self):
+        """Scenario of one network where the data of a second host is exfiltrated to the first one"""
+        first, second = IP("192.168.1.2"), IP("192.168.1.3")
+        network = Network("192.168.1.0", 24)
+        ssh = Service("ssh", "passive", "8.1.0", False)
+        datapoint = Data("User1", "DataA")
+        self.actions = [
+            Action(ActionType.ScanNetwork, {"target_network": network, "source_host": first}),
+            Action(ActionType.FindServices, {"target_host": second, "source_host": first}),
+            Action(ActionType.ExploitService, {"target_host": second, "target_service": ssh, "source_host": first}),
+            Action(ActionType.FindData, {"target_host": second, "source_host": second}),
+            Action(ActionType.ExfiltrateData, {"target_host": first, "source_host": second, "data": datapoint}),
+        ]
+        # states after each action of the winning sequence
+        self.states = [
+            GameState(controlled_hosts={first}, known_hosts={first}, known_networks={network}),
+            GameState(controlled_hosts={first}, known_hosts={first, second}, known_networks={network}),
+            GameState(controlled_hosts={first}, known_hosts={first, second}, known_networks={network}, known_services={second: {ssh}}),
+            GameState(controlled_hosts={first, second}, known_hosts={first, second}, known_networks={network}, known_services={second: {ssh}}),
+            GameState(controlled_hosts={first, second}, known_hosts={first, second}, known_networks={network}, known_services={second: {ssh}},
+                      known_data={second: {datapoint}}),
+            GameState(controlled_hosts={first, second}, known_hosts={first, second}, known_networks={network}, known_services={second: {ssh}},
+                      known_data={second: {datapoint}, first: {datapoint}}),
+        ]
+        self.winner = np.array([0, 1, 2, 3, 4], dtype=np.int32)
+
+    def learned_model(self) -> SurrogateModel:
+        """Model which observed one rollout of the winning sequence"""
+        model = SurrogateModel(self.actions, GOOD_ACTION_REWARDS, fitness_from_counts)
+        model.observe_reset(self.states[0])
+        for i, action in enumerate(self.actions):
+            model.observe_step(self.states[i], action, self.states[i + 1], i == len(self.actions) - 1)
+        return model
+
+    def test_learns_from_rollouts(self):
+        """Test that the effects and goal actions are learned and the recorded rollout is simulated with its real counts"""
+        model = self.learned_model()
+        self.assertEqual(model.initial_facts, state_facts(self.states[0]))
+        for i in range(len(self.actions)):
+            self.assertEqual(model.effects[i], state_facts(self.states[i + 1]) - state_facts(self.states[i]))
+        self.assertEqual(model.goal_actions, {4})
+        self.assertEqual(model.simulate(self.winner), (75, 5, 0, 0, 5, 1))
+        # repeating an action without new effects is boring, an action without its preconditions is invalid
+        self.assertEqual(model.simulate(np.array([0, 0, 3, 1, 1])), (10, 2, 2, 1, 5, 0))
+        # the model learned in a worker process is merged into an empty one
+        merged = SurrogateModel(self.actions, GOOD_ACTION_REWARDS, fitness_from_counts)
+        merged.merge(model.pop_updates())
+        self.assertEqual(merged.effects, model.effects)
+        self.assertEqual(merged.simulate(self.winner), model.simulate(self.winner))
+        self.assertEqual(model.pop_updates(), {})
+
+    def test_invalid_individuals_ranked_last(self):
+        """Test that individuals with invalid actions (-100 each) get the lowest estimates and are screened out"""
+        model = self.learned_model()
+        genomes = np.array([
+            [0, 2, 2, 4, 4],  # exploit and exfiltration without their preconditions
+            [0, 1, 2, 3, 4],
+            [1, 1, 1, 1, 1],  # the target host is not known
+            [0, 0, 0, 1, 1],
+            [0, 1, 1, 1, 1],
+        ], dtype=np.int32)
+        estimates = [model.estimate(genome) for genome in genomes]
+        self.assertEqual(estimates[0], -390)
+        self.assertEqual(estimates[2], -500)
+        self.assertEqual(set(np.argsort(estimates)[:2]), {0, 2})
+        np.testing.assert_array_equal(model.screen(genomes, 0.6), [1, 3, 4])
+        np.testing.assert_array_equal(model.screen(genomes, 0.2, min_selected=2), [1, 3])
+
+    def test_full_fraction_is_noop(self):
+        """Test that with surrogate_fraction 1.0, or before the first rollout, all offspring are played in their order"""
+        genomes = np.random.default_rng(0).integers(0, len(self.actions), (7, 5), dtype=np.int32)
+        model = self.learned_model()
+        # no estimate is computed when all offspring are played
+        model.estimate = None
+        np.testing.assert_array_equal(model.screen(genomes, 1.0), np.arange(7))
+        model = SurrogateModel(self.actions, GOOD_ACTION_REWARDS, fitness_from_counts)
+        np.testing.assert_array_equal(model.screen(genomes, 0.2), np.arange(7))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,8 +4,8 @@ import logging
 import argparse
 import numpy as np
 import mlflow  # used for evaluation logging (if needed)
-import random
 import json
+from collections import deque
 from os import path, makedirs
 
 
@@ -16,13 +16,18 @@ sys.path.append(path.dirname(path.dirname(path.dirname(path.abspath(__file__) ))
 # with the path fixed, we can import now
 from base_agent import BaseAgent
 from agent_utils import generate_valid_actions
+from solution_store import SolutionWriter
+from action_sampler import MarkovActionSampler
+from transition_model_utils import TransitionModel, action_type_code, GOOD_RESULT
 
 
 class MarkovChainAgent(BaseAgent):
-    def __init__(self, host, port, role, episodes) -> None:
+    def __init__(self, host, port, role, episodes, solutions_path=os.path.join("results", "solutions.jsonl"), transition_model_path=None) -> None:
         super().__init__(host, port, role)
         np.set_printoptions(suppress=True, precision=6)
-        self.parsed_solutions = []
+        # every finished episode is appended to the solution store
+        self.solution_writer = SolutionWriter(solutions_path)
+        self.num_played_episodes = 0
         self.episodes = episodes
 
         # Set up a logger if not already configured by BaseAgent.
@@ -30,6 +35,22 @@ class MarkovChainAgent(BaseAgent):
 
         # Load and process the transition probabilities.
         self.transitions = self.load_and_prepare_transitions("transition_probabilities.json")
+        self.sampler = MarkovActionSampler(self.transitions)
+        # optional higher-order (and state-conditioned) model replacing the first-order transitions
+        self.transition_model = TransitionModel.load(transition_model_path) if transition_model_path else None
+        self._reset_history()
+
+    def _reset_history(self) -> None:
+        """Action types played in the episode and the progress mask of the types which changed the state"""
+        order = self.transition_model.order if self.transition_model else 0
+        self._history = deque(maxlen=max(order, 1))
+        self._progress = 0
+
+    def _record_history(self, action: Action, result: int) -> None:
+        code = action_type_code(action.action_type)
+        self._history.append(code)
+        if result == GOOD_RESULT:
+            self._progress |= 1 << code
 
     @staticmethod
     def parse_action(action: Action) -> dict:
@@ -130,27 +151,19 @@ class MarkovChainAgent(BaseAgent):
         ]
 
     def select_action_markov_chain_agent(self, observation: Observation, last_action_type) -> Action:
-        valid_actions = self.generate_valid_actions_separated(observation.state)
+        """
+        Samples the action type from the transition row of the last action type and a valid action of that type.
+        With a transition model the row is given by the context of the last actions (and progress) instead.
+        The valid actions are updated incrementally from the previous step of the episode.
+        """
+        self.sampler.update(observation.state)
+        if self.transition_model is not None:
+            context = self.transition_model.context_key(self._history, self._progress)
+            return self.sampler.sample(context, probabilities=self.transition_model.row_probabilities(context))
 
         # For the initial step, use the key "Initial".
         key = "Initial" if last_action_type is None else last_action_type
-
-        if key not in self.transitions:
-            raise ValueError(f"Transition probabilities for key {key} not found.")
-
-        probabilities = self.transitions[key]
-        if len(valid_actions) != len(probabilities):
-            raise ValueError(f"Mismatch between number of action groups ({len(valid_actions)}) and "
-                             f"provided probabilities ({len(probabilities)}) for {key}.")
-
-        selected_action = None
-        while selected_action is None:
-            # Select one of the action groups based on the probabilities.
-            selected_index = np.random.choice(len(valid_actions), p=probabilities)
-            action_list = valid_actions[selected_index]
-            if action_list:
-                selected_action = random.choice(action_list)
-        return selected_action
+        return self.sampler.sample(key)
 
     def analyze_action(self, action: Action, current_state, new_state, observation: Observation, is_last_action=False) -> int:
         """
@@ -204,11 +217,14 @@ class MarkovChainAgent(BaseAgent):
             self._logger.info(f"Starting episode {episode}")
             episodic_return = 0
             num_steps = 0
-            current_solution = []
+            solution_actions = []
+            solution_results = []
             last_action_type = None
 
             observation = self.request_game_reset()
             current_state = observation.state
+            self.sampler.reset(current_state)
+            self._reset_history()
 
             while observation and not observation.end:
                 num_steps += 1
@@ -221,11 +237,15 @@ class MarkovChainAgent(BaseAgent):
 
                 is_last_action = bool(observation.end) if observation else True
                 result = self.analyze_action(action, previous_state, current_state, observation, is_last_action)
-                current_solution.append([self.parse_action(action), result])
+                solution_actions.append(action)
+                solution_results.append(result)
                 episodic_return += result
+                self._record_history(action, result)
 
                 if is_last_action:
-                    self.parsed_solutions.append(current_solution)
+                    end_reason = observation.info.get("end_reason") if observation and observation.info else None
+                    self.solution_writer.append(self.num_played_episodes, solution_actions, solution_results, str(end_reason) if end_reason else None)
+                    self.num_played_episodes += 1
                     break
 
             returns.append(episodic_return)
@@ -258,39 +278,8 @@ class MarkovChainAgent(BaseAgent):
                           f"Mean return = {np.mean(returns):.3f} ± {np.std(returns):.3f}, "
                           f"Total steps = {total_steps}")
 
-        # Optionally, save the parsed solutions.
-        self.save_solutions_json(os.path.join("results", "parsed_population.json"))
-
         return observation, total_steps
 
-    def save_solutions_json(self, filepath: str):
-        """Save parsed solutions into a JSON file."""
-        if os.path.exists(filepath):
-            with open(filepath, "r") as f:
-                try:
-                    outer_array = json.load(f)
-                except json.JSONDecodeError:
-                    outer_array = []
-        else:
-            outer_array = []
-
-        parsed_solutions_run = []
-        for solution in self.parsed_solutions:
-            solution_str_list = []
-            for action_result in solution:
-                if isinstance(action_result, list) and len(action_result) == 2:
-                    action_str = f"[Action {str(action_result[0])}, {str(action_result[1])}]"
-                    solution_str_list.append(action_str)
-                else:
-                    solution_str_list.append(str(action_result))
-            parsed_solutions_run.append(solution_str_list)
-
-        outer_array.append(parsed_solutions_run)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, "w") as f:
-            json.dump(outer_array, f, indent=4)
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--host", help="Host where the game server is", default="127.0.0.1", required=False)
@@ -300,6 +289,10 @@ if __name__ == '__main__':
                         default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs"))
     parser.add_argument("--evaluate", help="Evaluate the agent performance", action="store_true")
     parser.add_argument("--mlflow_url", help="URL for mlflow tracking server", default=None)
+    parser.add_argument("--solutions", help="Solution store (JSON Lines) where the played episodes are appended",
+                        default=os.path.join("results", "solutions.jsonl"))
+    parser.add_argument("--transition_model", help="Transition model (.npz, see utils/solutions_to_matrix.py) used instead of transition_probabilities.json",
+                        default=None)
     args = parser.parse_args()
 
     if not os.path.exists(args.logdir):
@@ -312,13 +305,14 @@ if __name__ == '__main__':
         level=logging.INFO
     )
 
-    agent = MarkovChainAgent(args.host, args.port, "Attacker", args.episodes)
+    agent = MarkovChainAgent(args.host, args.port, "Attacker", args.episodes, args.solutions, args.transition_model)
     observation = agent.register()
 
     if not args.evaluate:
         observation, total_steps = agent.play_game(observation, args.episodes)
         agent._logger.info("Terminating interaction")
         agent.terminate_connection()
+        agent.solution_writer.close()
     else:
         experiment_name = "Evaluation of Genetic Agent"
         if args.mlflow_url:
@@ -383,6 +377,7 @@ if __name__ == '__main__':
 
             agent._logger.info("Terminating evaluation interaction")
             agent.terminate_connection()
+            agent.solution_writer.close()
             experiment_id = run.info.experiment_id
             run_id = run.info.run_id
             storage_location = "locally" if not args.mlflow_url else f"at {args.mlflow_url}"
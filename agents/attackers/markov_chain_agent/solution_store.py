@@ -0,0 +1,283 @@
+"""
+Append-only store of the solutions (played episodes) of the MarkovChainAgent.
+
+Every line of the store is the JSON record of one episode:
+    {"run": str, "episode": int, "actions": [Action.as_dict()], "results": [int], "end_reason": str or null}
+Records are written when the episode finishes, so the file is never rewritten and nothing is kept in memory.
+The reader also accepts the former format (one JSON list of runs, each a list of "[Action ..., result]" strings).
+SolutionColumns holds the action types and results of all episodes in flat NumPy arrays for fast analysis.
+"""
+import codecs
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+import numpy as np
+
+WIN_RESULT = 9
+DETECTION_RESULT = -9
+
+_LEGACY_RESULT = re.compile(r",\s*(-?\d+)\]\s*$")
+_LEGACY_ACTION_TYPE = re.compile(r"ActionType\.(\w+)|'type':\s*'(\w+)'")
+
+
+class SolutionWriter:
+    """
+    Appends episode records to the store. Every record is flushed when written.
+    The store is opened with the first record, so a writer which writes nothing leaves no file.
+    """
+
+    def __init__(self, filepath:str, run_id:str=None) -> None:
+        self.filepath = filepath
+        # the random suffix keeps the ids of runs started in the same second apart
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._file = None
+
+    def append(self, episode:int, actions:list, results:list, end_reason:str=None) -> None:
+        """Writes the record of one episode of the current run (actions are Actions or their dicts)"""
+        self.append_record({
+            "run": self.run_id,
+            "episode": episode,
+            "actions": [action if isinstance(action, dict) else action.as_dict() for action in actions],
+            "results": [int(result) for result in results],
+            "end_reason": end_reason,
+        })
+
+    def append_record(self, record:dict) -> None:
+        if self._file is None:
+            if os.path.dirname(self.filepath):
+                os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            self._file = open(self.filepath, "a")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _legacy_records(data:list):
+    for run_idx, run in enumerate(data):
+        for episode, sequence in enumerate(run):
+            results = []
+            for action in sequence:
+                match = _LEGACY_RESULT.search(action)
+                results.append(int(match.group(1)) if match else 0)
+            yield {"run": str(run_idx), "episode": episode, "actions": list(sequence), "results": results, "end_reason": None}
+
+
+def _is_legacy(filepath:str) -> bool:
+    """True for the former format: the whole file is one JSON list, possibly after whitespace or a BOM"""
+    with open(filepath, "r", encoding="utf-8-sig") as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return False
+            chunk = chunk.lstrip()
+            if chunk:
+                return chunk.startswith("[")
+
+
+def read_solutions(filepath:str):
+    """Yields the episode records of the store in the order they were written"""
+    with open(filepath, "r", encoding="utf-8-sig") as f:
+        if _is_legacy(filepath):
+            yield from _legacy_records(json.load(f))
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_runs(filepath:str) -> list:
+    """Returns the records of the store grouped by run (list of lists of records)"""
+    runs = {}
+    for record in read_solutions(filepath):
+        runs.setdefault(record["run"], []).append(record)
+    return list(runs.values())
+
+
+def action_type_name(action) -> str:
+    """Name of the action type (e.g. 'ScanNetwork') of a stored action"""
+    if isinstance(action, dict):
+        return str(action.get("action_type", action.get("type"))).split(".")[-1]
+    match = _LEGACY_ACTION_TYPE.search(action)
+    return match.group(1) or match.group(2)
+
+
+def action_types(record:dict) -> list:
+    return [action_type_name(action) for action in record["actions"]]
+
+
+def is_win(record:dict) -> bool:
+    return bool(record["results"]) and record["results"][-1] == WIN_RESULT
+
+
+def is_detected(record:dict) -> bool:
+    return bool(record["results"]) and record["results"][-1] == DETECTION_RESULT
+
+
+def truncate_at_win(record:dict) -> dict:
+    """Copy of the record ending with the first winning action"""
+    end = record["results"].index(WIN_RESULT) + 1 if WIN_RESULT in record["results"] else len(record["results"])
+    return dict(record, actions=record["actions"][:end], results=record["results"][:end])
+
+
+# Codes of the action types in SolutionColumns, in the order of the transition matrix
+ACTION_TYPE_NAMES = ["ScanNetwork", "FindServices", "ExploitService", "FindData", "ExfiltrateData"]
+ACTION_TYPE_CODES = {name:code for code, name in enumerate(ACTION_TYPE_NAMES)}
+UNKNOWN_ACTION_TYPE = -1
+
+
+class SolutionColumns:
+    """
+    Columnar representation of the episodes of a solution store.
+
+    The actions of all episodes are concatenated: action_types (int8 codes of ACTION_TYPE_NAMES)
+    and results (int8), with the actions of episode i in [offsets[i], offsets[i + 1]).
+    run_index (int32) is the index into run_ids of the run of every episode.
+    """
+
+    def __init__(self, action_types:np.ndarray, results:np.ndarray, offsets:np.ndarray, run_index:np.ndarray, run_ids:list) -> None:
+        self.action_types = np.asarray(action_types, dtype=np.int8)
+        self.results = np.asarray(results, dtype=np.int8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.run_index = np.asarray(run_index, dtype=np.int32)
+        self.run_ids = list(run_ids)
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def episode_lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @classmethod
+    def from_records(cls, records) -> "SolutionColumns":
+        columns = cls(np.zeros(0), np.zeros(0), np.zeros(1), np.zeros(0), [])
+        columns.extend(records)
+        return columns
+
+    def extend(self, records) -> None:
+        """Appends the episode records to the columns"""
+        run_to_idx = {run_id:idx for idx, run_id in enumerate(self.run_ids)}
+        types, results, lengths, run_index = [], [], [], []
+        for record in records:
+            types.extend(ACTION_TYPE_CODES.get(action_type_name(action), UNKNOWN_ACTION_TYPE) for action in record["actions"])
+            results.extend(record["results"])
+            lengths.append(len(record["results"]))
+            run_index.append(run_to_idx.setdefault(record["run"], len(run_to_idx)))
+        self.action_types = np.concatenate([self.action_types, np.array(types, dtype=np.int8)])
+        self.results = np.concatenate([self.results, np.array(results, dtype=np.int8)])
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths, dtype=np.int64)])
+        self.run_index = np.concatenate([self.run_index, np.array(run_index, dtype=np.int32)])
+        self.run_ids = list(run_to_idx)
+
+    def last_results(self) -> np.ndarray:
+        """Result of the last action of every episode (0 for empty episodes)"""
+        last_results = np.zeros(self.num_episodes, dtype=np.int8)
+        non_empty = self.episode_lengths > 0
+        last_results[non_empty] = self.results[self.offsets[1:][non_empty] - 1]
+        return last_results
+
+    def wins(self) -> np.ndarray:
+        return self.last_results() == WIN_RESULT
+
+    def detections(self) -> np.ndarray:
+        return self.last_results() == DETECTION_RESULT
+
+    def select(self, episode_mask:np.ndarray) -> "SolutionColumns":
+        """Columns of the selected episodes"""
+        episode_mask = np.asarray(episode_mask, dtype=bool)
+        lengths = self.episode_lengths[episode_mask]
+        action_mask = np.repeat(episode_mask, self.episode_lengths)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return SolutionColumns(self.action_types[action_mask], self.results[action_mask], offsets, self.run_index[episode_mask], self.run_ids)
+
+    def transition_counts(self) -> np.ndarray:
+        """[from_type, to_type] counts of consecutive actions within the episodes (unknown types are skipped)"""
+        num_types = len(ACTION_TYPE_NAMES)
+        same_episode = np.ones(max(len(self.action_types) - 1, 0), dtype=bool)
+        boundaries = self.offsets[1:-1] - 1
+        same_episode[boundaries[(boundaries >= 0) & (boundaries < len(same_episode))]] = False
+        from_types, to_types = self.action_types[:-1].astype(np.int64), self.action_types[1:].astype(np.int64)
+        valid = same_episode & (from_types >= 0) & (to_types >= 0)
+        counts = np.bincount(from_types[valid] * num_types + to_types[valid], minlength=num_types * num_types)
+        return counts.reshape(num_types, num_types)
+
+    def _boundary_type_counts(self, positions:np.ndarray) -> np.ndarray:
+        types = self.action_types[positions[self.episode_lengths > 0]]
+        return np.bincount(types[types >= 0], minlength=len(ACTION_TYPE_NAMES))
+
+    def initial_counts(self) -> np.ndarray:
+        """Counts of the action types of the first actions of the episodes"""
+        return self._boundary_type_counts(self.offsets[:-1])
+
+    def final_counts(self) -> np.ndarray:
+        """Counts of the action types of the last actions of the episodes"""
+        return self._boundary_type_counts(self.offsets[1:] - 1)
+
+    def save(self, filename:str, source_size:int=0, source_digest:str="") -> None:
+        np.savez(filename, action_types=self.action_types, results=self.results, offsets=self.offsets,
+                 run_index=self.run_index, run_ids=np.array(self.run_ids, dtype=str), source_size=source_size,
+                 source_digest=source_digest)
+
+    @classmethod
+    def _load_npz(cls, filename:str):
+        with np.load(filename) as data:
+            columns = cls(data["action_types"], data["results"], data["offsets"], data["run_index"], [str(x) for x in data["run_ids"]])
+            source_digest = str(data["source_digest"]) if "source_digest" in data else ""
+            return columns, int(data["source_size"]), source_digest
+
+    @staticmethod
+    def _source_digest(filepath:str, size:int) -> str:
+        """Hash of the first and the last (up to) 64 KiB of the first size bytes of the store"""
+        chunk = 1 << 16
+        digest = hashlib.sha1()
+        with open(filepath, "rb") as f:
+            digest.update(f.read(min(chunk, size)))
+            if size > chunk:
+                f.seek(max(chunk, size - chunk))
+                digest.update(f.read(size - f.tell()))
+        return digest.hexdigest()
+
+    @classmethod
+    def load(cls, filepath:str, cache:bool=True, write_cache:bool=True) -> "SolutionColumns":
+        """
+        Columns of a solution store, or of columns saved with save (.npz).
+        For a JSON Lines store the columns are cached in '<filepath>.columns.npz' (written only if write_cache).
+        The store is append-only, so only the records appended since the cache was written are parsed.
+        The cache stores the size and a hash of the beginning and the end of the parsed part of the store,
+        and is discarded if the store does not start with the same content anymore (e.g. it was replaced).
+        """
+        if filepath.endswith(".npz"):
+            return cls._load_npz(filepath)[0]
+        cache_path = filepath + ".columns.npz"
+        size = os.path.getsize(filepath)
+        if not cache or _is_legacy(filepath):
+            return cls.from_records(read_solutions(filepath))
+        columns, parsed_size, parsed_digest = cls._load_npz(cache_path) if os.path.exists(cache_path) else (cls.from_records([]), 0, "")
+        if parsed_size > size or (parsed_size and parsed_digest != cls._source_digest(filepath, parsed_size)):
+            # the store was replaced
+            columns, parsed_size = cls.from_records([]), 0
+        if parsed_size < size:
+            with open(filepath, "rb") as f:
+                f.seek(parsed_size)
+                lines = f.read(size - parsed_size).split(b"\n")
+            if parsed_size == 0 and len(lines) > 1:
+                lines[0] = lines[0].removeprefix(codecs.BOM_UTF8)
+            # an incomplete last line (being written) is parsed next time
+            parsed_size = size - len(lines[-1])
+            columns.extend(json.loads(line) for line in lines[:-1] if line.strip())
+            if write_cache:
+                columns.save(cache_path, parsed_size, cls._source_digest(filepath, parsed_size))
+        return columns
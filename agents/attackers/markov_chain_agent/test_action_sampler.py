@@ -0,0 +1,71 @@
+import random
+import unittest
+import numpy as np
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+pytest.importorskip("mlflow")
+from AIDojoCoordinator.game_components import GameState, IP, Network, Service, Data
+from action_sampler import AliasTable, ValidActionSets
+from markov_chain_agent import MarkovChainAgent
+
+
+class TestAliasTable(unittest.TestCase):
+    def test_sampling_frequencies(self):
+        """Test that the sampled frequencies match the (unnormalized) probabilities"""
+        rng = random.Random(3)
+        for probabilities in ([0.5, 0.2, 0.2, 0.1, 0.0], [1, 0, 0, 0, 3], [0.0, 0.0, 1.0, 0.0, 0.0], [0.2] * 5):
+            table = AliasTable(probabilities)
+            samples = 100000
+            counts = np.bincount([table.sample(rng) for _ in range(samples)], minlength=len(probabilities))
+            expected = np.asarray(probabilities, dtype=np.float64) / sum(probabilities)
+            np.testing.assert_allclose(counts / samples, expected, atol=0.01)
+            self.assertTrue(np.all(counts[expected == 0] == 0))
+
+    def test_zero_probabilities(self):
+        """Test that a distribution without probability mass is rejected"""
+        with self.assertRaises(ValueError):
+            AliasTable([0, 0, 0])
+
+
+class TestValidActionSets(unittest.TestCase):
+    def random_states(self, count:int):
+        """Sequence of mostly growing states, with a smaller state from time to time"""
+        rng = random.Random(5)
+        hosts = [IP(f"192.168.{n}.{i}") for n in range(2) for i in range(1, 8)] + [IP("213.47.23.195")]
+        networks = [Network("192.168.0.0", 24), Network("192.168.1.0", 24), Network("213.47.23.192", 26)]
+        services = [Service("ssh", "passive", "8.1.0", False), Service("http", "passive", "2.4", False)]
+        data = [Data("User1", "DataA"), Data("User2", "DataB"), Data("User3", "DataC")]
+        known_hosts, controlled, known_networks, known_services, known_data = set(), set(), set(), {}, {}
+        for step in range(count):
+            if step % 10 == 9:
+                known_hosts, controlled, known_networks, known_services, known_data = set(hosts[:2]), {hosts[0]}, set(networks[:1]), {}, {}
+            known_hosts.add(rng.choice(hosts))
+            if rng.random() < 0.4:
+                controlled.add(rng.choice(sorted(known_hosts)))
+            if rng.random() < 0.3:
+                known_networks.add(rng.choice(networks))
+            if rng.random() < 0.4:
+                known_services.setdefault(rng.choice(sorted(known_hosts)), set()).add(rng.choice(services))
+            if controlled and rng.random() < 0.3:
+                known_data.setdefault(rng.choice(sorted(controlled)), set()).add(rng.choice(data))
+            yield GameState(
+                controlled_hosts=set(controlled),
+                known_hosts=set(known_hosts),
+                known_services={host: set(items) for host, items in known_services.items()},
+                known_data={host: set(items) for host, items in known_data.items()},
+                known_networks=set(known_networks),
+            )
+
+    def test_matches_generate_valid_actions_separated(self):
+        """Test that the incrementally updated sets equal the valid actions of the agent on a sequence of states"""
+        valid_actions = ValidActionSets()
+        for state in self.random_states(100):
+            valid_actions.update(state)
+            expected = MarkovChainAgent.generate_valid_actions_separated(None, state)
+            self.assertEqual([set(actions) for actions in valid_actions.by_type], [set(actions) for actions in expected])
+            self.assertEqual([len(actions) for actions in valid_actions.by_type], [len(set(actions)) for actions in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import codecs
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from solution_store import SolutionWriter, SolutionColumns, read_solutions, read_runs, action_types, is_win, truncate_at_win
+
+ACTIONS = [
+    {"action_type": "ActionType.ScanNetwork", "parameters": {"target_network": "192.168.1.0/24", "source_host": "192.168.2.2"}},
+    {"action_type": "ActionType.FindServices", "parameters": {"target_host": "192.168.1.3", "source_host": "192.168.2.2"}},
+    {"action_type": "ActionType.ExfiltrateData", "parameters": {"target_host": "213.47.23.195", "source_host": "192.168.1.3", "data": "User1:DataA"}},
+]
+
+
+class TestSolutionStore(unittest.TestCase):
+    def test_writer_round_trip(self):
+        """Test that the records of two runs are read back in order and grouped by run"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "results", "solutions.jsonl")
+            with SolutionWriter(filepath) as writer:
+                writer.append(0, ACTIONS, [1, 0, 9], "goal_reached")
+                writer.append(1, ACTIONS[:2], [1, -9], "detected")
+            with SolutionWriter(filepath) as writer:
+                writer.append(0, ACTIONS[:1], [1])
+            records = list(read_solutions(filepath))
+            runs = read_runs(filepath)
+        self.assertEqual([record["episode"] for record in records], [0, 1, 0])
+        self.assertEqual(records[0]["actions"], ACTIONS)
+        self.assertEqual(action_types(records[0]), ["ScanNetwork", "FindServices", "ExfiltrateData"])
+        self.assertEqual(records[1]["end_reason"], "detected")
+        self.assertIsNone(records[2]["end_reason"])
+        self.assertEqual([len(run) for run in runs], [2, 1])
+        self.assertNotEqual(records[0]["run"], records[2]["run"])
+
+    def test_run_ids_are_unique(self):
+        """Test that writers created in the same second get different run ids"""
+        self.assertEqual(len({SolutionWriter("solutions.jsonl").run_id for _ in range(20)}), 20)
+
+    def test_no_file_without_records(self):
+        """Test that the store is created only with the first record"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "results", "solutions.jsonl")
+            writer = SolutionWriter(filepath)
+            writer.close()
+            self.assertFalse(os.path.exists(os.path.dirname(filepath)))
+            with SolutionWriter(filepath) as writer:
+                writer.append(0, ACTIONS[:1], [1])
+            self.assertTrue(os.path.exists(filepath))
+
+    def test_legacy_reader(self):
+        """Test that the former JSON list of runs is read as records"""
+        legacy = [
+            [["[Action <ActionType.ScanNetwork|{'target_network': 192.168.1.0/24}>, 1]",
+              "[Action <ActionType.ExfiltrateData|{'target_host': 213.47.23.195}>, 9]"]],
+            [["[{'type': 'FindServices', 'params': {}}, -1]", "[{'type': 'FindData', 'params': {}}, -9]"],
+             ["[Action <ActionType.ScanNetwork|{}>]"]],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "parsed_population.json")
+            with open(filepath, "w") as f:
+                json.dump(legacy, f)
+            records = list(read_solutions(filepath))
+            runs = read_runs(filepath)
+            # the same document after a BOM and whitespace
+            with open(filepath, "w", encoding="utf-8-sig") as f:
+                f.write("\n  \n" + json.dumps(legacy, indent=4))
+            self.assertEqual(list(read_solutions(filepath)), records)
+            self.assertEqual(SolutionColumns.load(filepath).num_episodes, len(records))
+            self.assertFalse(os.path.exists(filepath + ".columns.npz"))
+        self.assertEqual([(record["run"], record["episode"]) for record in records], [("0", 0), ("1", 0), ("1", 1)])
+        self.assertEqual(records[0]["results"], [1, 9])
+        self.assertEqual(records[1]["results"], [-1, -9])
+        self.assertEqual(records[2]["results"], [0])
+        self.assertEqual(action_types(records[0]), ["ScanNetwork", "ExfiltrateData"])
+        self.assertEqual(action_types(records[1]), ["FindServices", "FindData"])
+        self.assertTrue(is_win(records[0]))
+        self.assertEqual([len(run) for run in runs], [1, 2])
+
+    def test_truncate_at_win(self):
+        """Test that the actions after the first win are dropped"""
+        record = {"run": "r", "episode": 0, "actions": ACTIONS, "results": [9, 1, 0], "end_reason": None}
+        truncated = truncate_at_win(record)
+        self.assertEqual(truncated["actions"], ACTIONS[:1])
+        self.assertEqual(truncated["results"], [9])
+
+
+class TestSolutionColumnsCache(unittest.TestCase):
+    def write_store(self, filepath:str, results:list, mode:str="a") -> None:
+        if mode == "w" and os.path.exists(filepath):
+            os.remove(filepath)
+        with SolutionWriter(filepath, run_id="run") as writer:
+            for episode, episode_results in enumerate(results):
+                writer.append(episode, ACTIONS[:len(episode_results)], episode_results)
+
+    def assert_same_columns(self, columns:SolutionColumns, filepath:str) -> None:
+        expected = SolutionColumns.from_records(read_solutions(filepath))
+        np.testing.assert_array_equal(columns.action_types, expected.action_types)
+        np.testing.assert_array_equal(columns.results, expected.results)
+        np.testing.assert_array_equal(columns.offsets, expected.offsets)
+
+    def test_appended_records_are_parsed(self):
+        """Test that the cached columns are extended with the records appended to the store"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "solutions.jsonl")
+            self.write_store(filepath, [[1, 9], [1, 0, -9]])
+            self.assert_same_columns(SolutionColumns.load(filepath), filepath)
+            self.assertTrue(os.path.exists(filepath + ".columns.npz"))
+            self.write_store(filepath, [[9]])
+            columns = SolutionColumns.load(filepath)
+            self.assert_same_columns(columns, filepath)
+            self.assertEqual(columns.num_episodes, 3)
+            # the same store saved with a BOM
+            with open(filepath, "rb") as f:
+                content = f.read()
+            with open(filepath, "wb") as f:
+                f.write(codecs.BOM_UTF8 + content)
+            columns = SolutionColumns.load(filepath)
+            self.assert_same_columns(columns, filepath)
+            self.assertEqual(columns.num_episodes, 3)
+
+    def test_replaced_store_of_same_size(self):
+        """Test that the cache is rebuilt when the store is replaced by another one of the same size"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "solutions.jsonl")
+            self.write_store(filepath, [[1, 9], [1, 0, -9]])
+            SolutionColumns.load(filepath)
+            size = os.path.getsize(filepath)
+            self.write_store(filepath, [[1, 0], [1, 0, -1]], mode="w")
+            self.assertEqual(os.path.getsize(filepath), size)
+            columns = SolutionColumns.load(filepath)
+            self.assert_same_columns(columns, filepath)
+            self.assertFalse(columns.wins().any())
+
+    def test_cache_not_written(self):
+        """Test that the cache file is written only if requested"""
+        with tempfile.TemporaryDirectory() as tmp:
+            filepath = os.path.join(tmp, "solutions.jsonl")
+            self.write_store(filepath, [[1, 9]])
+            self.assert_same_columns(SolutionColumns.load(filepath, write_cache=False), filepath)
+            self.assert_same_columns(SolutionColumns.load(filepath, cache=False), filepath)
+            self.assertFalse(os.path.exists(filepath + ".columns.npz"))
+
+
+if __name__ == '__main__':
+    unittest.main()
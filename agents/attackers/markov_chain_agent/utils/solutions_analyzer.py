@@ -1,100 +1,56 @@
-import json
-import statistics
+import sys
 import argparse
+from os import path
+import numpy as np
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+from solution_store import SolutionColumns
 
 # Default file path for data
 DEFAULT_DATA_PATH = ''
 
-def calculate_statistics(data, shortest_only=False):
+def winning_lengths(columns, shortest_only=False):
+    """Lengths of the winning sequences (final 9), only the shortest one of every run if shortest_only."""
+    wins = columns.wins()
+    lengths = columns.episode_lengths[wins]
+    if not shortest_only:
+        return lengths
+    no_win = np.iinfo(np.int64).max
+    shortest = np.full(len(columns.run_ids), no_win, dtype=np.int64)
+    np.minimum.at(shortest, columns.run_index[wins], lengths)
+    return shortest[shortest != no_win]
+
+def calculate_statistics(columns, shortest_only=False):
     """Calculate average, standard deviation, and absolute shortest action counts."""
-    action_counts = []
-    absolute_shortest = float('inf')
-    valid_shortest_sequences = []
-    
-    for outer_list in data:
-        # Filter sequences with final 9
-        valid_sequences = [
-            seq for seq in outer_list 
-            if has_final_nine(seq)
-        ]
-        
-        if shortest_only:
-            # Only keep the shortest valid sequence per outer_list
-            if valid_sequences:
-                shortest_sequence = min(valid_sequences, key=len)
-                action_counts.append(len(shortest_sequence))
-                valid_shortest_sequences.append(shortest_sequence)
-        else:
-            # Keep lengths of all valid sequences
-            for seq in valid_sequences:
-                action_counts.append(len(seq))
-        
-        # Update absolute shortest across all valid sequences
-        if valid_sequences:
-            absolute_shortest = min(absolute_shortest, min(len(seq) for seq in valid_sequences))
+    action_counts = winning_lengths(columns, shortest_only)
+    absolute_shortest = action_counts.min() if len(action_counts) else float('inf')
     
     # Calculate statistics
-    average_actions = statistics.mean(action_counts) if action_counts else 0
-    std_dev_actions = statistics.stdev(action_counts) if len(action_counts) > 1 else 0
+    average_actions = action_counts.mean() if len(action_counts) else 0
+    std_dev_actions = action_counts.std(ddof=1) if len(action_counts) > 1 else 0
     
-    return average_actions, std_dev_actions, absolute_shortest, valid_shortest_sequences
+    return average_actions, std_dev_actions, absolute_shortest, action_counts
 
-def has_final_nine(inner_list):
-    """Check if the last action in the inner list contains ', 9]'."""
-    if inner_list:
-        last_action = inner_list[-1]
-        return ', 9]' in last_action
-    return False
-
-def has_detection(inner_list):
-    """Check if the last action in the inner list contains ', -9]'."""
-    if inner_list:
-        last_action = inner_list[-1]
-        return ', -9]' in last_action
-    return False
-
-def calculate_winning_percentage(data, shortest_only):
+def calculate_winning_percentage(columns, shortest_only):
     """Calculate winning percentage and detection rate based on the shortest_only flag."""
-    total_individuals = 0
-    winning_individuals = 0
-    detection_individuals = 0
-    
-    for outer_list in data:
-        if shortest_only:
-            # Only check the shortest sequence in the current outer list
-            valid_sequences = [
-                seq for seq in outer_list 
-                if has_final_nine(seq)
-            ]
-            
-            if valid_sequences:
-                total_individuals += 1
-                shortest_sequence = min(valid_sequences, key=len)
-                
-                if has_final_nine(shortest_sequence):
-                    winning_individuals += 1
-        
-        else:
-            # Check all sequences in the current outer list
-            for inner_list in outer_list:
-                total_individuals += 1
-                
-                if has_final_nine(inner_list):
-                    winning_individuals += 1
-                
-                if has_detection(inner_list):
-                    detection_individuals += 1
+    if shortest_only:
+        # Only the shortest winning sequence of every run is checked
+        total_individuals = winning_individuals = len(winning_lengths(columns, True))
+        detection_individuals = 0
+    else:
+        total_individuals = columns.num_episodes
+        winning_individuals = int(columns.wins().sum())
+        detection_individuals = int(columns.detections().sum())
     
     winning_percentage = (winning_individuals / total_individuals) * 100 if total_individuals > 0 else 0.0
     detection_percentage = (detection_individuals / total_individuals) * 100 if total_individuals > 0 else 0.0
     
     return winning_percentage, detection_percentage, total_individuals
 
-def main(data_path):
+def main(data_path, cache=True):
     """Main function to load data and calculate statistics."""
-    # Load the JSON data from the file
-    with open(data_path, 'r') as file:
-        data = json.load(file)
+    # Load the columns (action types and results) of the solution store
+    data = SolutionColumns.load(data_path, cache)
     
     # Calculate and print statistics for both shortest_only = True and False
     for shortest_only in [True, False]:
@@ -120,11 +76,12 @@ def main(data_path):
 
 if __name__ == '__main__':
     # Set up argument parsing
-    parser = argparse.ArgumentParser(description='Process JSON data path.')
-    parser.add_argument('-d', '--data', default=DEFAULT_DATA_PATH, help='Data file path')
+    parser = argparse.ArgumentParser(description='Process solution store path.')
+    parser.add_argument('-d', '--data', default=DEFAULT_DATA_PATH, help='Solution store (JSON Lines, the former JSON format, or columns saved as .npz)')
+    parser.add_argument('--no_cache', action='store_true', help='Do not read or write the columns cache (<store>.columns.npz)')
     
     # Parse arguments
     args = parser.parse_args()
     
     # Run the main function with the provided or default path
-    main(args.data)
\ No newline at end of file
+    main(args.data, not args.no_cache)
\ No newline at end of file
@@ -1,51 +1,33 @@
+import sys
 import json
-from collections import defaultdict, Counter
 import argparse
+from os import path
+import numpy as np
+
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+sys.path.append(path.dirname(path.dirname(path.dirname(path.dirname(path.abspath(__file__))))))
+from solution_store import SolutionColumns, ACTION_TYPE_NAMES
+from transition_model_utils import TransitionModel
 
 # Default file paths
 DEFAULT_INPUT_FILE_PATH = ''
 DEFAULT_OUTPUT_FILE_PATH = ''
 
-def extract_action_types(sequence):
-    """Extract action types from a sequence of actions."""
-    return [action.split('<')[1].split('|')[0].split('.')[1] for action in sequence]
-
-def calculate_transitions(sequences):
-    """Calculate transitions, initial, and final counts from action sequences."""
-    action_types = set()
-    transitions = defaultdict(Counter)
-    initial_counts = Counter()
-    final_counts = Counter()
-    total_actions_handled = 0
-
-    for sequence_set in sequences:
-        for sequence in sequence_set:
-            action_list = extract_action_types(sequence)
-            initial_counts[action_list[0]] += 1
-            final_counts[action_list[-1]] += 1
-            
-            for i in range(len(action_list) - 1):
-                from_type = action_list[i]
-                to_type = action_list[i + 1]
-                transitions[from_type][to_type] += 1
-                total_actions_handled += 1
-                
-            action_types.update(action_list)
-
-    return transitions, initial_counts, final_counts, total_actions_handled, action_types
-
-def calculate_probabilities(transitions, initial_counts, final_counts, total_initial, total_final, column_order):
-    """Compute transition, initial, and final probabilities."""
-    matrix = defaultdict(lambda: defaultdict(float))
-    
-    for from_type in column_order[1:-1]:  # Exclude "Initial Action" and "Final Probability"
-        total_from_type = sum(transitions[from_type].values())
-        for to_type in column_order[1:-1]:
-            count = transitions[from_type].get(to_type, 0)
-            matrix[from_type][to_type] = round(count / total_from_type, 2) if total_from_type > 0 else 0
+def calculate_transitions(columns):
+    """Calculate transition, initial, and final counts (indexed as ACTION_TYPE_NAMES) from the solution columns."""
+    transitions = columns.transition_counts()
+    return transitions, columns.initial_counts(), columns.final_counts(), int(transitions.sum())
+
+def _normalize(counts):
+    totals = counts.sum(axis=-1, keepdims=True)
+    return np.round(np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0), 2)
 
-    initial_prob = {action_type: round(count / total_initial, 2) for action_type, count in initial_counts.items()}
-    final_prob = {action_type: round(count / total_final, 2) for action_type, count in final_counts.items()}
+def calculate_probabilities(transitions, initial_counts, final_counts):
+    """Compute transition, initial, and final probabilities."""
+    probabilities = _normalize(transitions)
+    matrix = {from_type: {to_type: float(p) for to_type, p in zip(ACTION_TYPE_NAMES, row)} for from_type, row in zip(ACTION_TYPE_NAMES, probabilities)}
+    initial_prob = {action_type: float(p) for action_type, p in zip(ACTION_TYPE_NAMES, _normalize(initial_counts))}
+    final_prob = {action_type: float(p) for action_type, p in zip(ACTION_TYPE_NAMES, _normalize(final_counts))}
 
     return matrix, initial_prob, final_prob
 
@@ -78,12 +60,13 @@ def build_json_data(matrix, initial_prob, final_prob, column_order):
     
     return json_data
 
-def main(input_file_path, output_file_path):
-    """Main function to process JSON data and calculate transition probabilities."""
-    # Load JSON data from file
-    with open(input_file_path, 'r') as file:
-        sequences = json.load(file)
-    
+def fit_transition_model(columns, order, state_conditioned):
+    """Higher-order (optionally state-conditioned) transition model of the solution columns."""
+    model = TransitionModel(order=order, state_conditioned=state_conditioned)
+    return model.fit(columns.action_types, columns.offsets, columns.results)
+
+def main(input_file_path, output_file_path, model_file_path=None, order=1, state_conditioned=False, cache=True):
+    """Main function to process the solution store and calculate transition probabilities."""
     # Initialize counters and process transitions
     column_order = [
         "Initial Action",
@@ -95,15 +78,13 @@ def main(input_file_path, output_file_path):
         "Final Probability"
     ]
     
-    transitions, initial_counts, final_counts, total_actions_handled, action_types = calculate_transitions(sequences)
-    
-    total_initial = sum(initial_counts.values())
-    total_final = sum(final_counts.values())
+    columns = SolutionColumns.load(input_file_path, cache)
+    if model_file_path:
+        fit_transition_model(columns, order, state_conditioned).save(model_file_path)
+    transitions, initial_counts, final_counts, total_actions_handled = calculate_transitions(columns)
     
     # Compute transition probabilities
-    matrix, initial_prob, final_prob = calculate_probabilities(
-        transitions, initial_counts, final_counts, total_initial, total_final, column_order
-    )
+    matrix, initial_prob, final_prob = calculate_probabilities(transitions, initial_counts, final_counts)
 
     # Build JSON data structure
     json_data = build_json_data(matrix, initial_prob, final_prob, column_order)
@@ -118,11 +99,15 @@ def main(input_file_path, output_file_path):
 if __name__ == '__main__':
     # Set up argument parsing
     parser = argparse.ArgumentParser(description='Process input and output JSON file paths.')
-    parser.add_argument('-i', '--input', default=DEFAULT_INPUT_FILE_PATH, help='Input JSON file path')
+    parser.add_argument('-i', '--input', default=DEFAULT_INPUT_FILE_PATH, help='Input solution store or columns (.npz), e.g. the output of filter_winning_solutions.py')
     parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_FILE_PATH, help='Output JSON file path')
+    parser.add_argument('-m', '--model', default=None, help='Output transition model (.npz) of the given order')
+    parser.add_argument('--order', default=1, type=int, help='Number of previous action types the model is conditioned on')
+    parser.add_argument('--state_conditioned', action='store_true', help='Condition the model also on the action types which already changed the state')
+    parser.add_argument('--no_cache', action='store_true', help='Do not read or write the columns cache (<store>.columns.npz)')
 
     # Parse arguments
     args = parser.parse_args()
 
     # Run the main function with provided or default paths
-    main(args.input, args.output)
+    main(args.input, args.output, args.model, args.order, args.state_conditioned, not args.no_cache)
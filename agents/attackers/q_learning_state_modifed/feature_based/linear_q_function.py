@@ -0,0 +1,154 @@
+"""
+Linear approximation of the Q-function over the features produced by FeatureExtractor.
+
+One weight vector is kept per action type, so the size of the model depends only on
+the number of features and action types, never on the number of visited states.
+Features can be used directly (log-scaled counts plus bias) or tile-coded.
+"""
+from dataclasses import dataclass
+from typing import Hashable, Sequence
+import numpy as np
+
+
+@dataclass
+class LinearQConfig:
+    """Configuration of the linear Q-function approximation"""
+    alpha: float = 0.1
+    gamma: float = 0.9
+    # 0 disables tile coding and uses log-scaled features directly
+    num_tilings: int = 0
+    num_tiles: int = 16
+    tile_width: float = 2.0
+    init_value: float = 0.0
+
+
+class LinearQFunction:
+    """
+    Q(s, a) = w[type(a)] . phi(s)
+
+    phi(s) is either [1, log1p(f_1), ..., log1p(f_n)] or a binary tile coding of the
+    feature vector with `num_tilings` offset tilings per feature.
+    """
+
+    def __init__(self, num_features: int, action_types: Sequence[Hashable], config: LinearQConfig = None) -> None:
+        self.config = config or LinearQConfig()
+        self.num_features = num_features
+        self.action_types = list(action_types)
+        self._type_to_idx = {action_type: idx for idx, action_type in enumerate(self.action_types)}
+        if self.config.num_tilings > 0:
+            self.dim = 1 + num_features * self.config.num_tilings * self.config.num_tiles
+            # each tiling is shifted by a fraction of the tile width
+            self._offsets = np.arange(self.config.num_tilings) * self.config.tile_width / self.config.num_tilings
+            self._step_size = self.config.alpha / (num_features * self.config.num_tilings)
+        else:
+            self.dim = 1 + num_features
+            self._step_size = self.config.alpha
+        self.weights = np.zeros([len(self.action_types), self.dim], dtype=np.float64)
+        # initial value is carried by the bias term
+        self.weights[:, 0] = self.config.init_value
+
+    def type_index(self, action_type: Hashable) -> int:
+        """Index of the weight vector used for the given action type"""
+        return self._type_to_idx[action_type]
+
+    def featurize(self, features: np.ndarray) -> np.ndarray:
+        """
+        Maps a feature vector [n] or a batch of feature vectors [B, n] to the
+        representation used by the approximator ([dim] or [B, dim]).
+        """
+        features = np.asarray(features, dtype=np.float64)
+        single = features.ndim == 1
+        features = np.atleast_2d(features)
+        batch_size = features.shape[0]
+        if self.config.num_tilings > 0:
+            num_tilings, num_tiles = self.config.num_tilings, self.config.num_tiles
+            # [B, n, tilings] index of the active tile in every tiling of every feature
+            tiles = np.floor((features[:, :, None] + self._offsets[None, None, :]) / self.config.tile_width).astype(np.int64)
+            np.clip(tiles, 0, num_tiles - 1, out=tiles)
+            base = (np.arange(self.num_features)[:, None] * num_tilings + np.arange(num_tilings)[None, :]) * num_tiles
+            active = 1 + base[None, :, :] + tiles
+            phi = np.zeros([batch_size, self.dim], dtype=np.float64)
+            phi[:, 0] = 1.0
+            phi[np.arange(batch_size)[:, None], active.reshape(batch_size, -1)] = 1.0
+        else:
+            phi = np.empty([batch_size, self.dim], dtype=np.float64)
+            phi[:, 0] = 1.0
+            phi[:, 1:] = np.log1p(np.maximum(features, 0))
+        return phi[0] if single else phi
+
+    def q_values(self, features: np.ndarray) -> np.ndarray:
+        """Q-values of all action types for one feature vector [n] or a batch [B, n]"""
+        return self.featurize(features) @ self.weights.T
+
+    def value(self, features: np.ndarray, action_type: Hashable) -> float:
+        """Q-value of a single (state, action type) pair"""
+        return float(self.featurize(features) @ self.weights[self._type_to_idx[action_type]])
+
+    def update_batch(self, features: np.ndarray, action_idx: np.ndarray, rewards: np.ndarray,
+                     next_features: np.ndarray, next_valid: np.ndarray, dones: np.ndarray) -> float:
+        """
+        Semi-gradient Q-learning update over a mini-batch of transitions.
+
+        Args:
+            features: [B, n] features of the states where the actions were played
+            action_idx: [B] indices of the action types played (see `type_index`)
+            rewards: [B] rewards received
+            next_features: [B, n] features of the resulting states
+            next_valid: [B, num_action_types] bool mask of action types available in the resulting states
+            dones: [B] bool flags of terminal transitions
+        Returns:
+            float: mean absolute TD error of the batch
+        """
+        action_idx = np.asarray(action_idx, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        next_valid = np.asarray(next_valid, dtype=bool)
+        dones = np.asarray(dones, dtype=bool)
+
+        phi = self.featurize(features)
+        q = np.einsum("bd,bd->b", phi, self.weights[action_idx])
+        next_q = self.featurize(next_features) @ self.weights.T
+        next_q = np.where(next_valid, next_q, -np.inf).max(axis=1)
+        next_q = np.where(dones | ~next_valid.any(axis=1), 0.0, next_q)
+
+        td_error = rewards + self.config.gamma * next_q - q
+        np.add.at(self.weights, action_idx, (self._step_size / len(action_idx)) * td_error[:, None] * phi)
+        return float(np.abs(td_error).mean())
+
+    def _layout(self) -> dict:
+        """Settings that determine the meaning of every weight"""
+        return {
+            "num_features": self.num_features,
+            "num_tilings": self.config.num_tilings,
+            "num_tiles": self.config.num_tiles,
+            "tile_width": self.config.tile_width,
+        }
+
+    def save(self, filename: str) -> None:
+        """Stores the weights and the configuration in a .npz file"""
+        np.savez(
+            filename,
+            weights=self.weights,
+            action_types=np.array([str(action_type) for action_type in self.action_types]),
+            alpha=self.config.alpha,
+            gamma=self.config.gamma,
+            **self._layout(),
+        )
+
+    def load(self, filename: str) -> None:
+        """
+        Loads weights stored by `save`. The action types, the number of features and
+        the tile coding have to match the current ones, otherwise the weights would be
+        silently used for different features.
+        """
+        with np.load(filename) as data:
+            stored_types = [str(x) for x in data["action_types"]]
+            if stored_types != [str(action_type) for action_type in self.action_types]:
+                raise ValueError(f"Stored action types {stored_types} do not match {self.action_types}")
+            for name, value in self._layout().items():
+                if name not in data:
+                    raise ValueError(f"Stored model has no {name}")
+                if data[name].item() != value:
+                    raise ValueError(f"Stored {name}={data[name].item()} does not match {value}")
+            if data["weights"].shape != self.weights.shape:
+                raise ValueError(f"Stored weights have shape {data['weights'].shape}, expected {self.weights.shape}")
+            self.weights = data["weights"].astype(np.float64)
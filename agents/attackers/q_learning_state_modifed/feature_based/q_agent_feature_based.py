@@ -13,14 +13,18 @@ import time
 
 from os import path, makedirs
 # with the path fixed, we can import now
-from AIDojoCoordinator.game_components import Action, Observation, GameState, AgentStatus
+from AIDojoCoordinator.game_components import Action, ActionType, Observation, GameState, AgentStatus
 from NetSecGameAgents.agents.base_agent import BaseAgent
 from NetSecGameAgents.agents.agent_utils import generate_valid_actions, state_as_ordered_string
 from feature_extractor import FeatureExtractor
+from linear_q_function import LinearQFunction, LinearQConfig
+
+ATTACKER_ACTION_TYPES = [ActionType.ScanNetwork, ActionType.FindServices, ActionType.ExploitService, ActionType.FindData, ActionType.ExfiltrateData]
+NUM_STATE_FEATURES = 5
 
 class QAgent(BaseAgent):
 
-    def __init__(self, host, port, role="Attacker", alpha=0.1, gamma=0.6, epsilon_start=0.9, epsilon_end=0.1, epsilon_max_episodes=5000, apm_limit:int=None) -> None:
+    def __init__(self, host, port, role="Attacker", alpha=0.1, gamma=0.6, epsilon_start=0.9, epsilon_end=0.1, epsilon_max_episodes=5000, apm_limit:int=None, linear:bool=False, num_tilings:int=0, batch_size:int=32) -> None:
         super().__init__(host, port, role)
         self.alpha = alpha
         self.gamma = gamma
@@ -33,6 +37,12 @@ class QAgent(BaseAgent):
         self._apm_limit = apm_limit
         # Simplificar la inicialización del extractor de características
         self.feature_extractor = FeatureExtractor()
+        # Linear approximation of Q with one weight vector per action type instead of the tabular q_values
+        self.q_function = None
+        if linear:
+            self.q_function = LinearQFunction(NUM_STATE_FEATURES, ATTACKER_ACTION_TYPES, LinearQConfig(alpha=alpha, gamma=gamma, num_tilings=num_tilings))
+        self.batch_size = batch_size
+        self._transitions = []
         if self._apm_limit:
             self.inter_action_interval = 60/apm_limit
         else:
@@ -40,6 +50,9 @@ class QAgent(BaseAgent):
 
     def store_q_table(self, filename):
         """Simplificar el almacenamiento"""
+        if self.q_function:
+            self.q_function.save(filename)
+            return
         with open(filename, "wb") as f:
             data = {
                 "q_table": self.q_values,
@@ -49,10 +62,13 @@ class QAgent(BaseAgent):
     def load_q_table(self,filename):
         """Simplificar la carga"""
         try:
-            with open(filename, "rb") as f:
-                data = pickle.load(f)
-                self.q_values = data["q_table"]
-                self._str_to_id = data["state_mapping"]
+            if self.q_function:
+                self.q_function.load(filename)
+            else:
+                with open(filename, "rb") as f:
+                    data = pickle.load(f)
+                    self.q_values = data["q_table"]
+                    self._str_to_id = data["state_mapping"]
             self._logger.info(f'Successfully loading file {filename}')
         except Exception as e:
             self._logger.info(f'Error loading file {filename}. {e}')
@@ -67,6 +83,38 @@ class QAgent(BaseAgent):
         # Discretizar características para usar como clave en Q-table
         return tuple(int(x) for x in features)
 
+    def _valid_type_mask(self, actions) -> np.ndarray:
+        """Boolean mask over ATTACKER_ACTION_TYPES of the types present in the list of actions"""
+        mask = np.zeros(len(ATTACKER_ACTION_TYPES), dtype=bool)
+        for action in actions:
+            if action.type in ATTACKER_ACTION_TYPES:
+                mask[self.q_function.type_index(action.type)] = True
+        return mask
+
+    def select_action_linear(self, observation:Observation, testing=False) -> tuple:
+        """
+        E-greedy selection using the linear Q-function. All actions of the same type
+        share the Q-value so the ties within the best type are broken randomly.
+        Returns the action and the features of the state.
+        """
+        actions = [a for a in generate_valid_actions(observation.state) if a.type in ATTACKER_ACTION_TYPES]
+        features = self.get_state_id(observation.state)
+        if random.uniform(0, 1) <= self.current_epsilon and not testing:
+            return random.choice(actions), features
+        q_values = self.q_function.q_values(np.array(features))
+        best_type = max({a.type for a in actions}, key=lambda t: (q_values[self.q_function.type_index(t)], random.random()))
+        return random.choice([a for a in actions if a.type == best_type]), features
+
+    def update_linear_q(self) -> None:
+        """Applies one vectorized update with the stored transitions and clears the buffer"""
+        if not self._transitions:
+            return
+        features, action_idx, rewards, next_features, next_valid, dones = zip(*self._transitions)
+        td_error = self.q_function.update_batch(np.array(features), np.array(action_idx), np.array(rewards),
+                                                np.array(next_features), np.array(next_valid), np.array(dones))
+        self.logger.debug(f"Linear Q update over {len(self._transitions)} transitions. Mean |TD error|: {td_error}")
+        self._transitions = []
+
     def max_action_q(self, observation:Observation) -> Action:
         state = observation.state
         actions = generate_valid_actions(state)
@@ -141,7 +189,10 @@ class QAgent(BaseAgent):
             num_steps += 1
             start_time = time.time()
             # Get next action. If we are not training, selection is different, so pass it as argument
-            action, state_id = self.select_action(observation, testing)
+            if self.q_function:
+                action, state_id = self.select_action_linear(observation, testing)
+            else:
+                action, state_id = self.select_action(observation, testing)
             if args.store_actions:
                 actions_logger.info(f"\tState:{observation.state}")
                 actions_logger.info(f"\tEnd:{observation.end}")
@@ -152,7 +203,14 @@ class QAgent(BaseAgent):
            
             # Recompute the rewards
             observation = self.recompute_reward(observation)
-            if not testing:
+            if not testing and self.q_function:
+                # Store the transition. The weights are updated in mini-batches
+                next_valid = self._valid_type_mask(generate_valid_actions(observation.state))
+                self._transitions.append((state_id, self.q_function.type_index(action.type), observation.reward,
+                                          self.get_state_id(observation.state), next_valid, observation.end))
+                if len(self._transitions) >= self.batch_size:
+                    self.update_linear_q()
+            elif not testing:
                 # If we are training update the Q-table
                 self.q_values[state_id, action] += self.alpha * (observation.reward + self.gamma * self.max_action_q(observation)) - self.q_values[state_id, action]
 
@@ -173,6 +231,8 @@ class QAgent(BaseAgent):
             actions_logger.info(f"\t Info:{observation.info}")
         # update epsilon value
         if not testing:
+            if self.q_function:
+                self.update_linear_q()
             self.current_epsilon = self.update_epsilon_with_decay(episode_num)
         # Reset the episode
         _ = self.request_game_reset()
@@ -200,6 +260,9 @@ if __name__ == '__main__':
     parser.add_argument("--env_conf", help="Configuration file of the env. Only for logging purposes.", required=False, default='./env/netsecenv_conf.yaml', type=str)
     parser.add_argument("--early_stop_threshold", help="Threshold for win rate for testing. If the value goes over this threshold, the training is stopped. Defaults to 95 (mean 95%% perc)", required=False, default=95, type=float)
     parser.add_argument("--apm", help="Actions per minute", default=10000, type=int, required=False)
+    parser.add_argument("--linear", help="Use the linear approximation of the Q-function instead of the Q-table.", default=False, action='store_true')
+    parser.add_argument("--num_tilings", help="Number of tilings for tile coding of the features. 0 uses the features directly. Only with --linear.", default=0, type=int)
+    parser.add_argument("--batch_size", help="Number of transitions per update of the linear Q-function. Only with --linear.", default=32, type=int)
     args = parser.parse_args()
 
     if not path.exists(args.logdir):
@@ -207,7 +270,8 @@ if __name__ == '__main__':
     logging.basicConfig(filename=path.join(args.logdir, "q_agent.log"), filemode='w', format='%(asctime)s %(name)s %(levelname)s %(message)s', datefmt='%H:%M:%S',level=logging.INFO)
 
     # Create agent
-    agent = QAgent(args.host, args.port, alpha=args.alpha, gamma=args.gamma, epsilon_start=args.epsilon_start, epsilon_end=args.epsilon_end, epsilon_max_episodes=args.epsilon_max_episodes, apm_limit=args.apm)
+    agent = QAgent(args.host, args.port, alpha=args.alpha, gamma=args.gamma, epsilon_start=args.epsilon_start, epsilon_end=args.epsilon_end, epsilon_max_episodes=args.epsilon_max_episodes, apm_limit=args.apm, linear=args.linear, num_tilings=args.num_tilings, batch_size=args.batch_size)
+    model_extension = "npz" if args.linear else "pickle"
 
     # Log for Actions. After agent creation
     actions_logger = logging.getLogger('QAgentActions')
@@ -284,6 +348,7 @@ if __name__ == '__main__':
             mlflow.log_param("Test each", str(args.test_each))
             mlflow.log_param("Test for", str(args.test_for))
             mlflow.log_param("Testing", str(args.testing))
+            mlflow.log_param("Linear Q-function", str(args.linear))
             # Use subprocess.run to get the commit hash
             netsecenv_command = "git rev-parse HEAD"
             netsecenv_git_result = subprocess.run(netsecenv_command, shell=True, capture_output=True, text=True).stdout
@@ -434,7 +499,7 @@ if __name__ == '__main__':
 
                                 # store model. Use episode (training counter) and not test_episode (test counter)
                                 if episode % args.store_models_every == 0 and episode != 0:
-                                    agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}-episodes-{episode}.pickle')
+                                    agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}-episodes-{episode}.{model_extension}')
 
                             text = f'''Tested for {test_episode} episodes after {episode} training episode.
                                 Wins={test_wins},
@@ -494,8 +559,8 @@ if __name__ == '__main__':
         # Store the q-table
         # Just in case...
         if not args.testing:
-            agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}.pickle')
+            agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}.{model_extension}')
     finally:
         # Store the q-table
         if not args.testing:
-            agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}.pickle')
\ No newline at end of file
+            agent.store_q_table(f'q_agent_marl.experiment{args.experiment_id}.{model_extension}')
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from linear_q_function import LinearQFunction, LinearQConfig
+
+ACTION_TYPES = ["ScanNetwork", "FindServices", "ExploitService", "FindData", "ExfiltrateData"]
+
+class TestLinearQFunction(unittest.TestCase):
+    def setUp(self):
+        """Initialize plain and tile-coded approximators"""
+        self.q_function = LinearQFunction(5, ACTION_TYPES, LinearQConfig(alpha=0.5, gamma=0.9))
+        self.tiled_q_function = LinearQFunction(5, ACTION_TYPES, LinearQConfig(alpha=0.5, gamma=0.9, num_tilings=4, num_tiles=8))
+        self.features = np.array([[1, 2, 1, 0, 0], [2, 5, 1, 3, 0], [4, 10, 4, 10, 3]])
+
+    def test_featurize_shapes(self):
+        """Test that single vectors and batches produce consistent representations"""
+        for q_function in (self.q_function, self.tiled_q_function):
+            batch = q_function.featurize(self.features)
+            self.assertEqual(batch.shape, (3, q_function.dim))
+            np.testing.assert_array_equal(q_function.featurize(self.features[1]), batch[1])
+
+    def test_tile_coding_active_tiles(self):
+        """Test that exactly one tile per tiling and feature is active, plus the bias"""
+        phi = self.tiled_q_function.featurize(self.features)
+        np.testing.assert_array_equal(phi.sum(axis=1), np.full(3, 1 + 5 * 4))
+
+    def test_memory_is_constant(self):
+        """Test that the number of weights does not depend on the visited states"""
+        shape = self.q_function.weights.shape
+        for _ in range(10):
+            self.q_function.update_batch(self.features, np.array([0, 1, 2]), np.ones(3), self.features,
+                                         np.ones((3, 5), dtype=bool), np.zeros(3, dtype=bool))
+        self.assertEqual(self.q_function.weights.shape, shape)
+
+    def test_update_moves_towards_terminal_reward(self):
+        """Test that repeated updates on terminal transitions converge to the reward"""
+        for q_function in (self.q_function, self.tiled_q_function):
+            for _ in range(500):
+                q_function.update_batch(self.features[:1], np.array([4]), np.array([10.0]), self.features[:1],
+                                        np.ones((1, 5), dtype=bool), np.array([True]))
+            self.assertAlmostEqual(q_function.value(self.features[0], "ExfiltrateData"), 10.0, places=2)
+            # other action types are not affected
+            self.assertEqual(q_function.value(self.features[0], "ScanNetwork"), 0.0)
+
+    def test_invalid_next_actions_are_ignored(self):
+        """Test that the bootstrap target only uses valid action types"""
+        self.q_function.weights[1, 0] = 100.0
+        next_valid = np.zeros((1, 5), dtype=bool)
+        next_valid[0, 0] = True
+        self.q_function.update_batch(self.features[:1], np.array([0]), np.array([0.0]), self.features[:1],
+                                     next_valid, np.array([False]))
+        self.assertEqual(self.q_function.weights[0, 0], 0.0)
+
+    def test_save_and_load(self):
+        """Test that stored weights are restored"""
+        self.tiled_q_function.weights[:] = np.random.rand(*self.tiled_q_function.weights.shape)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "model.npz")
+            self.tiled_q_function.save(filename)
+            loaded = LinearQFunction(5, ACTION_TYPES, LinearQConfig(num_tilings=4, num_tiles=8))
+            loaded.load(filename)
+            np.testing.assert_array_equal(loaded.weights, self.tiled_q_function.weights)
+            with self.assertRaises(ValueError):
+                self.q_function.load(filename)
+
+    def test_load_checks_tile_coding(self):
+        """Test that weights stored with a different tile coding of the same size are rejected"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "model.npz")
+            self.tiled_q_function.save(filename)
+            for config in (LinearQConfig(num_tilings=8, num_tiles=4), LinearQConfig(num_tilings=4, num_tiles=8, tile_width=1.0)):
+                other = LinearQFunction(5, ACTION_TYPES, config)
+                self.assertEqual(other.weights.shape, self.tiled_q_function.weights.shape)
+                with self.assertRaises(ValueError):
+                    other.load(filename)
+
+if __name__ == '__main__':
+    unittest.main()
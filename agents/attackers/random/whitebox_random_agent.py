@@ -14,8 +14,8 @@ class RandomWhiteboxAttackerAgent(ActionListAgent):
     A random attacker agent that selects actions randomly from the available action space.
     """
 
-    def __init__(self, host, port,role, seed) -> None:
-        super().__init__(host, port, role)
+    def __init__(self, host, port,role, seed, action_cache_dir=None) -> None:
+        super().__init__(host, port, role, action_cache_dir)
     
 
     def play_game(self, observation, num_episodes=1):
@@ -52,12 +52,8 @@ class RandomWhiteboxAttackerAgent(ActionListAgent):
         action_mask = self.get_valid_action_mask(observation.state)
         if not np.any(action_mask):
             raise ValueError("No valid actions available to select.")
-        # Filter the action list to include only valid actions
-        valid_actions = [action for action, valid in zip(self._action_list, action_mask) if valid]
-        if not valid_actions:
-            raise ValueError("No valid actions found after filtering.")
         # Randomly choose one of the valid actions
-        action = choice(valid_actions)
+        action = self.get_action(int(choice(np.flatnonzero(action_mask))))
         return action
 
 if __name__ == '__main__':
@@ -70,6 +66,7 @@ if __name__ == '__main__':
     parser.add_argument("--logdir", help="Folder to store logs", default=path.join(path.dirname(path.abspath(__file__)), "logs"))
     parser.add_argument("--evaluate", help="Evaluate the agent and report, instead of playing the game only once.", default=True)
     parser.add_argument("--mlflow_url", help="URL for mlflow tracking server. If not provided, mlflow will store locally.", default=None)
+    parser.add_argument("--action_cache_dir", help="Folder to cache the parsed action list between runs. If not provided, the list is parsed on every registration.", default=None)
     args = parser.parse_args()
 
     if not path.exists(args.logdir):
@@ -77,7 +74,7 @@ if __name__ == '__main__':
     logging.basicConfig(filename=path.join(args.logdir, "random_agent.log"), filemode='w', format='%(asctime)s %(name)s %(levelname)s %(message)s', datefmt='%H:%M:%S',level=logging.INFO)
 
     # Create agent
-    agent = RandomWhiteboxAttackerAgent(args.host, args.port,"Attacker", seed=42)
+    agent = RandomWhiteboxAttackerAgent(args.host, args.port,"Attacker", seed=42, action_cache_dir=args.action_cache_dir)
 
     if not args.evaluate:
         # Play the normal game
@@ -57,6 +57,311 @@ def state_as_graph(state:GameState) -> tuple:
     # make edges bidirectional
     return node_features, edge_list
 
+
+NODE_TYPES = {
+    "network":0,
+    "known_host":1,
+    "controlled_host":2,
+    "service":3,
+    "datapoint":4
+}
+
+def edges_to_csr(src:np.ndarray, dst:np.ndarray, num_nodes:int) -> tuple:
+    """
+    Converts a list of directed edges given as two index arrays to CSR format.
+    Returns (indptr, indices) as int32 arrays. Neighbours of node i are indices[indptr[i]:indptr[i+1]].
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    order = np.lexsort((dst, src))
+    indices = dst[order].astype(np.int32)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices
+
+def subnet_membership(host_ints:np.ndarray, net_bases:np.ndarray, net_masks:np.ndarray) -> np.ndarray:
+    """
+    Vectorized subnet check over integer addresses.
+    Returns bool matrix [hosts x networks] where [i,j] is True if host i belongs to network j.
+    """
+    return (host_ints[:, None] & net_masks[None, :]) == net_bases[None, :]
+
+def batch_csr_graphs(graphs:list) -> tuple:
+    """
+    Merges several (node_features, indptr, indices) graphs into one block-diagonal graph.
+    Returns (node_features, indptr, indices, graph_index) where graph_index[i] is the
+    position of the graph the node i came from.
+    """
+    if not graphs:
+        return np.zeros([0, len(NODE_TYPES)], dtype=np.int32), np.zeros(1, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    node_counts = np.array([len(features) for features, _, _ in graphs], dtype=np.int64)
+    edge_counts = np.array([len(indices) for _, _, indices in graphs], dtype=np.int64)
+    node_offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+    edge_offsets = np.concatenate([[0], np.cumsum(edge_counts)[:-1]])
+    node_features = np.concatenate([features for features, _, _ in graphs])
+    indices = np.concatenate([indices for _, _, indices in graphs]) + np.repeat(node_offsets, edge_counts)
+    indptr = np.concatenate([[0]] + [indptr[1:] + offset for (_, indptr, _), offset in zip(graphs, edge_offsets)])
+    graph_index = np.repeat(np.arange(len(graphs), dtype=np.int32), node_counts)
+    return node_features, indptr.astype(np.int32), indices.astype(np.int32), graph_index
+
+class AddressCache:
+    """
+    Cache of integer forms of IP addresses and networks, so each of them is parsed only once.
+    Only IPv4 is supported, the integers are used in int64 arrays.
+    """
+    def __init__(self) -> None:
+        self._host_ints = {}
+        self._network_ints = {}
+
+    def host_as_int(self, host:IP) -> int:
+        if host not in self._host_ints:
+            address = ipaddress.ip_address(str(host))
+            if address.version != 4:
+                raise ValueError(f"Only IPv4 addresses are supported, got {host}")
+            self._host_ints[host] = int(address)
+        return self._host_ints[host]
+
+    def network_as_ints(self, net:Network) -> tuple:
+        """Returns (network address, netmask) as integers"""
+        if net not in self._network_ints:
+            network = ipaddress.ip_network(str(net), strict=False)
+            if network.version != 4:
+                raise ValueError(f"Only IPv4 networks are supported, got {net}")
+            self._network_ints[net] = (int(network.network_address), int(network.netmask))
+        return self._network_ints[net]
+
+class CSRGraphBuilder:
+    """
+    Builds the graph representation of GameState in CSR format (indptr, indices) without SciPy.
+    Node order and features are the same as in state_as_graph: networks, hosts, services, data.
+    Every service and datapoint gets its own node connected to its host; hosts are connected
+    to all known networks they belong to. All edges are bidirectional.
+
+    The builder keeps the subnet membership of every host and network it has seen, so when
+    new hosts or networks appear in the state, only their addresses are parsed and only
+    their rows/columns of the membership are computed. The CSR arrays themselves are
+    assembled for every state, as the node order follows the state. Reuse one builder for
+    all steps of an episode and call reset() between episodes.
+    """
+    def __init__(self) -> None:
+        self._addresses = AddressCache()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets the hosts and networks seen so far"""
+        self._host_rows = {}
+        self._net_cols = {}
+        self._host_ints = np.zeros(0, dtype=np.int64)
+        self._net_ints = np.zeros([0, 2], dtype=np.int64)
+        self._membership = np.zeros([0, 0], dtype=bool)
+
+    def _update_membership(self, hosts:list, networks:list) -> None:
+        """Adds the rows of new hosts and the columns of new networks to the membership"""
+        new_hosts = [host for host in hosts if host not in self._host_rows]
+        new_nets = [net for net in networks if net not in self._net_cols]
+        if not new_hosts and not new_nets:
+            return
+        for net in new_nets:
+            self._net_cols[net] = len(self._net_cols)
+        for host in new_hosts:
+            self._host_rows[host] = len(self._host_rows)
+        num_old_hosts, num_old_nets = self._membership.shape
+        new_host_ints = np.fromiter((self._addresses.host_as_int(host) for host in new_hosts), dtype=np.int64, count=len(new_hosts))
+        new_net_ints = np.array([self._addresses.network_as_ints(net) for net in new_nets], dtype=np.int64).reshape(-1, 2)
+        self._host_ints = np.concatenate([self._host_ints, new_host_ints])
+        self._net_ints = np.concatenate([self._net_ints, new_net_ints])
+        membership = np.zeros([len(self._host_ints), len(self._net_ints)], dtype=bool)
+        membership[:num_old_hosts, :num_old_nets] = self._membership
+        # old hosts with the new networks, new hosts with all networks
+        membership[:num_old_hosts, num_old_nets:] = subnet_membership(self._host_ints[:num_old_hosts], new_net_ints[:, 0], new_net_ints[:, 1])
+        membership[num_old_hosts:, :] = subnet_membership(new_host_ints, self._net_ints[:, 0], self._net_ints[:, 1])
+        self._membership = membership
+
+    def build(self, state:GameState) -> tuple:
+        """
+        Returns (node_features, indptr, indices) of the state.
+        node_features is one-hot [num_nodes x len(NODE_TYPES)] int32 array.
+        """
+        networks = list(state.known_networks)
+        hosts = list(state.known_hosts)
+        host_idx = {host:len(networks) + i for i, host in enumerate(hosts)}
+        # (host, item) pairs of services and data, skipping hosts which are not known
+        services = [(host_idx[host], service) for host, service_list in state.known_services.items() if host in host_idx for service in service_list]
+        data = [(host_idx[host], datapoint) for host, data_list in state.known_data.items() if host in host_idx for datapoint in data_list]
+        num_nodes = len(networks) + len(hosts) + len(services) + len(data)
+
+        node_types = np.empty(num_nodes, dtype=np.int64)
+        node_types[:len(networks)] = NODE_TYPES["network"]
+        node_types[len(networks):len(networks) + len(hosts)] = [NODE_TYPES["controlled_host"] if host in state.controlled_hosts else NODE_TYPES["known_host"] for host in hosts]
+        node_types[len(networks) + len(hosts):len(networks) + len(hosts) + len(services)] = NODE_TYPES["service"]
+        node_types[len(networks) + len(hosts) + len(services):] = NODE_TYPES["datapoint"]
+        node_features = np.zeros([num_nodes, len(NODE_TYPES)], dtype=np.int32)
+        node_features[np.arange(num_nodes), node_types] = 1
+
+        # host <-> network edges from the stored membership
+        self._update_membership(hosts, networks)
+        rows = np.array([self._host_rows[host] for host in hosts], dtype=np.int64)
+        cols = np.array([self._net_cols[net] for net in networks], dtype=np.int64)
+        host_pos, net_pos = np.nonzero(self._membership[np.ix_(rows, cols)])
+        host_pos = host_pos + len(networks)
+        # host <-> service and host <-> data edges
+        item_hosts = np.array([h for h, _ in services] + [h for h, _ in data], dtype=np.int64)
+        item_nodes = np.arange(len(networks) + len(hosts), num_nodes, dtype=np.int64)
+
+        src = np.concatenate([net_pos, host_pos, item_hosts, item_nodes])
+        dst = np.concatenate([host_pos, net_pos, item_nodes, item_hosts])
+        indptr, indices = edges_to_csr(src, dst, num_nodes)
+        return node_features, indptr, indices
+
+    def build_batch(self, states:list) -> tuple:
+        """
+        Builds one block-diagonal graph of several states.
+        Returns (node_features, indptr, indices, graph_index), see batch_csr_graphs().
+        """
+        return batch_csr_graphs([self.build(state) for state in states])
+
+class GraphStateTracker:
+    """
+    Incremental graph of the states visited in one episode.
+
+    Every network, host, service and datapoint gets a node id when it is seen for the first
+    time and keeps it until reset() is called (start of a new episode). Each update() only
+    appends the new nodes and edges, the already known part of the graph is not rebuilt.
+    Elements which disappear from the state keep their nodes. The only in-place change is
+    the switch of a host from known to controlled.
+
+    Node features ([num_nodes x len(NODE_TYPES)]) and edges ([2 x num_edges], both directions
+    stored) are exposed as NumPy views of the internal buffers. The views stay valid until
+    the next update(), which may reallocate the buffers when they grow.
+    """
+    def __init__(self, initial_capacity:int=64) -> None:
+        self._initial_capacity = initial_capacity
+        self._addresses = AddressCache()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets all nodes and edges. To be used at the start of each episode."""
+        self._node_ids = {}
+        self._features = np.zeros([self._initial_capacity, len(NODE_TYPES)], dtype=np.int32)
+        self._num_nodes = 0
+        self._edges = np.zeros([2, 2 * self._initial_capacity], dtype=np.int32)
+        self._num_edges = 0
+        # node ids and integer addresses of hosts and networks for the subnet membership
+        self._host_nodes, self._host_ints = [], []
+        self._net_nodes, self._net_ints = [], []
+
+    @property
+    def num_nodes(self) -> int:
+        return self._num_nodes
+
+    @property
+    def num_edges(self) -> int:
+        return self._num_edges
+
+    @property
+    def node_features(self) -> np.ndarray:
+        """View of the one-hot node features [num_nodes x len(NODE_TYPES)]"""
+        return self._features[:self._num_nodes]
+
+    @property
+    def edge_index(self) -> np.ndarray:
+        """View of the edges [2 x num_edges], row 0 are sources and row 1 targets"""
+        return self._edges[:, :self._num_edges]
+
+    def node_id(self, element, host:IP=None) -> int:
+        """
+        Returns the node id of a network or host, or of a service/datapoint of the given host.
+        Returns -1 if the element is not in the graph.
+        """
+        key = (host, element) if host is not None else element
+        return self._node_ids.get(key, -1)
+
+    def as_csr(self) -> tuple:
+        """Returns (node_features, indptr, indices) of the current graph. Unlike the views, these are copies."""
+        indptr, indices = edges_to_csr(self._edges[0, :self._num_edges], self._edges[1, :self._num_edges], self._num_nodes)
+        return self.node_features.copy(), indptr, indices
+
+    def _add_node(self, key, node_type:str) -> int:
+        if self._num_nodes == len(self._features):
+            self._features = np.concatenate([self._features, np.zeros([max(1, len(self._features)), len(NODE_TYPES)], dtype=np.int32)])
+        node_id = self._num_nodes
+        self._node_ids[key] = node_id
+        self._features[node_id, NODE_TYPES[node_type]] = 1
+        self._num_nodes += 1
+        return node_id
+
+    def _add_edges(self, src:np.ndarray, dst:np.ndarray) -> None:
+        """Appends the edges in both directions"""
+        count = 2 * len(src)
+        if count == 0:
+            return
+        required = self._num_edges + count
+        if required > self._edges.shape[1]:
+            capacity = max(1, self._edges.shape[1])
+            while capacity < required:
+                capacity *= 2
+            edges = np.zeros([2, capacity], dtype=np.int32)
+            edges[:, :self._num_edges] = self._edges[:, :self._num_edges]
+            self._edges = edges
+        end = self._num_edges + len(src)
+        self._edges[0, self._num_edges:end] = src
+        self._edges[1, self._num_edges:end] = dst
+        self._edges[0, end:required] = dst
+        self._edges[1, end:required] = src
+        self._num_edges = required
+
+    def update(self, state:GameState) -> tuple:
+        """
+        Adds the elements of the state which are not in the graph yet.
+        Returns the number of new nodes and new edges (counting both directions).
+        """
+        nodes_before, edges_before = self._num_nodes, self._num_edges
+        # networks
+        num_old_nets = len(self._net_nodes)
+        for net in state.known_networks:
+            if net not in self._node_ids:
+                self._net_nodes.append(self._add_node(net, "network"))
+                self._net_ints.append(self._addresses.network_as_ints(net))
+        # hosts
+        num_old_hosts = len(self._host_nodes)
+        for host in state.known_hosts:
+            if host not in self._node_ids:
+                self._host_nodes.append(self._add_node(host, "controlled_host" if host in state.controlled_hosts else "known_host"))
+                self._host_ints.append(self._addresses.host_as_int(host))
+            elif host in state.controlled_hosts:
+                node_id = self._node_ids[host]
+                self._features[node_id, NODE_TYPES["known_host"]] = 0
+                self._features[node_id, NODE_TYPES["controlled_host"]] = 1
+        # host <-> network edges: new hosts with all networks, old hosts with new networks
+        if self._host_nodes and self._net_nodes:
+            host_nodes = np.array(self._host_nodes, dtype=np.int32)
+            net_nodes = np.array(self._net_nodes, dtype=np.int32)
+            host_ints = np.array(self._host_ints, dtype=np.int64)
+            net_ints = np.array(self._net_ints, dtype=np.int64)
+            membership = subnet_membership(host_ints, net_ints[:, 0], net_ints[:, 1])
+            membership[:num_old_hosts, :num_old_nets] = False
+            host_pos, net_pos = np.nonzero(membership)
+            self._add_edges(net_nodes[net_pos], host_nodes[host_pos])
+        # services and data
+        item_hosts, item_nodes = [], []
+        for items, node_type in ((state.known_services, "service"), (state.known_data, "datapoint")):
+            for host, item_list in items.items():
+                if host not in self._node_ids:
+                    continue
+                for item in item_list:
+                    if (host, item) not in self._node_ids:
+                        item_hosts.append(self._node_ids[host])
+                        item_nodes.append(self._add_node((host, item), node_type))
+        self._add_edges(np.array(item_hosts, dtype=np.int32), np.array(item_nodes, dtype=np.int32))
+        return self._num_nodes - nodes_before, self._num_edges - edges_before
+
+def state_as_csr_graph(state:GameState) -> tuple:
+    """
+    CSR variant of state_as_graph. Returns (node_features, indptr, indices).
+    For repeated calls prefer one CSRGraphBuilder which keeps the subnet membership.
+    """
+    return CSRGraphBuilder().build(state)
+
 if __name__ == '__main__':
     state = GameState(known_networks={Network("192.168.1.0", 24),Network("1.1.1.2", 24)},
                 known_hosts={IP("192.168.1.2"), IP("192.168.1.3")}, controlled_hosts={IP("192.168.1.2")},
@@ -65,4 +370,7 @@ if __name__ == '__main__':
                             IP("192.168.1.2"):{Data("McGiver", "data2")}})
     X,A = state_as_graph(state)
     print(X)
-    print(A)
\ No newline at end of file
+    print(A)
+    X, indptr, indices = state_as_csr_graph(state)
+    print(X)
+    print(indptr, indices)
\ No newline at end of file
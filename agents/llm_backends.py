@@ -0,0 +1,166 @@
+"""
+Backends of the LLM agents.
+
+A backend is an object with the part of the OpenAI client interface used by the agents:
+client.chat.completions.create(model=..., messages=..., max_tokens=..., temperature=..., response_format=..., n=...)
+returning the choices with message.content (awaitable for the async clients).
+Besides the OpenAI client (also used for OpenAI compatible servers like Ollama), StubBackend answers
+in-process with scripted or replayed responses after a configurable latency, so the agents can run
+and be benchmarked without any model server.
+"""
+import asyncio
+import gzip
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+BACKENDS = ["openai", "stub"]
+
+
+def messages_key(messages: list) -> str:
+    """Key of a list of messages in the replayed responses"""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_stub_responses(file_path: str) -> dict:
+    """
+    Loads the responses of a StubBackend from a JSON file. It is either a list of responses (answered in order),
+    or a recorded trace, i.e. the episode data of llm_agent_qa.py (episodes with the lists of "prompt"
+    and "response"), JSON Lines records with "prompt" and "response" or an interaction store of the LLM
+    planner (records with the "queries" of the steps, optionally gzip compressed), which are replayed by prompt.
+    Returns the keyword arguments of StubBackend.
+    """
+    lines = []
+    with (gzip.open(file_path, "rt", encoding="utf-8") if file_path.endswith(".gz") else open(file_path, "r")) as f:
+        try:
+            for line in f:
+                lines.append(line)
+        except (EOFError, gzip.BadGzipFile):
+            # a truncated gzip file (e.g. the store of an interrupted run) is read up to the end of its data
+            pass
+    try:
+        data = json.loads("".join(lines))
+        records = data if isinstance(data, list) else [data]
+    except json.JSONDecodeError:
+        records = []
+        for line in lines:
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # the last record of an interrupted run may be incomplete
+                    break
+    if all(isinstance(record, str) for record in records):
+        return {"responses": records}
+    replay = {}
+    for record in records:
+        if "queries" in record:
+            record = {"prompt": [query["prompt"] for query in record["queries"]], "response": [query["response"] for query in record["queries"]]}
+        prompts, responses = record.get("prompt"), record.get("response")
+        if prompts and isinstance(prompts[0], dict):
+            # a single interaction
+            prompts, responses = [prompts], [responses]
+        for prompt, response in zip(prompts or [], responses or []):
+            replay.setdefault(messages_key(prompt), response)
+    return {"replay": replay}
+
+
+class _Completions:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, **request):
+        time.sleep(self._backend.latency)
+        if request.get("stream"):
+            return iter(self._backend.chunks(request))
+        return self._backend.completion(request)
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, **request):
+        await asyncio.sleep(self._backend.latency)
+        if request.get("stream"):
+            return self._stream(self._backend.chunks(request))
+        return self._backend.completion(request)
+
+    @staticmethod
+    async def _stream(chunks: list):
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+
+class StubBackend:
+    """
+    In-process backend answering every request (also streamed, with stream=True) after `latency` seconds with
+    the replayed response of the same messages if there is one, otherwise with
+    the next scripted response (responses are a list, cycled, or a function of the request),
+    otherwise with the default response ("{}" for the JSON response formats).
+    """
+
+    def __init__(self, responses=None, replay: dict = None, latency: float = 0.0, default_response: str = ""):
+        self.latency = latency
+        self.replay = replay or {}
+        self.default_response = default_response
+        self.num_requests = 0
+        self.num_replayed = 0
+        self._responses = responses if callable(responses) else (itertools.cycle(responses) if responses else None)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=self._create_completions())
+
+    def _create_completions(self):
+        return _Completions(self)
+
+    def respond(self, request: dict) -> str:
+        with self._lock:
+            response = self.replay.get(messages_key(request.get("messages", [])))
+            if response is not None:
+                self.num_replayed += 1
+                return response
+            if self._responses is not None and not callable(self._responses):
+                return next(self._responses)
+        if callable(self._responses):
+            return self._responses(request)
+        fmt = request.get("response_format") or {}
+        return "{}" if fmt.get("type", "text") != "text" else self.default_response
+
+    def completion(self, request: dict):
+        with self._lock:
+            self.num_requests += 1
+        choices = [SimpleNamespace(message=SimpleNamespace(content=self.respond(request))) for _ in range(request.get("n", 1))]
+        return SimpleNamespace(choices=choices)
+
+    def chunks(self, request: dict) -> list:
+        """Streamed response (stream=True), one chunk per word"""
+        with self._lock:
+            self.num_requests += 1
+        words = re.findall(r"\s*\S+\s*", self.respond(request))
+        return [SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=word))]) for word in words]
+
+
+class AsyncStubBackend(StubBackend):
+    """StubBackend with the interface of the async client"""
+
+    def _create_completions(self):
+        return _AsyncCompletions(self)
+
+
+def create_client(model: str, api_url: str = None, backend: str = "openai", async_client: bool = False, **stub_options):
+    """
+    Client of the backend. For OpenAI models ("gpt" in the name) the API key is read from .env,
+    other models are served by the OpenAI compatible server at api_url (e.g. Ollama).
+    """
+    if backend == "stub":
+        return AsyncStubBackend(**stub_options) if async_client else StubBackend(**stub_options)
+    if backend != "openai":
+        raise ValueError(f"Unknown LLM backend {backend}, use one of {BACKENDS}")
+    from openai import OpenAI, AsyncOpenAI
+    client_class = AsyncOpenAI if async_client else OpenAI
+    if "gpt" in model:
+        from dotenv import dotenv_values
+        return client_class(api_key=dotenv_values(".env")["OPENAI_API_KEY"])
+    return client_class(base_url=api_url, api_key="ollama")
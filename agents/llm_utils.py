@@ -3,6 +3,11 @@ Collection of functions used by LLM agents.
 
 author: Maria Rigaki - maria.rigaki@aic.fel.cvut.cz
 """
+import ast
+import ipaddress
+import json
+import re
+
 from AIDojoCoordinator.game_components import (
     ActionType,
     Action,
@@ -66,6 +71,198 @@ def create_status_from_state(state: GameState) -> str:
     return prompt
 
 
+def _update_ordered(ordered: dict, items) -> bool:
+    """Removes the missing items and appends the new ones (sorted) to the ordered dict. Returns True if it changed."""
+    items = set(items)
+    removed = [item for item in ordered if item not in items]
+    added = sorted(items.difference(ordered), key=str)
+    for item in removed:
+        del ordered[item]
+    for item in added:
+        ordered[item] = None
+    return bool(removed or added)
+
+
+class IncrementalStatus:
+    """
+    Status prompt of create_status_from_state rendered incrementally from the differences between states.
+
+    The elements keep the order in which they were discovered and only the sections which changed
+    are rendered again, so the status text of consecutive steps differs only where the state changed.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._controlled = {}
+        self._networks = {}
+        self._hosts = {}
+        self._services = {}
+        self._data = {}
+        self._lines = {}
+        # whether the state has no known services/data at all (rendered as "none")
+        self._empty = {}
+
+    def update(self, state: GameState) -> str:
+        """Returns the status prompt of the state"""
+        contr_hosts = {host.ip for host in state.controlled_hosts}
+        if _update_ordered(self._controlled, contr_hosts) or "controlled" not in self._lines:
+            self._lines["controlled"] = f"Controlled hosts are {' and '.join(self._controlled)}\n"
+        if _update_ordered(self._networks, (str(net) for net in state.known_networks)) or "networks" not in self._lines:
+            self._lines["networks"] = f"Known networks are {' and '.join(self._networks)}\n"
+        if _update_ordered(self._hosts, (str(host) for host in state.known_hosts if host.ip not in contr_hosts)) or "hosts" not in self._lines:
+            self._lines["hosts"] = f"Known hosts are {' and '.join(self._hosts)}\n"
+
+        services = {
+            str(ip): [serv.name for serv in ip_services if serv.name not in local_services]
+            for ip, ip_services in state.known_services.items() if len(list(ip_services)) > 0
+        }
+        changed = _update_ordered(self._services, services) or self._empty.get("services") != (len(state.known_services.keys()) == 0)
+        self._empty["services"] = len(state.known_services.keys()) == 0
+        for ip, names in services.items():
+            ordered = self._services[ip] if isinstance(self._services[ip], dict) else {}
+            changed |= _update_ordered(ordered, names) or self._services[ip] is None
+            self._services[ip] = ordered
+        if changed:
+            if self._empty["services"]:
+                self._lines["services"] = "Known services are none\n"
+            else:
+                self._lines["services"] = "".join(
+                    f"Known services for host {ip} are {''.join(name + ' and ' for name in names)}\n" if names else "Known services are none\n"
+                    for ip, names in self._services.items()
+                )
+
+        data = {
+            str(ip): [f"({known_data.owner}, {known_data.id})" for known_data in ip_data]
+            for ip, ip_data in state.known_data.items() if len(ip_data) > 0
+        }
+        changed = _update_ordered(self._data, data) or self._empty.get("data") != (len(state.known_data.keys()) == 0)
+        self._empty["data"] = len(state.known_data.keys()) == 0
+        for ip, items in data.items():
+            ordered = self._data[ip] if isinstance(self._data[ip], dict) else {}
+            changed |= _update_ordered(ordered, items) or self._data[ip] is None
+            self._data[ip] = ordered
+        if changed:
+            if self._empty["data"]:
+                self._lines["data"] = "Known data are none\n"
+            else:
+                self._lines["data"] = "".join(
+                    f"Known data for host {ip} are {''.join(item + ' and ' for item in items)}\n" for ip, items in self._data.items()
+                )
+
+        return "Current status:\n" + "".join(self._lines[section] for section in ("controlled", "networks", "hosts", "services", "data"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of tokens of the text (words, numbers and punctuation marks)."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _join_limited(items: list, max_items: int = None) -> str:
+    if max_items is not None and len(items) > max_items:
+        return " and ".join(items[:max_items]) + f" and {len(items) - max_items} more"
+    return " and ".join(items)
+
+
+def _group_by_items(items_per_host: dict) -> list:
+    """Groups the hosts with the same items: [(hosts, items)] in the order of the first host"""
+    groups = {}
+    for host, items in items_per_host.items():
+        groups.setdefault(tuple(items), []).append(host)
+    return [(hosts, list(items)) for items, hosts in groups.items()]
+
+
+def _compressed_status(state: GameState, max_items: int = None) -> str:
+    """
+    Status prompt with the hosts collapsed per network, only the services which can be exploited
+    (non-local services of hosts which are not controlled) and the hosts with the same services
+    or data listed together. At most max_items elements are listed in every enumeration, and at most
+    max_items lines of hosts per network, services and data.
+    """
+    contr_hosts = sorted(str(host) for host in state.controlled_hosts)
+    networks = sorted(state.known_networks, key=str)
+    prompt = "Current status:\n"
+    prompt += f"Controlled hosts are {_join_limited(contr_hosts, max_items)}\n"
+    prompt += f"Known networks are {_join_limited([str(net) for net in networks], max_items)}\n"
+
+    # hosts without known services (to be scanned) are ranked first
+    hosts = sorted(
+        (host for host in state.known_hosts if str(host) not in contr_hosts),
+        key=lambda host: (len(state.known_services.get(host, ())) > 0, ipaddress.ip_address(str(host))),
+    )
+    parsed_networks = [(str(net), ipaddress.ip_network(str(net), strict=False)) for net in networks]
+    hosts_per_network = {}
+    for host in hosts:
+        address = ipaddress.ip_address(str(host))
+        network = next((name for name, parsed in parsed_networks if address in parsed), "other networks")
+        hosts_per_network.setdefault(network, []).append(str(host))
+    if not hosts_per_network:
+        prompt += "Known hosts are none\n"
+    network_groups = list(hosts_per_network.items())
+    for network, network_hosts in network_groups[:max_items]:
+        prompt += f"Known hosts in {network} are {_join_limited(network_hosts, max_items)}\n"
+    if max_items is not None and len(network_groups) > max_items:
+        prompt += f"Known hosts in {len(network_groups) - max_items} more networks are not listed\n"
+
+    services = {}
+    for host in sorted(state.known_services, key=lambda host: ipaddress.ip_address(str(host))):
+        if str(host) in contr_hosts:
+            continue
+        names = sorted({serv.name for serv in state.known_services[host] if serv.name not in local_services})
+        if names:
+            services[str(host)] = names
+    if not services:
+        prompt += "Known services are none\n"
+    groups = _group_by_items(services)
+    for service_hosts, names in groups[:max_items]:
+        prompt += f"Known services for hosts {_join_limited(service_hosts, max_items)} are {_join_limited(names, max_items)}\n"
+    if max_items is not None and len(groups) > max_items:
+        prompt += f"Known services of {sum(len(hosts) for hosts, _ in groups[max_items:])} more hosts are not listed\n"
+
+    # data on the controlled hosts (which can be exfiltrated) are ranked first, every item is listed once
+    data = {}
+    for host in sorted(state.known_data, key=lambda host: (str(host) not in contr_hosts, ipaddress.ip_address(str(host)))):
+        items = [f"({item.owner}, {item.id})" for item in sorted(state.known_data[host], key=lambda item: (item.owner, item.id))]
+        if items:
+            data[str(host)] = items
+    if not data:
+        prompt += "Known data are none\n"
+    groups = _group_by_items(data)
+    for data_hosts, items in groups[:max_items]:
+        prompt += f"Known data for hosts {_join_limited(data_hosts, max_items)} are {_join_limited(items, max_items)}\n"
+    if max_items is not None and len(groups) > max_items:
+        prompt += f"Known data of {sum(len(hosts) for hosts, _ in groups[max_items:])} more hosts are not listed\n"
+    return prompt
+
+
+def summarize_state(state: GameState, token_budget: int, count_tokens=estimate_tokens) -> tuple:
+    """
+    Status prompt of the state within the token budget, and its number of tokens counted with count_tokens
+    (e.g. the length of the encoding of the model tokenizer). The full status of create_status_from_state
+    is used if it fits, otherwise the compressed one listing fewer and fewer elements. If even one element
+    per enumeration exceeds the budget, the shortest status is returned.
+    """
+    prompt = create_status_from_state(state)
+    num_tokens = count_tokens(prompt)
+    if num_tokens <= token_budget:
+        return prompt, num_tokens
+    for max_items in (None, 32, 16, 8, 4, 2, 1):
+        prompt = _compressed_status(state, max_items)
+        num_tokens = count_tokens(prompt)
+        if num_tokens <= token_budget:
+            break
+    return prompt, num_tokens
+
+
+def parse_parameters(text: str):
+    """Parse parameters given as a string (JSON or a Python literal) without evaluating any code."""
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return ast.literal_eval(text)
+
+
 def validate_action_in_state(llm_response: dict, state: GameState) -> bool:
     """Check the LLM response and validate it against the current state."""
     contr_hosts = [str(host) for host in state.controlled_hosts]
@@ -79,7 +276,7 @@ def validate_action_in_state(llm_response: dict, state: GameState) -> bool:
         action_str = llm_response["action"]
         action_params = llm_response["parameters"]
         if isinstance(action_params, str):
-            action_params = eval(action_params)
+            action_params = parse_parameters(action_params)
         match action_str:
             case "ScanNetwork":
                 if action_params["target_network"] in known_nets:
@@ -179,7 +376,7 @@ def create_action_from_response(llm_response: dict, state: GameState) -> tuple:
                         data_owner = action_params["data"]["owner"]
                         data_id = action_params["data"]["id"]
                     except:
-                        action_data = eval(action_params["data"])
+                        action_data = parse_parameters(action_params["data"])
                         data_owner = action_data["owner"]
                         data_id = action_data["id"]
 
@@ -194,7 +391,7 @@ def create_action_from_response(llm_response: dict, state: GameState) -> tuple:
                 case _:
                     return False, action
 
-    except SyntaxError:
+    except (SyntaxError, ValueError):
         valid = False
 
     return valid, action
@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from AIDojoCoordinator.game_components import Action, ActionType, GameState, IP, Network, Service, Data
+from agents.agent_utils import generate_valid_actions
+from agents.action_list_utils import ActionCatalog, ActionMaskEngine
+
+
+class TestActionCatalog(unittest.TestCase):
+    def setUp(self):
+        """Complete action list of a small topology, as built by the WhiteBoxNSGCoordinator"""
+        self.hosts = [IP(f"192.168.{n}.{i}") for n in range(2) for i in range(1, 6)] + [IP("213.47.23.195")]
+        self.networks = [Network("192.168.0.0", 24), Network("192.168.1.0", 24), Network("213.47.23.192", 26)]
+        self.services = [Service("ssh", "passive", "8.1.0", False), Service("http", "passive", "2.4", False)]
+        self.data = [Data("User1", "DataA"), Data("User1", "DataB")]
+        self.actions = []
+        for src in self.hosts:
+            for network in self.networks:
+                self.actions.append(Action(ActionType.ScanNetwork, {"target_network": network, "source_host": src}))
+            for trg in self.hosts:
+                self.actions.append(Action(ActionType.FindServices, {"target_host": trg, "source_host": src}))
+                self.actions.append(Action(ActionType.FindData, {"target_host": trg, "source_host": src}))
+                for service in self.services:
+                    self.actions.append(Action(ActionType.ExploitService, {"target_host": trg, "target_service": service, "source_host": src}))
+                for datapoint in self.data:
+                    self.actions.append(Action(ActionType.ExfiltrateData, {"target_host": trg, "source_host": src, "data": datapoint}))
+                self.actions.append(Action(ActionType.BlockIP, {"target_host": trg, "source_host": src, "blocked_host": self.hosts[0]}))
+        self.all_actions = json.dumps([action.as_dict() for action in self.actions])
+
+    def random_states(self, count:int):
+        rng = random.Random(1)
+        for i in range(count):
+            known = set(rng.sample(self.hosts, rng.randint(0, len(self.hosts))))
+            controlled = set(rng.sample(sorted(known), rng.randint(0, len(known)))) if known else set()
+            yield GameState(
+                controlled_hosts=controlled,
+                known_hosts=known,
+                known_services={host: set(rng.sample(self.services, rng.randint(1, 2))) for host in known if rng.random() < 0.5},
+                known_data={host: set(rng.sample(self.data, rng.randint(1, 2))) for host in self.hosts if rng.random() < 0.3},
+                known_networks=set(rng.sample(self.networks, rng.randint(0, 3))),
+                known_blocks={host: set(rng.sample(self.hosts, 3)) for host in self.hosts if i % 2 and rng.random() < 0.3},
+            )
+
+    def test_mask_matches_generate_valid_actions(self):
+        """Test that the valid action mask equals the actions of generate_valid_actions on random states"""
+        catalog = ActionCatalog.from_dicts(json.loads(self.all_actions))
+        index = {action: i for i, action in enumerate(self.actions)}
+        for engine in (ActionMaskEngine.from_actions(self.actions), catalog.mask_engine()):
+            for state in self.random_states(200):
+                expected = np.zeros(len(self.actions), dtype=bool)
+                expected[[index[action] for action in generate_valid_actions(state) if action in index]] = True
+                np.testing.assert_array_equal(engine.valid_action_mask(state), expected)
+
+    def test_catalog_actions_and_index(self):
+        """Test that the catalog materializes the actions of the list and finds their indices"""
+        catalog = ActionCatalog.from_dicts(json.loads(self.all_actions))
+        self.assertEqual(len(catalog), len(self.actions))
+        self.assertEqual(catalog.actions(), self.actions)
+        for i, action in enumerate(self.actions):
+            self.assertEqual(catalog.index_of(action), i)
+        unknown = Action(ActionType.ScanNetwork, {"target_network": Network("9.9.9.0", 24), "source_host": self.hosts[0]})
+        self.assertEqual(catalog.index_of(unknown), -1)
+        self.assertEqual(catalog.index_of(Action(ActionType.FindData, {"target_host": self.hosts[0]})), -1)
+
+    def test_actions_outside_the_columns(self):
+        """Test that actions of other types or with other parameters are kept, found and never valid"""
+        extra = [Action(ActionType.QuitGame, {}), Action(ActionType.ResetGame, {"request_trajectory": True})]
+        actions = self.actions[:5] + extra[:1] + self.actions[5:10] + extra[1:]
+        all_actions = json.dumps([action.as_dict() for action in actions])
+        with tempfile.TemporaryDirectory() as tmp:
+            for catalog in (ActionCatalog.load_or_parse(all_actions, tmp), ActionCatalog.load_or_parse(all_actions, tmp)):
+                self.assertEqual(catalog.num_raw_actions, 2)
+                self.assertEqual(catalog.actions(), actions)
+                self.assertEqual([catalog.index_of(action) for action in actions], list(range(len(actions))))
+                self.assertEqual(catalog.index_of(Action(ActionType.JoinGame, {})), -1)
+                for state in self.random_states(5):
+                    mask = catalog.mask_engine().valid_action_mask(state)
+                    self.assertFalse(mask[5] or mask[-1])
+
+    def test_cache_file(self):
+        """Test that the catalog is stored in the cache keyed by the action list and loaded from it"""
+        with tempfile.TemporaryDirectory() as tmp:
+            parsed = ActionCatalog.load_or_parse(self.all_actions, tmp)
+            self.assertEqual(os.listdir(tmp), [f"action_catalog_{ActionCatalog.topology_hash_of(self.all_actions)}.npz"])
+            loaded = ActionCatalog.load_or_parse(self.all_actions, tmp)
+        self.assertEqual(loaded.topology_hash, parsed.topology_hash)
+        np.testing.assert_array_equal(loaded.type_codes, parsed.type_codes)
+        np.testing.assert_array_equal(loaded.params, parsed.params)
+        self.assertEqual(loaded.actions(), self.actions)
+        state = next(self.random_states(1))
+        np.testing.assert_array_equal(loaded.mask_engine().valid_action_mask(state), parsed.mask_engine().valid_action_mask(state))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import numpy as np
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from AIDojoCoordinator.game_components import GameState, IP, Network, Data, Service
+from agents.graph_agent_utils import state_as_graph, state_as_csr_graph, CSRGraphBuilder, GraphStateTracker
+
+
+def make_state(num_hosts:int, num_controlled:int, with_items:bool=True) -> GameState:
+    """State over two networks with services and data unique to their hosts"""
+    hosts = [IP(f"192.168.{i % 2}.{i + 2}") for i in range(num_hosts)]
+    return GameState(
+        known_networks={Network("192.168.0.0", 24), Network("192.168.1.0", 24), Network("10.0.0.0", 24)},
+        known_hosts=set(hosts),
+        controlled_hosts=set(hosts[:num_controlled]),
+        known_services={host: {Service(f"service{i}", "passive", "1.0", False)} for i, host in enumerate(hosts) if with_items and i % 2 == 0},
+        known_data={host: {Data(f"user{i}", "data1"), Data(f"user{i}", "data2")} for i, host in enumerate(hosts[:num_controlled]) if with_items},
+    )
+
+
+def labelled_graph(state:GameState) -> tuple:
+    """Node features and edges of state_as_graph with the nodes labelled by their element"""
+    features, edges = state_as_graph(state)
+    # the node order of state_as_graph: networks, hosts, services, data
+    labels = list(state.known_networks) + list(state.known_hosts)
+    labels += [(host, service) for host, services in state.known_services.items() for service in services]
+    labels += [(host, data) for host, data_list in state.known_data.items() for data in data_list]
+    return {label: tuple(features[i]) for i, label in enumerate(labels)}, {(labels[src], labels[dst]) for src, dst in edges}
+
+
+class TestCSRGraph(unittest.TestCase):
+    def assert_matches_state_as_graph(self, csr_graph:tuple, state:GameState):
+        expected_features, edges = state_as_graph(state)
+        features, indptr, indices = csr_graph
+        np.testing.assert_array_equal(features, expected_features)
+        csr_edges = {(src, int(dst)) for src in range(len(features)) for dst in indices[indptr[src]:indptr[src + 1]]}
+        self.assertEqual(csr_edges, set(edges))
+        self.assertEqual(len(indices), len(edges))
+
+    def test_builder_matches_state_as_graph(self):
+        """Test that the CSR graph has the nodes and edges of state_as_graph"""
+        for state in (make_state(12, 4), make_state(3, 0, False), GameState()):
+            self.assert_matches_state_as_graph(state_as_csr_graph(state), state)
+
+    def test_reused_builder_matches_state_as_graph(self):
+        """Test that one builder gives the graph of every state when hosts and networks appear and disappear"""
+        builder = CSRGraphBuilder()
+        # the hosts are known before their networks
+        states = [GameState(known_networks={Network("192.168.1.0", 24)}, known_hosts=make_state(6, 0).known_hosts)]
+        states += [make_state(2, 1, False), make_state(6, 1), make_state(20, 5), make_state(4, 2)]
+        states.append(GameState(known_networks={Network("172.16.0.0", 16)}, known_hosts={IP("172.16.3.4"), IP("192.168.0.2")}))
+        for state in states:
+            self.assert_matches_state_as_graph(builder.build(state), state)
+        builder.reset()
+        self.assert_matches_state_as_graph(builder.build(states[2]), states[2])
+
+    def test_ipv6_rejected(self):
+        """Test that IPv6 addresses are rejected instead of overflowing the int64 addresses"""
+        state = GameState(known_networks={Network("192.168.0.0", 24)}, known_hosts={IP("2001:db8::1")})
+        with self.assertRaises(ValueError):
+            CSRGraphBuilder().build(state)
+
+
+class TestGraphStateTracker(unittest.TestCase):
+    def assert_same_graph(self, tracker:GraphStateTracker, state:GameState):
+        expected_features, expected_edges = labelled_graph(state)
+        node_ids = {label: tracker.node_id(label[1], label[0]) if isinstance(label, tuple) else tracker.node_id(label) for label in expected_features}
+        self.assertEqual(tracker.num_nodes, len(expected_features))
+        for label, node_id in node_ids.items():
+            self.assertEqual(tuple(tracker.node_features[node_id]), expected_features[label])
+        labels = {node_id: label for label, node_id in node_ids.items()}
+        edges = {(labels[src], labels[dst]) for src, dst in tracker.edge_index.T}
+        self.assertEqual(edges, expected_edges)
+        self.assertEqual(tracker.num_edges, len(expected_edges))
+
+    def test_incremental_updates_match_state_as_graph(self):
+        """Test that a sequence of growing states gives the graph of the last state with stable node ids"""
+        tracker = GraphStateTracker(initial_capacity=2)
+        previous_ids = {}
+        for num_hosts, num_controlled, with_items in ((2, 1, False), (6, 1, True), (6, 3, True), (20, 5, True)):
+            state = make_state(num_hosts, num_controlled, with_items)
+            tracker.update(state)
+            self.assert_same_graph(tracker, state)
+            for host in state.known_hosts:
+                if host in previous_ids:
+                    self.assertEqual(tracker.node_id(host), previous_ids[host])
+                previous_ids[host] = tracker.node_id(host)
+
+    def test_zero_initial_capacity(self):
+        """Test that the buffers grow from zero capacity"""
+        tracker = GraphStateTracker(initial_capacity=0)
+        state = make_state(4, 2)
+        tracker.update(state)
+        self.assert_same_graph(tracker, state)
+        tracker.reset()
+        self.assertEqual(tracker.num_nodes, 0)
+        self.assertEqual(tracker.num_edges, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from agents.llm_backends import StubBackend, create_client, load_stub_responses
+
+class TestStubBackend(unittest.TestCase):
+    def test_scripted_responses(self):
+        """Test that the scripted responses are answered in order and the JSON formats default to {}"""
+        backend = StubBackend(responses=["a", "b"])
+        create = backend.chat.completions.create
+        self.assertEqual([create(messages=[]).choices[0].message.content for _ in range(3)], ["a", "b", "a"])
+        self.assertEqual(StubBackend().chat.completions.create(messages=[], response_format={"type": "json_object"}).choices[0].message.content, "{}")
+        self.assertEqual(len(create(messages=[], n=3).choices), 3)
+        self.assertEqual(backend.num_requests, 4)
+
+    def test_replay_recorded_episodes(self):
+        """Test that the responses of a recorded episode are replayed by prompt with the async client"""
+        prompt = [{"role": "user", "content": "status"}]
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "episode_data.json")
+            with open(filename, "w") as f:
+                json.dump([{"episode": 1, "prompt": [prompt], "response": ["recorded"]}], f)
+            client = create_client("model", backend="stub", async_client=True, default_response="none", **load_stub_responses(filename))
+        response = asyncio.run(client.chat.completions.create(messages=prompt))
+        self.assertEqual(response.choices[0].message.content, "recorded")
+        response = asyncio.run(client.chat.completions.create(messages=[]))
+        self.assertEqual(response.choices[0].message.content, "none")
+        self.assertEqual(client.num_replayed, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import random
+import unittest
+import pytest
+
+pytest.importorskip("AIDojoCoordinator")
+from AIDojoCoordinator.game_components import GameState, IP, Network, Service, Data
+from agents.llm_utils import IncrementalStatus, create_status_from_state, summarize_state, estimate_tokens
+
+
+def status_content(status:str) -> list:
+    """Lines of a status prompt with the listed elements as sets, so the order of the elements is ignored"""
+    content = []
+    for line in status.splitlines():
+        head, sep, items = line.partition(" are ")
+        content.append((head, frozenset(item for item in items.split(" and ") if item)) if sep else (line, None))
+    return sorted(content, key=str)
+
+
+class TestIncrementalStatus(unittest.TestCase):
+    def random_states(self, count:int):
+        """Sequence of random states, mostly growing, with some elements removed from time to time"""
+        rng = random.Random(11)
+        hosts = [IP(f"192.168.{n}.{i}") for n in range(2) for i in range(1, 8)] + [IP("213.47.23.195")]
+        networks = [Network("192.168.0.0", 24), Network("192.168.1.0", 24), Network("213.47.23.192", 26)]
+        services = [Service("ssh", "passive", "8.1.0", False), Service("http", "passive", "2.4", False),
+                    Service("can_attack_start_here", "passive", "1", False)]
+        data = [Data("User1", "DataA"), Data("User2", "DataB"), Data("User3", "DataC")]
+        known_hosts, controlled, known_networks, known_services, known_data = set(), set(), set(), {}, {}
+        for step in range(count):
+            known_hosts.add(rng.choice(hosts))
+            if rng.random() < 0.4:
+                controlled.add(rng.choice(sorted(known_hosts)))
+            if rng.random() < 0.4:
+                known_networks.add(rng.choice(networks))
+            if rng.random() < 0.5:
+                known_services.setdefault(rng.choice(sorted(known_hosts)), set()).add(rng.choice(services))
+            if rng.random() < 0.3:
+                known_data.setdefault(rng.choice(sorted(known_hosts)), set()).add(rng.choice(data))
+            if rng.random() < 0.1:
+                known_services[rng.choice(hosts)] = set()
+            if step % 7 == 6:
+                # elements disappear (e.g. a new episode or blocked hosts)
+                known_hosts = set(rng.sample(sorted(known_hosts), len(known_hosts) // 2))
+                controlled &= known_hosts
+                known_services = {host: items for host, items in known_services.items() if rng.random() < 0.5}
+                known_data = {}
+            yield GameState(
+                controlled_hosts=set(controlled),
+                known_hosts=set(known_hosts),
+                known_services={host: set(items) for host, items in known_services.items()},
+                known_data={host: set(items) for host, items in known_data.items()},
+                known_networks=set(known_networks),
+            )
+
+    def test_matches_create_status_from_state(self):
+        """Test that the incremental status has the content of create_status_from_state on random state sequences"""
+        status = IncrementalStatus()
+        for state in self.random_states(300):
+            self.assertEqual(status_content(status.update(state)), status_content(create_status_from_state(state)))
+
+    def test_order_of_discovery(self):
+        """Test that the statuses of consecutive growing states share their text up to the changed section"""
+        status = IncrementalStatus()
+        hosts = [IP("192.168.1.2"), IP("192.168.1.3"), IP("192.168.1.4")]
+        network = Network("192.168.1.0", 24)
+        first = status.update(GameState(controlled_hosts={hosts[0]}, known_hosts=set(hosts[:2]), known_networks={network}))
+        second = status.update(GameState(controlled_hosts={hosts[0]}, known_hosts=set(hosts), known_networks={network}))
+        hosts_line = "Known hosts are 192.168.1.3\n"
+        self.assertIn(hosts_line, first)
+        self.assertEqual(second[:first.index(hosts_line)], first[:first.index(hosts_line)])
+        self.assertIn("Known hosts are 192.168.1.3 and 192.168.1.4\n", second)
+
+
+class TestSummarizeState(unittest.TestCase):
+    def large_state(self, num_networks:int) -> GameState:
+        """Topology of num_networks networks with 4 hosts each, services on every second host and data on the controlled ones"""
+        networks = [Network(f"10.{i // 256}.{i % 256}.0", 24) for i in range(num_networks)]
+        hosts = [IP(f"10.{i // 256}.{i % 256}.{j}") for i in range(num_networks) for j in range(1, 5)]
+        controlled = hosts[::16]
+        return GameState(
+            controlled_hosts=set(controlled),
+            known_hosts=set(hosts),
+            known_networks=set(networks),
+            known_services={host: {Service(f"service{i % 7}", "passive", "1.0", False)} for i, host in enumerate(hosts) if i % 2},
+            known_data={host: {Data(f"user{i}", "data")} for i, host in enumerate(controlled)},
+        )
+
+    def test_full_status_within_budget(self):
+        """Test that the full status is used when it fits the budget"""
+        state = self.large_state(2)
+        status, num_tokens = summarize_state(state, 10000)
+        self.assertEqual(status, create_status_from_state(state))
+        self.assertEqual(num_tokens, estimate_tokens(status))
+
+    def test_budget_holds_on_large_topology(self):
+        """Test that the status of 200 networks is compressed to the budget"""
+        state = self.large_state(200)
+        for budget in (150, 400, 1000):
+            status, num_tokens = summarize_state(state, budget)
+            self.assertLessEqual(num_tokens, budget)
+            self.assertEqual(num_tokens, estimate_tokens(status))
+        status, _ = summarize_state(state, 150)
+        self.assertIn("more networks are not listed", status)
+
+
+if __name__ == '__main__':
+    unittest.main()
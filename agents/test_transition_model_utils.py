@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+import numpy as np
+from agents.transition_model_utils import TransitionModel, NUM_ACTION_TYPES, PAD, progress_mask
+
+class TestTransitionModel(unittest.TestCase):
+    def setUp(self):
+        """Random episodes in the columnar format of the solution store"""
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(0, 12, 40)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.action_types = rng.integers(0, NUM_ACTION_TYPES, self.offsets[-1])
+        self.results = rng.choice([-1, 0, 1], self.offsets[-1])
+        self.episodes = [(self.action_types[s:e], self.results[s:e]) for s, e in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def test_fit_counts_histories(self):
+        """Test that the counts of every context equal the counts of a per-step pass over the episodes"""
+        order = 2
+        model = TransitionModel(order=order, state_conditioned=True).fit(self.action_types, self.offsets, self.results)
+        expected = Counter()
+        for types, results in self.episodes:
+            history, done = [], []
+            for action_type, result in zip(types, results):
+                expected[(tuple(history[-order:]), progress_mask(done), action_type)] += 1
+                history.append(action_type)
+                if result == 1:
+                    done.append(action_type)
+        for (history, mask, action_type), count in expected.items():
+            key = model.context_key(list(history), mask)
+            padded = [PAD] * (order - len(history)) + list(history)
+            self.assertEqual(key, (order, model._context_code(padded, mask, order)))
+            self.assertEqual(model.counts[order][model._rows[order][key[1]]][action_type], count)
+
+    def test_backoff_to_lower_order(self):
+        """Test that an unseen context falls back to the marginal distribution"""
+        model = TransitionModel(order=1).fit([0, 1, 0, 1], [0, 4])
+        np.testing.assert_allclose(model.probabilities([4]), [0.5, 0.5, 0, 0, 0])
+        np.testing.assert_allclose(model.probabilities([0]), [0, 1, 0, 0, 0])
+
+    def test_from_first_order_and_save_load(self):
+        """Test the model of transition_probabilities.json and its round trip through .npz"""
+        rows = {"Initial Action": {"ScanNetwork": 1.0}, "ScanNetwork": {"FindServices": 0.5, "ExploitService": 0.5}}
+        model = TransitionModel.from_first_order(rows)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "model.npz")
+            model.save(filename)
+            loaded = TransitionModel.load(filename)
+        np.testing.assert_allclose(loaded.probabilities([]), [1, 0, 0, 0, 0])
+        np.testing.assert_allclose(loaded.probabilities([0]), [0, 0.5, 0.5, 0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
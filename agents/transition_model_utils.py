@@ -0,0 +1,161 @@
+"""
+Transition models of action types intended for agents using action type priors
+(MarkovChainAgent, InitializedQAgent).
+
+The probability of the next action type is conditioned on the last `order` action types and,
+optionally, on a coarse state feature: the set of action types which already changed the state
+in the episode (progress mask). The counts are fitted in one pass over recorded episodes and stored
+sparsely (only the observed contexts), so higher orders stay small.
+"""
+import numpy as np
+
+# Order of the action types in the transition models
+ACTION_TYPE_NAMES = ["ScanNetwork", "FindServices", "ExploitService", "FindData", "ExfiltrateData"]
+NUM_ACTION_TYPES = len(ACTION_TYPE_NAMES)
+# code of the missing history before the start of the episode
+PAD = NUM_ACTION_TYPES
+# result of an action which changed the state
+GOOD_RESULT = 1
+
+
+def action_type_code(action_type) -> int:
+    """Code of an ActionType (or of its name, e.g. 'ActionType.ScanNetwork')"""
+    return ACTION_TYPE_NAMES.index(str(action_type).split(".")[-1])
+
+
+def progress_mask(action_type_codes) -> int:
+    """Progress mask of the action types (codes) which changed the state"""
+    mask = 0
+    for code in action_type_codes:
+        mask |= 1 << int(code)
+    return mask
+
+
+class TransitionModel:
+    """
+    k-th order (optionally state-conditioned) model of the next action type.
+
+    For each order o = 0..order the observed contexts are kept as a sorted array of context codes
+    with a [num_contexts, NUM_ACTION_TYPES] count matrix. A query backs off from the highest order
+    to the lower ones until a context with counts is found, i.e. at most order + 1 dictionary lookups.
+    """
+
+    def __init__(self, order:int=1, state_conditioned:bool=False, smoothing:float=0.0) -> None:
+        if order < 0:
+            raise ValueError("The order of the model has to be non-negative")
+        self.order = order
+        self.state_conditioned = state_conditioned
+        self.smoothing = smoothing
+        self.contexts = [np.zeros(0, dtype=np.int64) for _ in range(order + 1)]
+        self.counts = [np.zeros([0, NUM_ACTION_TYPES], dtype=np.float64) for _ in range(order + 1)]
+        self._rows = [{} for _ in range(order + 1)]
+
+    def _context_code(self, history, mask:int, context_order:int) -> int:
+        code = mask if self.state_conditioned else 0
+        for lag in range(1, context_order + 1):
+            previous = history[-lag] if lag <= len(history) else PAD
+            code = code * (NUM_ACTION_TYPES + 1) + (previous if 0 <= previous < NUM_ACTION_TYPES else PAD)
+        return code
+
+    def fit(self, action_types:np.ndarray, offsets:np.ndarray, results:np.ndarray=None) -> "TransitionModel":
+        """
+        Counts the transitions of the episodes given by the flat array of action type codes
+        and the offsets of the episodes (see SolutionColumns). Results are needed for the state-conditioned model.
+        """
+        action_types = np.asarray(action_types, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        episode = np.repeat(np.arange(len(lengths)), lengths)
+        position = np.arange(len(action_types)) - offsets[:-1][episode]
+
+        code = np.zeros(len(action_types), dtype=np.int64)
+        if self.state_conditioned:
+            if results is None:
+                raise ValueError("Results are needed to fit a state-conditioned model")
+            good = np.asarray(results) == GOOD_RESULT
+            for type_code in range(NUM_ACTION_TYPES):
+                # number of good actions of the type before the position within the episode
+                done = np.cumsum(good & (action_types == type_code))
+                done_before = done - (good & (action_types == type_code)) - np.concatenate([[0], done])[offsets[:-1]][episode]
+                code |= (done_before > 0).astype(np.int64) << type_code
+
+        valid = (action_types >= 0) & (action_types < NUM_ACTION_TYPES)
+        for context_order in range(self.order + 1):
+            if context_order > 0:
+                lag = context_order
+                previous = np.full(len(action_types), PAD, dtype=np.int64)
+                has_previous = position >= lag
+                previous[has_previous] = action_types[np.flatnonzero(has_previous) - lag]
+                previous[(previous < 0) | (previous > PAD)] = PAD
+                code = code * (NUM_ACTION_TYPES + 1) + previous
+            keys, key_counts = np.unique(code[valid] * NUM_ACTION_TYPES + action_types[valid], return_counts=True)
+            contexts, row = np.unique(keys // NUM_ACTION_TYPES, return_inverse=True)
+            counts = np.zeros([len(contexts), NUM_ACTION_TYPES], dtype=np.float64)
+            np.add.at(counts, (row, keys % NUM_ACTION_TYPES), key_counts)
+            self.contexts[context_order], self.counts[context_order] = contexts, counts
+        self._index()
+        return self
+
+    @classmethod
+    def from_first_order(cls, transition_probabilities:dict) -> "TransitionModel":
+        """
+        First-order model from the rows of transition_probabilities.json, given as
+        {'Initial Action' or action type name: {action type name: probability}}.
+        """
+        model = cls(order=1)
+        contexts, counts = [], []
+        for action, row in transition_probabilities.items():
+            previous = PAD if action in ("Initial Action", "Initial") else action_type_code(action)
+            contexts.append(previous)
+            counts.append([float(row.get(name, 0)) for name in ACTION_TYPE_NAMES])
+        order_idx = np.argsort(contexts)
+        model.contexts[1] = np.array(contexts, dtype=np.int64)[order_idx]
+        model.counts[1] = np.array(counts, dtype=np.float64).reshape(-1, NUM_ACTION_TYPES)[order_idx]
+        model.contexts[0] = np.zeros(1, dtype=np.int64)
+        model.counts[0] = model.counts[1].sum(axis=0, keepdims=True)
+        model._index()
+        return model
+
+    def _index(self) -> None:
+        self._rows = [{int(context): row for row, context in enumerate(contexts)} for contexts in self.contexts]
+
+    def context_key(self, history, mask:int=0) -> tuple:
+        """
+        (order, context code) of the longest context of the history (action type codes, most recent last)
+        which has counts, or None if the model is empty.
+        """
+        for context_order in range(self.order, -1, -1):
+            code = self._context_code(history, mask, context_order)
+            row = self._rows[context_order].get(code)
+            if row is not None and self.counts[context_order][row].sum() + self.smoothing > 0:
+                return context_order, code
+        return None
+
+    def row_probabilities(self, key:tuple) -> np.ndarray:
+        """Probabilities of the next action type in the context given by context_key"""
+        if key is None:
+            return np.full(NUM_ACTION_TYPES, 1.0 / NUM_ACTION_TYPES)
+        context_order, code = key
+        counts = self.counts[context_order][self._rows[context_order][code]] + self.smoothing
+        return counts / counts.sum()
+
+    def probabilities(self, history, mask:int=0) -> np.ndarray:
+        """Probabilities of the next action type (in the order of ACTION_TYPE_NAMES)"""
+        return self.row_probabilities(self.context_key(history, mask))
+
+    def save(self, filename:str) -> None:
+        arrays = {"order": self.order, "state_conditioned": self.state_conditioned, "smoothing": self.smoothing}
+        for context_order in range(self.order + 1):
+            arrays[f"contexts_{context_order}"] = self.contexts[context_order]
+            arrays[f"counts_{context_order}"] = self.counts[context_order]
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename:str) -> "TransitionModel":
+        with np.load(filename) as data:
+            model = cls(int(data["order"]), bool(data["state_conditioned"]), float(data["smoothing"]))
+            for context_order in range(model.order + 1):
+                model.contexts[context_order] = data[f"contexts_{context_order}"]
+                model.counts[context_order] = data[f"counts_{context_order}"]
+        model._index()
+        return model